@@ -1,6 +1,9 @@
+from codegen import peephole
+from codegen.peephole import INSTRUCTION, LABEL, FUNCTION, SOURCE_LINE, RAW
 from models import types
 from models.instructions import InstructionType, instructions_by_type, instructions_by_op_code
 import utils.bytes_utils as codec
+from utils import sizes
 
 op_code_size_in_bytes = 1
 label_placeholder = codec.select_to_bytes_func(types.Int)(0)
@@ -9,19 +12,89 @@ label_placeholder = codec.select_to_bytes_func(types.Int)(0)
 class Label:
 
     def __init__(self) -> None:
-        self.offsets = []
-        self.value = None
-
-    def add_offset(self, offset):
-        self.offsets.append(offset)
+        # offset in the code, it is known once the code is assembled
+        self.offset = None
+
+
+class Superinstruction:
+    """
+    Replaces a sequence of instructions with a single instruction. make_operands gets operands of every
+    instruction in the sequence and returns operands of the fused instruction, or None if it does not apply
+    """
+
+    def __init__(self, sequence, fused_type, make_operands) -> None:
+        self.sequence = sequence
+        self.fused_type = fused_type
+        self.make_operands = make_operands
+
+    def replacement(self, *operands):
+        fused_operands = self.make_operands(*operands)
+        if fused_operands is None:
+            return None
+        return [(self.fused_type, fused_operands)]
+
+
+IT = InstructionType
+
+# Sequences were picked by running `python -m vm.ngrams` over example programs.
+# Longer sequences go first, fused instructions can be part of the sequence of another superinstruction
+superinstructions = [
+    Superinstruction((IT.GET_LOCAL, IT.PUSH_INT, IT.JGE_INT), IT.JZ_LOCAL_LT_INT,
+                     lambda get, push, jge: [get[0], push[0], jge[0]] if get[1] == sizes.int else None),
+    Superinstruction((IT.POP_PUSH_N, IT.SET_LOCAL), IT.SET_LOCAL_PUSH,
+                     lambda dup, set_: set_ if dup[0] == set_[1] and dup[1] == 2 else None),
+    # assignment used as a statement does not need to keep its value on the stack
+    Superinstruction((IT.SET_LOCAL_PUSH, IT.POP), IT.SET_LOCAL,
+                     lambda set_, pop: set_ if pop[0] == set_[1] else None),
+    Superinstruction((IT.POP_PUSH_N, IT.SET_GLOBAL, IT.POP), IT.SET_GLOBAL,
+                     lambda dup, set_, pop: set_ if dup[0] == pop[0] == set_[1] and dup[1] == 2 else None),
+    Superinstruction((IT.PUSH_INT, IT.MUL_INT, IT.ADD_INT), IT.ADD_SCALED_INT,
+                     lambda push, mul, add: [push[0]]),
+    Superinstruction((IT.PUSH_INT, IT.ADD_INT), IT.ADD_INT_CONST,
+                     lambda push, add: [push[0]]),
+    Superinstruction((IT.ADD_SCALED_INT, IT.MEMORY_GET), IT.MEMORY_GET_INDEX,
+                     lambda add, get: [add[0], get[0]]),
+    Superinstruction((IT.ADD_INT_CONST, IT.MEMORY_GET), IT.MEMORY_GET_FIELD,
+                     lambda add, get: [add[0], get[0]]),
+]
+
+
+instruction_header = '{:s} | {:s} | {:>25s} |  {:s}'.format('Offset', 'Op code', 'Instruction', 'Operands')
+
+
+def format_instruction(code, offset):
+    """
+    Returns printable line of the instruction at offset and offset of the next instruction.
+    Line is None when static strings start at offset
+    """
+    start_offset = offset
+    op_code, offset = codec.op_code_from_bytes(code, offset)
+
+    instr = instructions_by_op_code.get(op_code)
+    if instr is None:
+        raise TypeError(f'There is no instruction with op_code: {op_code}')
+
+    if instr.type == InstructionType.MARKER_STATIC_START:
+        return None, offset
+
+    (ops, offset) = instr.fetch_ops(code, offset)
+    ops = list(map(lambda x: str(x), ops))
+    return '{:6d}      0x{:x} {:>27s}    {:3s}'.format(start_offset, op_code, instr.type, ', '.join(ops)), offset
 
 
 class CodeWriter:
+    """
+    Collects instructions, labels and markers as entries, the code is assembled from them once it is read,
+    so the peephole optimizer and superinstructions can rewrite instructions before labels get their offsets
+    """
 
-    def __init__(self) -> None:
-        self.code = []
+    def __init__(self, superinstructions=True, peephole=True) -> None:
+        self.entries = []
         self.loops_stack = []
         self.static_strings = []
+        self.superinstructions = superinstructions
+        self.peephole = peephole
+        self.assembled = None
 
     def start_loop(self, start_label, end_label):
         self.loops_stack.append((start_label, end_label))
@@ -32,11 +105,20 @@ class CodeWriter:
     def current_loop(self):
         return self.loops_stack[-1]
 
+    def add_entry(self, entry):
+        self.entries.append(entry)
+        self.assembled = None
+
     def place_label(self, label, offset=0):
-        label.value = codec.select_to_bytes_func(types.Int)(len(self.code) + offset)
-        for offset in label.offsets:
-            for i, byte_val in enumerate(label.value):
-                self.code[offset + i] = byte_val
+        self.add_entry((LABEL, label, offset))
+
+    def place_function_label(self, label, name):
+        self.place_label(label)
+        self.add_entry((FUNCTION, name))
+
+    def mark_source_line(self, token):
+        if token is not None:
+            self.add_entry((SOURCE_LINE, (token.file_name, token.line_number)))
 
     def write(self, instr_type: InstructionType, *operands):
         instruction = instructions_by_type.get(instr_type)
@@ -48,39 +130,80 @@ class CodeWriter:
             raise TypeError(f'Invalid instruction {instruction.type} operand count. '
                             f'Expected: {len(instruction.ops_types)}, got: {len(operands)}')
 
-        self.code.extend(codec.op_code_to_bytes(instruction.op_code))
-        for i, op_type in enumerate(instruction.ops_types):
-            operand = operands[i]
-            if isinstance(operand, Label):
-                if operand.value is None:
-                    operand.add_offset(len(self.code))
-                    self.code.extend(label_placeholder)
-                else:
-                    self.code.extend(operand.value)
-            else:
-                self.code.extend(codec.select_to_bytes_func(op_type)(operand))
+        self.add_entry((INSTRUCTION, instr_type, operands))
 
     def write_raw(self, item, type_):
-        self.code.extend(codec.select_to_bytes_func(type_)(item))
+        self.add_entry((RAW, codec.select_to_bytes_func(type_)(item)))
+
+    @property
+    def code(self):
+        return self.assemble()[0]
+
+    @property
+    def function_names(self):
+        """
+        Code offset of every function start and its name
+        """
+        return self.assemble()[1]
+
+    @property
+    def source_lines(self):
+        """
+        Code offset where code of a source line starts and its (file name, line number)
+        """
+        return self.assemble()[2]
+
+    def assemble(self):
+        if self.assembled is not None:
+            return self.assembled
+
+        entries = self.entries
+        if self.peephole:
+            entries = peephole.optimize(entries)
+        if self.superinstructions:
+            entries = peephole.rewrite(entries, superinstructions)
+
+        code = []
+        function_names = {}
+        source_lines = {}
+        # code offsets of label operands, they are patched once all labels are placed
+        label_operands = []
+        for entry in entries:
+            kind = entry[0]
+            if kind == INSTRUCTION:
+                instruction = instructions_by_type[entry[1]]
+                code.extend(codec.op_code_to_bytes(instruction.op_code))
+                for op_type, operand in zip(instruction.ops_types, entry[2]):
+                    if isinstance(operand, Label):
+                        label_operands.append((len(code), operand))
+                        code.extend(label_placeholder)
+                    else:
+                        code.extend(codec.select_to_bytes_func(op_type)(operand))
+            elif kind == LABEL:
+                entry[1].offset = len(code) + entry[2]
+            elif kind == FUNCTION:
+                function_names[len(code)] = entry[1]
+            elif kind == SOURCE_LINE:
+                source_lines[len(code)] = entry[1]
+            else:
+                code.extend(entry[1])
+
+        for offset, label in label_operands:
+            code[offset:offset + sizes.int] = codec.int_to_bytes(label.offset)
+
+        self.assembled = (code, function_names, source_lines)
+        return self.assembled
 
     def print_instructions(self, output):
-        output.out('{:s} | {:s} | {:>25s} |  {:s}'.format('Offset', 'Op code', 'Instruction', 'Operands'))
+        output.out(instruction_header)
         offset = 0
         while offset < len(self.code):
-            start_offset = offset
-            op_code, offset = codec.op_code_from_bytes(self.code, offset)
-
-            instr = instructions_by_op_code.get(op_code)
-            if instr is None:
-                raise TypeError(f'There is no instruction with op_code: {op_code}')
-
-            if instr.type == InstructionType.MARKER_STATIC_START:
+            line, offset = format_instruction(self.code, offset)
+            if line is None:
                 self.print_static_strings(output, offset)
                 break
 
-            (ops, offset) = instr.fetch_ops(self.code, offset)
-            ops = list(map(lambda x: str(x), ops))
-            output.out('{:6d}      0x{:x} {:>27s}    {:3s}'.format(start_offset, op_code, instr.type, ', '.join(ops)))
+            output.out(line)
 
     def print_static_strings(self, output, offset):
         padding = '*' * 20
@@ -0,0 +1,50 @@
+from codegen.code_writer import CodeWriter
+from codegen.string_storage import string_storage
+from lexer.lexer import Lexer
+from models.ast_nodes import global_slot_dispenser
+from models.errors import error_counter
+from models.scope import Scope
+from parse.parser import Parser
+from utils import printer
+
+# compile options of every -O level, 0 writes code as the AST describes it
+optimization_levels = {
+    0: dict(fold_constants=False, eliminate_dead_code=False, superinstructions=False, peephole=False),
+    1: dict(fold_constants=True, eliminate_dead_code=True, superinstructions=True, peephole=False),
+    2: dict(fold_constants=True, eliminate_dead_code=True, superinstructions=True, peephole=True),
+}
+default_optimization_level = 2
+
+
+def compile_source(source, file_name, fold_constants=True, eliminate_dead_code=True, **code_writer_options):
+    string_storage.clear()
+    global_slot_dispenser.reset()
+
+    lexer = Lexer(source, file_name)
+    lexer.lex_all()
+
+    parser = Parser(lexer.tokens)
+    ast_root = parser.parse()
+
+    ast_root.resolve_includes()
+
+    error_counter.reset()
+    ast_root.resolve_names(Scope(None))
+    ast_root.resolve_types()
+    ast_root.check_for_entry_point()
+
+    is_parsing_successful = error_counter.counter == 0
+    if not is_parsing_successful:
+        printer.error('', f'{error_counter.counter} errors found', header_len=80)
+        return None
+    else:
+        printer.success('', f'Compilation successful', header_len=80)
+
+    if fold_constants:
+        ast_root.fold_constants()
+    if eliminate_dead_code:
+        ast_root.eliminate_dead_code()
+
+    code_writer = CodeWriter(**code_writer_options)
+    ast_root.write_code(code_writer)
+    return code_writer
@@ -0,0 +1,174 @@
+from models.instructions import InstructionType, instructions_by_type
+
+# kinds of entries in the instruction list of the CodeWriter, entries are tuples starting with the kind:
+# (INSTRUCTION, type, operands), (LABEL, label, offset), (FUNCTION, name), (SOURCE_LINE, (file name, line))
+# and (RAW, bytes) of static data
+INSTRUCTION = 'instruction'
+LABEL = 'label'
+FUNCTION = 'function'
+SOURCE_LINE = 'source line'
+RAW = 'raw'
+
+IT = InstructionType
+
+# instructions which jump inside of a function, their targets can be threaded
+jump_types = {IT.JMP, IT.JZ, IT.JNZ, IT.JLT_INT, IT.JLE_INT, IT.JGT_INT, IT.JGE_INT, IT.JEQ, IT.JNE,
+              IT.JZ_LOCAL_LT_INT}
+
+
+class Rewrite:
+    """
+    Replaces a sequence of instructions with the (type, operands) list returned by make_replacement.
+    make_replacement gets operands of every instruction in the sequence, None means the rewrite does not apply
+    """
+
+    def __init__(self, sequence, make_replacement) -> None:
+        self.sequence = sequence
+        self.make_replacement = make_replacement
+
+    def replacement(self, *operands):
+        return self.make_replacement(*operands)
+
+
+def store_and_load(dup, set_, pop, get):
+    # the value stays on the stack instead of being popped and read back from the variable
+    if set_ == get and dup == (set_[1], 2) and pop == (set_[1],):
+        return [(IT.POP_PUSH_N, dup), (IT.SET_LOCAL, set_)]
+    return None
+
+
+rewrites = [
+    Rewrite((IT.PUSH_INT, IT.ADD_INT), lambda push, add: [] if push == (0,) else None),
+    Rewrite((IT.PUSH_INT, IT.SUB_INT), lambda push, sub: [] if push == (0,) else None),
+    Rewrite((IT.PUSH_INT, IT.MUL_INT), lambda push, mul: [] if push == (1,) else None),
+    Rewrite((IT.PUSH_INT, IT.DIV_INT), lambda push, div: [] if push == (1,) else None),
+    Rewrite((IT.UNARY_PLUS_INT,), lambda plus: []),
+    Rewrite((IT.UNARY_PLUS_FLOAT,), lambda plus: []),
+    Rewrite((IT.SET_LOCAL, IT.GET_LOCAL),
+            lambda set_, get: [(IT.SET_LOCAL_PUSH, set_)] if set_ == get else None),
+    Rewrite((IT.POP_PUSH_N, IT.SET_LOCAL, IT.POP, IT.GET_LOCAL), store_and_load),
+]
+
+
+def rewrite(entries, rules):
+    """
+    Applies rules to sequences of instructions between labels, replacements are rewritten again,
+    so they can be a part of another sequence
+    """
+    rules_by_last_type = {}
+    for rule in rules:
+        rules_by_last_type.setdefault(rule.sequence[-1], []).append(rule)
+
+    result = []
+    # indices in result of instructions since the last label, only those can be rewritten
+    # as nothing jumps between them
+    written = []
+
+    def write(type_, operands):
+        for rule in rules_by_last_type.get(type_, []):
+            prefix_len = len(rule.sequence) - 1
+            if prefix_len > len(written):
+                continue
+
+            prefix = written[len(written) - prefix_len:]
+            if tuple(result[i][1] for i in prefix) != rule.sequence[:-1]:
+                continue
+
+            replacement = rule.replacement(*[result[i][2] for i in prefix], operands)
+            if replacement is None:
+                continue
+
+            if prefix:
+                # source lines marked between the replaced instructions are kept
+                markers = [entry for entry in result[prefix[0]:] if entry[0] != INSTRUCTION]
+                del result[prefix[0]:]
+                del written[len(written) - prefix_len:]
+                result.extend(markers)
+            for replacement_type, replacement_operands in replacement:
+                write(replacement_type, tuple(replacement_operands))
+            return
+
+        written.append(len(result))
+        result.append((INSTRUCTION, type_, operands))
+
+    for entry in entries:
+        if entry[0] == INSTRUCTION:
+            write(entry[1], entry[2])
+            continue
+
+        if entry[0] != SOURCE_LINE:
+            written.clear()
+        result.append(entry)
+    return result
+
+
+def thread_jumps(entries):
+    """
+    Jumps which land on an unconditional jump go straight to its target
+    """
+    first_instructions = {}
+    labels = []
+    for entry in entries:
+        if entry[0] == LABEL:
+            labels.append(entry[1])
+        elif entry[0] == INSTRUCTION:
+            for label in labels:
+                first_instructions[label] = entry
+            labels = []
+        elif entry[0] == RAW:
+            labels = []
+
+    def final_target(label):
+        visited = set()
+        while label not in visited:
+            visited.add(label)
+            entry = first_instructions.get(label)
+            if entry is None or entry[1] != IT.JMP:
+                break
+            label = entry[2][0]
+        return label
+
+    threaded = []
+    for entry in entries:
+        if entry[0] == INSTRUCTION and entry[1] in jump_types:
+            address_op = instructions_by_type[entry[1]].address_op
+            operands = list(entry[2])
+            operands[address_op] = final_target(operands[address_op])
+            entry = (INSTRUCTION, entry[1], tuple(operands))
+        threaded.append(entry)
+    return threaded
+
+
+def remove_jumps_to_next(entries):
+    """
+    Removes unconditional jumps to the instruction right after them
+    """
+    result = []
+    for i, entry in enumerate(entries):
+        if entry[0] == INSTRUCTION and entry[1] == IT.JMP:
+            j = i + 1
+            while j < len(entries) and entries[j][0] in (LABEL, SOURCE_LINE):
+                if entries[j][0] == LABEL and entries[j][1] is entry[2][0]:
+                    break
+                j += 1
+            if j < len(entries) and entries[j][0] == LABEL:
+                continue
+        result.append(entry)
+    return result
+
+
+def remove_unused_labels(entries):
+    """
+    Labels nothing jumps to do not split the code, instructions around them can be rewritten together
+    """
+    labels = {entry[1] for entry in entries if entry[0] == LABEL}
+    used = {op for entry in entries if entry[0] == INSTRUCTION for op in entry[2] if op in labels}
+    return [entry for entry in entries if entry[0] != LABEL or entry[1] in used]
+
+
+def optimize(entries):
+    while True:
+        optimized = remove_unused_labels(remove_jumps_to_next(thread_jumps(rewrite(entries, rewrites))))
+        if optimized == entries:
+            return optimized
+        entries = optimized
@@ -21,6 +21,9 @@ class StringStorage:
         self.entries.append(entry)
         return entry.label
 
+    def remove_unused(self, used_labels):
+        self.entries = [entry for entry in self.entries if entry.label in used_labels]
+
     def place_labels(self, code_writer: CodeWriter):
         if len(self.entries) == 0:
             return
@@ -1,41 +1,25 @@
-from sys import argv
+import json
+from argparse import ArgumentParser
 
-from codegen.code_writer import CodeWriter
-from lexer.lexer import Lexer
-from models.errors import error_counter
-from models.scope import Scope
-from parse.parser import Parser
-from utils import printer
+from codegen.compilation import compile_source, optimization_levels, default_optimization_level
+from utils.ast_printer import FileOutput, ConsoleOutput
+from vm.profiler import OpProfiler, FunctionProfiler, SamplingProfiler
+from vm.replay import InputRecorder, InputReplayer, read_events, write_events
+from vm.clock import clocks
+from vm.heap import allocators
+from vm.terminal import HeadlessTerminal, read_input_script
+from vm.vm import VM, default_stack_size, default_heap_size
 
-from utils.ast_printer import FileOutput
-from vm.vm import VM
 
-
-def compile_file(file_to_compile):
+def compile_file(file_to_compile, optimization_level=default_optimization_level, profile_ops=False,
+                 profile_functions=False, sample_ms=None, flamegraph=None, heap_stats=False, heap_stats_json=None,
+                 headless=False, input_script=None, record=None, replay=None, **vm_options):
     with open(file_to_compile) as f:
         try:
-            lexer = Lexer(''.join(f.readlines()), file_to_compile)
-            lexer.lex_all()
-
-            parser = Parser(lexer.tokens)
-            ast_root = parser.parse()
-
-            ast_root.resolve_includes()
-
-            error_counter.reset()
-            ast_root.resolve_names(Scope(None))
-            ast_root.resolve_types()
-            ast_root.check_for_entry_point()
-
-            is_parsing_successful = error_counter.counter == 0
-            if not is_parsing_successful:
-                printer.error('', f'{error_counter.counter} errors found', header_len=80)
+            code_writer = compile_source(''.join(f.readlines()), file_to_compile,
+                                         **optimization_levels[optimization_level])
+            if code_writer is None:
                 return
-            else:
-                printer.success('', f'Compilation successful', header_len=80)
-
-            code_writer = CodeWriter()
-            ast_root.write_code(code_writer)
 
             with FileOutput('instructions.f12b') as output:
                 code_writer.print_instructions(output)
@@ -43,17 +27,142 @@ def compile_file(file_to_compile):
             with FileOutput('output.f12b') as output:
                 code_writer.dump_code(output)
 
-            del ast_root
-            vm = VM(code_writer.code)
-            vm.exec()
+            terminal = None
+            if headless or input_script or replay:
+                terminal = HeadlessTerminal(read_input_script(input_script) if input_script else ())
+
+            vm = VM(code_writer.code, terminal=terminal, **vm_options)
+            profiler = None
+            if profile_ops:
+                profiler = OpProfiler()
+            elif sample_ms:
+                profiler = SamplingProfiler(code_writer.function_names, code_writer.source_lines, sample_ms / 1000)
+            elif profile_functions or flamegraph:
+                profiler = FunctionProfiler(code_writer.function_names)
+            elif record:
+                profiler = InputRecorder()
+            elif replay:
+                profiler = InputReplayer(read_events(replay))
+
+            try:
+                vm.exec(profiler)
+            finally:
+                if terminal is not None:
+                    print_screen(terminal, ConsoleOutput())
+
+                if profile_ops:
+                    profiler.report(vm, ConsoleOutput())
+                elif sample_ms or profile_functions:
+                    profiler.report(ConsoleOutput())
+
+                if flamegraph and hasattr(profiler, 'write_collapsed_stacks'):
+                    with FileOutput(flamegraph) as output:
+                        profiler.write_collapsed_stacks(output)
+
+                if record:
+                    with FileOutput(record) as output:
+                        write_events(profiler.events, output)
+
+                if replay:
+                    print_replay_divergence(profiler, ConsoleOutput())
+
+                if heap_stats:
+                    print_heap_stats(vm.heap.stats(), ConsoleOutput())
+
+                if heap_stats_json:
+                    with FileOutput(heap_stats_json) as output:
+                        output.out(json.dumps(vm.heap.stats(), indent=2))
 
         except ValueError as e:
             print(e)
             pass
 
 
+def print_screen(terminal, output):
+    lines = terminal.lines()
+    output.out('Screen after {:d} frames and {:d} reads of input'.format(terminal.frames, terminal.reads))
+    for line in lines:
+        output.out(line)
+
+
+def print_replay_divergence(replayer, output):
+    if not replayer.diverged:
+        return
+
+    output.out(f'Replay diverged from the recording in {len(replayer.diverged)} reads of input, first:')
+    read, event, (instruction, source) = replayer.diverged[0]
+    recorded = f'{event[1]} at instruction {event[0]}' if event else 'nothing'
+    output.out(f'  read {read}: recorded {recorded}, replayed {source} at instruction {instruction}')
+
+
+def memory_size(text):
+    """
+    Size in bytes, with optional K, M or G suffix
+    """
+    multipliers = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+    multiplier = multipliers.get(text[-1:].upper(), 1)
+    return int(text[:-1] if multiplier > 1 else text) * multiplier
+
+
+def print_heap_stats(stats, output):
+    output.out('Heap ({:s}, {:d} bytes)'.format(stats['allocator'], stats['heap_size']))
+    for key in ['growths', 'live_bytes', 'peak_bytes', 'allocations', 'frees', 'free_bytes', 'free_blocks',
+                'largest_free_block', 'external_fragmentation', 'average_walk_length']:
+        value = stats[key]
+        value = f'{value:.3f}' if isinstance(value, float) else str(value)
+        output.out('{:>24s}  {:s}'.format(key.replace('_', ' '), value))
+
+    output.out('{:>24s}'.format('free block sizes'))
+    for bucket, count in stats['free_block_histogram'].items():
+        output.out('{:>24s}  {:d}'.format(bucket, count))
+
+
 if __name__ == '__main__':
-    file = 'example_source/tetris/main.f12'
-    if len(argv) == 2:
-        file = argv[1]
-    compile_file(file)
+    arg_parser = ArgumentParser(description='Compile and run F12 program')
+    arg_parser.add_argument('file', nargs='?', default='example_source/tetris/main.f12')
+    arg_parser.add_argument('-O', type=int, choices=optimization_levels, default=default_optimization_level,
+                            dest='optimization_level',
+                            help='0 compiles code as written, 1 folds constants, drops dead code '
+                                 'and fuses superinstructions, 2 also runs the peephole optimizer (default 2)')
+    arg_parser.add_argument('--profile-ops', action='store_true',
+                            help='print execution count and time of instructions when the program ends')
+    arg_parser.add_argument('--profile-functions', action='store_true',
+                            help='print calls, inclusive and exclusive time of functions when the program ends')
+    arg_parser.add_argument('--sample', metavar='MS', type=float, nargs='?', const=1.0, dest='sample_ms',
+                            help='sample executed functions and source lines every MS of CPU time (default 1)')
+    arg_parser.add_argument('--flamegraph', metavar='FILE',
+                            help='write function call stacks in the collapsed format of flamegraph tools')
+    arg_parser.add_argument('--allocator', choices=allocators, default='first_fit', help='heap allocator of the VM')
+    arg_parser.add_argument('--stack-size', type=memory_size, default=default_stack_size,
+                            help='bytes for code, globals and stack frames, K, M and G suffixes are allowed')
+    arg_parser.add_argument('--heap-size', type=memory_size, default=default_heap_size,
+                            help='initial bytes of heap, K, M and G suffixes are allowed')
+    arg_parser.add_argument('--max-heap-size', type=memory_size,
+                            help='bytes the heap can grow to, by default as far as addresses reach')
+    arg_parser.add_argument('--heap-stats', action='store_true', help='print heap statistics when the program ends')
+    arg_parser.add_argument('--heap-stats-json', metavar='FILE',
+                            help='write heap statistics as JSON when the program ends')
+    arg_parser.add_argument('--clock', choices=clocks,
+                            help='clock of sleep, virtual time advances instantly (default real)')
+    arg_parser.add_argument('--headless', action='store_true',
+                            help='run without a terminal, the screen is kept in memory and printed at the end')
+    arg_parser.add_argument('--input-script', metavar='FILE',
+                            help='keys returned by every get_input call, one line per call, implies --headless')
+    arg_parser.add_argument('--record', metavar='FILE',
+                            help='write every read of input and the instruction count it came at to FILE')
+    arg_parser.add_argument('--replay', metavar='FILE',
+                            help='feed input recorded with --record, implies --headless and the virtual clock')
+    args = arg_parser.parse_args()
+
+    if (args.record or args.replay) and (args.profile_ops or args.profile_functions or args.sample_ms
+                                         or args.flamegraph):
+        arg_parser.error('--record and --replay can not be combined with profiling')
+    if args.record and args.replay:
+        arg_parser.error('--record and --replay can not be combined')
+
+    compile_file(args.file, optimization_level=args.optimization_level, profile_ops=args.profile_ops,
+                 profile_functions=args.profile_functions, sample_ms=args.sample_ms, flamegraph=args.flamegraph,
+                 heap_stats=args.heap_stats, heap_stats_json=args.heap_stats_json, allocator=args.allocator,
+                 stack_size=args.stack_size, heap_size=args.heap_size,
+                 max_heap_size=args.max_heap_size, headless=args.headless, input_script=args.input_script,
+                 record=args.record, replay=args.replay, clock=args.clock or ('virtual' if args.replay else 'real'))
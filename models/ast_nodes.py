@@ -1,3 +1,4 @@
+import os
 from abc import ABC
 from typing import List, Union, Type
 
@@ -6,10 +7,11 @@ from models.instructions import InstructionType
 from models.scope import Scope
 from models.slot_dispenser import SlotDispenser
 from codegen.string_storage import string_storage
-from models.token import TokenType
+from models.token import Token, TokenType
 from utils.error_printer import print_error_from_token as print_error, print_error_simple
 from utils.list_utils import find_in_list
 from utils.type_checking_helpers import unify_types, prepare_for_printing
+import utils.bytes_utils as codec
 import utils.sizes as sizes
 import models.types as types
 
@@ -21,6 +23,22 @@ def handle_typing_error(cause, token):
     print_error('Typing error', cause, token)
 
 
+def make_literal(kind, value, token):
+    """
+    Literal of the folded value, it keeps position of the token for error messages and source lines
+    """
+    if kind == types.Bool:
+        token_type = TokenType.CONSTANT_TRUE if value else TokenType.CONSTANT_FALSE
+        return ExprLitBool(Token(token_type, token.line_number, token.file_name, token.offset_in_line))
+
+    literal_class, token_type = {
+        types.Int: (ExprLitInt, TokenType.LIT_INT),
+        types.Float: (ExprLitFloat, TokenType.LIT_FLOAT),
+        types.Char: (ExprLitChar, TokenType.LIT_CHAR),
+    }[kind]
+    return literal_class(Token(token_type, token.line_number, token.file_name, token.offset_in_line, value))
+
+
 class Node(ABC):
 
     def __init__(self) -> None:
@@ -52,6 +70,37 @@ class Node(ABC):
                 continue
             child._parent = self
 
+    def fold_constants(self):
+        """
+        Replaces expressions with values known at compile time by literals.
+        Returns the node which takes place of this one
+        """
+        return self
+
+    def fold_child(self, child):
+        if child is None:
+            return None
+        folded = child.fold_constants()
+        self.add_children(folded)
+        return folded
+
+    def children(self):
+        """
+        Nodes this one is the parent of, declarations it refers to are not its children
+        """
+        for key, value in self.__dict__.items():
+            if key.startswith('_'):
+                continue
+
+            for child in value if isinstance(value, list) else [value]:
+                if isinstance(child, Node) and child.parent is self:
+                    yield child
+
+    def descendants(self):
+        for child in self.children():
+            yield child
+            yield from child.descendants()
+
     def find_parent(self, parent_type):
         current_node = self.parent
         while current_node:
@@ -286,7 +335,20 @@ class AstTypeUnit(AstType):
 
 
 class Expr(Node, ABC):
-    pass
+
+    @property
+    def constant(self):
+        """
+        Value of the expression if it is a literal, None otherwise
+        """
+        return None
+
+    def write_jump_code(self, code_writer: CodeWriter, label, jump_if):
+        """
+        Jumps to the label if the bool value of the expression is jump_if, otherwise continues after it
+        """
+        self.write_code(code_writer)
+        code_writer.write(InstructionType.JNZ if jump_if else InstructionType.JZ, label)
 
 
 class ExprLit(Expr, ABC):
@@ -324,6 +386,10 @@ class ExprLitChar(ExprLit):
     def kind(self):
         return types.Char
 
+    @property
+    def constant(self):
+        return self.value.value
+
     def write_code(self, code_writer: CodeWriter):
         code_writer.write(InstructionType.PUSH_CHAR, self.value.value)
 
@@ -360,6 +426,10 @@ class ExprLitFloat(ExprLit):
     def kind(self):
         return types.Float
 
+    @property
+    def constant(self):
+        return float(self.value.value)
+
     def write_code(self, code_writer: CodeWriter):
         code_writer.write(InstructionType.PUSH_FLOAT, float(self.value.value))
 
@@ -374,6 +444,10 @@ class ExprLitInt(ExprLit):
     def kind(self):
         return types.Int
 
+    @property
+    def constant(self):
+        return int(self.value.value)
+
     def write_code(self, code_writer: CodeWriter):
         code_writer.write(InstructionType.PUSH_INT, int(self.value.value))
 
@@ -388,15 +462,23 @@ class ExprLitBool(ExprLit):
     def kind(self):
         return types.Bool
 
+    @property
+    def constant(self):
+        return self.value.type == TokenType.CONSTANT_TRUE
+
     def write_code(self, code_writer: CodeWriter):
-        value = self.value.type == TokenType.CONSTANT_TRUE
-        code_writer.write(InstructionType.PUSH_BOOL, value)
+        code_writer.write(InstructionType.PUSH_BOOL, self.constant)
+
+    def write_jump_code(self, code_writer: CodeWriter, label, jump_if):
+        if self.constant == jump_if:
+            code_writer.write(InstructionType.JMP, label)
 
 
 class ExprLitArray(ExprLit):
 
     def __init__(self, value, start_token):
         super().__init__(value)
+        self.add_children(*value)
         self._start_token = start_token
 
     @property
@@ -440,6 +522,10 @@ class ExprLitArray(ExprLit):
         else:
             handle_typing_error('Array cannot be empty', self.reference_token)
 
+    def fold_constants(self):
+        self.value = [self.fold_child(el) for el in self.value]
+        return self
+
     def write_code(self, code_writer: CodeWriter):
         for el in reversed(self.value):
             el.write_code(code_writer)
@@ -482,6 +568,10 @@ class ExprNewFromSizedType(ExprNew):
         unify_types(self.size_expr.reference_token, AstTypePrimitive(types.Int), expr_type)
         return AstTypePointer(AstTypeArray(self.type))
 
+    def fold_constants(self):
+        self.size_expr = self.fold_child(self.size_expr)
+        return self
+
     def write_code(self, code_writer: CodeWriter):
         self.size_expr.write_code(code_writer)
         code_writer.write(InstructionType.PUSH_INT, self.type.size_in_stack)
@@ -516,6 +606,10 @@ class ExprNewUnit(ExprNew):
         if type_:
             return AstTypePointer(type_)
 
+    def fold_constants(self):
+        self.create_unit_expr = self.fold_child(self.create_unit_expr)
+        return self
+
     def write_code(self, code_writer: CodeWriter):
         self.create_unit_expr.write_code(code_writer)
 
@@ -547,6 +641,10 @@ class ExprNewFromArrayLit(ExprNew):
         if type_:
             return AstTypePointer(type_)
 
+    def fold_constants(self):
+        self.array = self.fold_child(self.array)
+        return self
+
     def write_code(self, code_writer: CodeWriter):
         for el in reversed(self.array.value):
             el.write_code(code_writer)
@@ -588,6 +686,28 @@ class ExprBinary(Expr, ABC):
         self.left.resolve_names(scope)
         self.right.resolve_names(scope)
 
+    def operation(self, left, right):
+        raise NotImplementedError(f'Operation is not implemented for {self.__class__}')
+
+    def evaluate(self, left, right):
+        """
+        Value the VM would compute from the operands, None if the expression has to be left to the VM
+        """
+        return self.operation(left, right)
+
+    def fold_constants(self):
+        self.left = self.fold_child(self.left)
+        self.right = self.fold_child(self.right)
+
+        left, right = self.left.constant, self.right.constant
+        if left is None or right is None:
+            return self
+
+        value = self.evaluate(left, right)
+        if value is None:
+            return self
+        return make_literal(self.resolve_types().kind, value, self.reference_token)
+
 
 class ExprNumeric(Expr, ABC):
 
@@ -645,6 +765,17 @@ class ExprBinaryArithmetic(ExprBinaryNumeric, ABC):
             )
         return left_type
 
+    def evaluate(self, left, right):
+        try:
+            value = self.operation(left, right)
+        except (ZeroDivisionError, OverflowError):
+            # the VM fails on it at runtime
+            return None
+
+        if isinstance(left, int):
+            return codec.wrap_int(int(value))
+        return value if isinstance(value, float) else None
+
 
 class ExprBinaryComparison(ExprBinaryNumeric, ABC):
 
@@ -665,6 +796,23 @@ class ExprBinaryComparison(ExprBinaryNumeric, ABC):
             )
         return AstTypePrimitive(types.Bool)
 
+    @property
+    def jump_types_for_int(self):
+        """
+        Compare and branch instructions which jump if the comparison holds and if it does not
+        """
+        raise NotImplementedError(f'Jump types for int are not implemented for {self.__class__}')
+
+    def write_jump_code(self, code_writer: CodeWriter, label, jump_if):
+        # floats are not fused, a negated comparison with NaN is not the opposite comparison
+        if self.ensure_valid_type(self.left.resolve_types()) != types.Int:
+            return super().write_jump_code(code_writer, label, jump_if)
+
+        self.left.write_code(code_writer)
+        self.right.write_code(code_writer)
+        jump_if_true, jump_if_false = self.jump_types_for_int
+        code_writer.write(jump_if_true if jump_if else jump_if_false, label)
+
 
 class ExprBinaryEquality(ExprBinary, ABC):
 
@@ -672,6 +820,13 @@ class ExprBinaryEquality(ExprBinary, ABC):
     def instruction_type(self):
         raise NotImplementedError(f'Instruction type is not implemented for: {self.__class__} ')
 
+    @property
+    def jump_types(self):
+        """
+        Compare and branch instructions which jump if the comparison holds and if it does not
+        """
+        raise NotImplementedError(f'Jump types are not implemented for {self.__class__}')
+
     def resolve_types(self):
         left_type = self.left.resolve_types()
         right_type = self.right.resolve_types()
@@ -689,11 +844,23 @@ class ExprBinaryEquality(ExprBinary, ABC):
             )
         return AstTypePrimitive(types.Bool)
 
+    def evaluate(self, left, right):
+        # floats are compared by their bytes in the VM
+        if isinstance(left, float):
+            return self.operation(codec.float_to_bytes(left), codec.float_to_bytes(right))
+        return self.operation(left, right)
+
     def write_code(self, code_writer: CodeWriter):
         self.left.write_code(code_writer)
         self.right.write_code(code_writer)
         code_writer.write(self.instruction_type, self.left.resolve_types().size_in_stack)
 
+    def write_jump_code(self, code_writer: CodeWriter, label, jump_if):
+        self.left.write_code(code_writer)
+        self.right.write_code(code_writer)
+        jump_if_true, jump_if_false = self.jump_types
+        code_writer.write(jump_if_true if jump_if else jump_if_false, self.left.resolve_types().size_in_stack, label)
+
 
 class ExprNot(Expr):
 
@@ -727,16 +894,24 @@ class ExprNot(Expr):
 
         return AstTypePrimitive(types.Bool)
 
+    def fold_constants(self):
+        self.expr = self.fold_child(self.expr)
+        if self.expr.constant is None:
+            return self
+        return make_literal(types.Bool, not self.expr.constant, self.reference_token)
+
     def write_code(self, code_writer: CodeWriter):
         self.expr.write_code(code_writer)
         code_writer.write(InstructionType.NOT)
 
+    def write_jump_code(self, code_writer: CodeWriter, label, jump_if):
+        self.expr.write_jump_code(code_writer, label, not jump_if)
 
-class ExprBinaryLogic(ExprBinary, ABC):
 
-    @property
-    def instruction_type(self):
-        raise NotImplementedError(f'Instruction type is not implemented for: {self.__class__} ')
+class ExprBinaryLogic(ExprBinary, ABC):
+    """
+    Right operand is evaluated only when the left one does not decide the value
+    """
 
     def resolve_types(self):
         left_type = self.left.resolve_types()
@@ -751,23 +926,46 @@ class ExprBinaryLogic(ExprBinary, ABC):
         return AstTypePrimitive(types.Bool)
 
     def write_code(self, code_writer: CodeWriter):
-        self.left.write_code(code_writer)
-        self.right.write_code(code_writer)
-        code_writer.write(self.instruction_type)
+        false_label = Label()
+        end_label = Label()
+        self.write_jump_code(code_writer, false_label, False)
+        code_writer.write(InstructionType.PUSH_BOOL, True)
+        code_writer.write(InstructionType.JMP, end_label)
+        code_writer.place_label(false_label)
+        code_writer.write(InstructionType.PUSH_BOOL, False)
+        code_writer.place_label(end_label)
 
 
 class ExprOr(ExprBinaryLogic):
 
-    @property
-    def instruction_type(self):
-        return InstructionType.OR
+    def operation(self, left, right):
+        return left or right
+
+    def write_jump_code(self, code_writer: CodeWriter, label, jump_if):
+        if jump_if:
+            self.left.write_jump_code(code_writer, label, True)
+            self.right.write_jump_code(code_writer, label, True)
+        else:
+            skip_label = Label()
+            self.left.write_jump_code(code_writer, skip_label, True)
+            self.right.write_jump_code(code_writer, label, False)
+            code_writer.place_label(skip_label)
 
 
 class ExprAnd(ExprBinaryLogic):
 
-    @property
-    def instruction_type(self):
-        return InstructionType.AND
+    def operation(self, left, right):
+        return left and right
+
+    def write_jump_code(self, code_writer: CodeWriter, label, jump_if):
+        if jump_if:
+            skip_label = Label()
+            self.left.write_jump_code(code_writer, skip_label, False)
+            self.right.write_jump_code(code_writer, label, True)
+            code_writer.place_label(skip_label)
+        else:
+            self.left.write_jump_code(code_writer, label, False)
+            self.right.write_jump_code(code_writer, label, False)
 
 
 class ExprEq(ExprBinaryEquality):
@@ -776,6 +974,13 @@ class ExprEq(ExprBinaryEquality):
     def instruction_type(self):
         return InstructionType.EQ
 
+    @property
+    def jump_types(self):
+        return InstructionType.JEQ, InstructionType.JNE
+
+    def operation(self, left, right):
+        return left == right
+
 
 class ExprNe(ExprBinaryEquality):
 
@@ -783,6 +988,13 @@ class ExprNe(ExprBinaryEquality):
     def instruction_type(self):
         return InstructionType.NE
 
+    @property
+    def jump_types(self):
+        return InstructionType.JNE, InstructionType.JEQ
+
+    def operation(self, left, right):
+        return left != right
+
 
 class ExprGt(ExprBinaryComparison):
 
@@ -794,6 +1006,13 @@ class ExprGt(ExprBinaryComparison):
     def instruction_type_for_float(self):
         return InstructionType.GT_FLOAT
 
+    @property
+    def jump_types_for_int(self):
+        return InstructionType.JGT_INT, InstructionType.JLE_INT
+
+    def operation(self, left, right):
+        return left > right
+
 
 class ExprGe(ExprBinaryComparison):
 
@@ -805,6 +1024,13 @@ class ExprGe(ExprBinaryComparison):
     def instruction_type_for_float(self):
         return InstructionType.GE_FLOAT
 
+    @property
+    def jump_types_for_int(self):
+        return InstructionType.JGE_INT, InstructionType.JLT_INT
+
+    def operation(self, left, right):
+        return left >= right
+
 
 class ExprLt(ExprBinaryComparison):
 
@@ -816,6 +1042,13 @@ class ExprLt(ExprBinaryComparison):
     def instruction_type_for_float(self):
         return InstructionType.LT_FLOAT
 
+    @property
+    def jump_types_for_int(self):
+        return InstructionType.JLT_INT, InstructionType.JGE_INT
+
+    def operation(self, left, right):
+        return left < right
+
 
 class ExprLe(ExprBinaryComparison):
 
@@ -827,6 +1060,13 @@ class ExprLe(ExprBinaryComparison):
     def instruction_type_for_float(self):
         return InstructionType.LE_FLOAT
 
+    @property
+    def jump_types_for_int(self):
+        return InstructionType.JLE_INT, InstructionType.JGT_INT
+
+    def operation(self, left, right):
+        return left <= right
+
 
 class ExprAdd(ExprBinaryArithmetic):
 
@@ -838,6 +1078,9 @@ class ExprAdd(ExprBinaryArithmetic):
     def instruction_type_for_float(self):
         return InstructionType.ADD_FLOAT
 
+    def operation(self, left, right):
+        return left + right
+
 
 class ExprSub(ExprBinaryArithmetic):
 
@@ -849,6 +1092,9 @@ class ExprSub(ExprBinaryArithmetic):
     def instruction_type_for_float(self):
         return InstructionType.SUB_FLOAT
 
+    def operation(self, left, right):
+        return left - right
+
 
 class ExprMul(ExprBinaryArithmetic):
 
@@ -860,6 +1106,9 @@ class ExprMul(ExprBinaryArithmetic):
     def instruction_type_for_float(self):
         return InstructionType.MUL_FLOAT
 
+    def operation(self, left, right):
+        return left * right
+
 
 class ExprDiv(ExprBinaryArithmetic):
 
@@ -871,6 +1120,9 @@ class ExprDiv(ExprBinaryArithmetic):
     def instruction_type_for_float(self):
         return InstructionType.DIV_FLOAT
 
+    def operation(self, left, right):
+        return left / right
+
 
 class ExprMod(ExprBinaryArithmetic):
 
@@ -882,6 +1134,9 @@ class ExprMod(ExprBinaryArithmetic):
     def instruction_type_for_float(self):
         return InstructionType.MOD_FLOAT
 
+    def operation(self, left, right):
+        return left % right
+
 
 class ExprPow(ExprBinaryArithmetic):
 
@@ -893,6 +1148,12 @@ class ExprPow(ExprBinaryArithmetic):
     def instruction_type_for_float(self):
         return InstructionType.POW_FLOAT
 
+    def operation(self, left, right):
+        if isinstance(left, int) and right >= 0:
+            # the same bits as the wrapped power, without computing all digits of huge powers
+            return pow(left, right, 1 << sizes.int * 8)
+        return left ** right
+
 
 class ExprUnaryOp(ExprNumeric, Expr, ABC):
 
@@ -919,6 +1180,20 @@ class ExprUnaryOp(ExprNumeric, Expr, ABC):
 
         handle_typing_error('Unary operators applicable only to int and float', self.reference_token)
 
+    def operation(self, value):
+        raise NotImplementedError(f'Operation is not implemented for {self.__class__}')
+
+    def fold_constants(self):
+        self.expr = self.fold_child(self.expr)
+        value = self.expr.constant
+        if value is None:
+            return self
+
+        value = self.operation(value)
+        if isinstance(value, int):
+            value = codec.wrap_int(value)
+        return make_literal(self.resolve_types().kind, value, self.reference_token)
+
     def write_code(self, code_writer: CodeWriter):
         self.expr.write_code(code_writer)
 
@@ -936,6 +1211,9 @@ class ExprUPlus(ExprUnaryOp):
     def instruction_type_for_float(self):
         return InstructionType.UNARY_PLUS_FLOAT
 
+    def operation(self, value):
+        return value
+
 
 class ExprUMinus(ExprUnaryOp):
 
@@ -947,6 +1225,9 @@ class ExprUMinus(ExprUnaryOp):
     def instruction_type_for_float(self):
         return InstructionType.UNARY_MINUS_FLOAT
 
+    def operation(self, value):
+        return -value
+
 
 class ExprFromStdin(Expr):
 
@@ -1006,6 +1287,11 @@ class ExprAssign(Expr):
         unify_types(self.object.reference_token, obj_type, value_type)
         return value_type
 
+    def fold_constants(self):
+        self.object = self.fold_child(self.object)
+        self.value = self.fold_child(self.value)
+        return self
+
     def write_code(self, code_writer: CodeWriter):
         self.object.write_assigment_code(code_writer, self.value)
 
@@ -1059,6 +1345,16 @@ class ExprVar(Expr, Assignable):
             else:
                 handle_typing_error(f'Not a valid type for variable', self.reference_token)
 
+    def fold_constants(self):
+        decl = self.decl_node
+        if not isinstance(decl, (DeclVar, StmntDeclVar)) or not decl.is_constant or decl.value is None:
+            return self
+
+        value = decl.value.constant
+        if value is None:
+            return self
+        return make_literal(self.type.kind, value, self.reference_token)
+
     def write_code(self, code_writer: CodeWriter):
         if self.is_local:
             code_writer.write(InstructionType.GET_LOCAL, self.slot, self.type.size_in_stack)
@@ -1124,6 +1420,10 @@ class ExprAccess(Expr, Assignable):
         self.object.resolve_types()
         return self.field_decl_node.type if self.field_decl_node else None
 
+    def fold_constants(self):
+        self.object = self.fold_child(self.object)
+        return self
+
     def write_code(self, code_writer: CodeWriter):
         self.object.write_code(code_writer)
         code_writer.write(InstructionType.PUSH_INT, self.field_decl_node.field_slot)
@@ -1201,6 +1501,11 @@ class ExprArrayAccess(Expr, Assignable):
 
         return array_type.iterable_element_type.resolve_types()
 
+    def fold_constants(self):
+        self.array = self.fold_child(self.array)
+        self.index_expr = self.fold_child(self.index_expr)
+        return self
+
     def write_code(self, code_writer: CodeWriter):
         self.array.write_code(code_writer)
 
@@ -1289,6 +1594,10 @@ class ExprFnCall(Expr):
                 unify_types(arg.reference_token, param.type, arg_type)
         return self.function_decl_node.return_type
 
+    def fold_constants(self):
+        self.args = [self.fold_child(arg) for arg in self.args]
+        return self
+
     def write_code(self, code_writer: CodeWriter):
         if self.function_decl_node.std_instr:
             return self.write_std_fn_code(code_writer)
@@ -1362,6 +1671,10 @@ class ExprCreateUnit(Expr):
 
         return AstTypeUnit(self.unit_decl_node.name, self.unit_decl_node)
 
+    def fold_constants(self):
+        self.args = [self.fold_child(arg) for arg in self.args]
+        return self
+
     def write_code(self, code_writer: CodeWriter):
         fields = self.unit_decl_node.fields
         for field in reversed(fields):
@@ -1410,6 +1723,10 @@ class CreateUnitArg(Node):
     def resolve_types(self):
         return self.value.resolve_types()
 
+    def fold_constants(self):
+        self.value = self.fold_child(self.value)
+        return self
+
     def write_code(self, code_writer: CodeWriter):
         self.value.write_code(code_writer)
 
@@ -1455,6 +1772,10 @@ class StmntFree(Stmnt):
         type_ = self.expr_address.resolve_types()
         unify_types(self.reference_token, AstTypePointer(None), type_)
 
+    def fold_constants(self):
+        self.expr_address = self.fold_child(self.expr_address)
+        return self
+
     def write_code(self, code_writer: CodeWriter):
         self.expr_address.write_code(code_writer)
         code_writer.write(InstructionType.MEMORY_FREE)
@@ -1464,7 +1785,7 @@ class StmntDeclVar(Stmnt):
 
     def __init__(self, type_: AstType, name, value=None, is_constant=False) -> None:
         super().__init__()
-        self.add_children(type_)
+        self.add_children(type_, value)
         self.type = type_
         self.name = name
         self.value = value
@@ -1497,6 +1818,10 @@ class StmntDeclVar(Stmnt):
             value_type = self.value.resolve_types()
             unify_types(self.reference_token, self.type, value_type)
 
+    def fold_constants(self):
+        self.value = self.fold_child(self.value)
+        return self
+
     def write_code(self, code_writer: CodeWriter):
         if self.value:
             self.value.write_code(code_writer)
@@ -1529,11 +1854,17 @@ class StmntIf(Stmnt):
         if self.else_clause:
             self.else_clause.resolve_types()
 
+    def fold_constants(self):
+        self.condition = self.fold_child(self.condition)
+        self.stmnt_block.fold_constants()
+        if self.else_clause:
+            self.else_clause.fold_constants()
+        return self
+
     def write_code(self, code_writer: CodeWriter):
         else_label = Label()
         end_label = Label()
-        self.condition.write_code(code_writer)
-        code_writer.write(InstructionType.JZ, else_label)
+        self.condition.write_jump_code(code_writer, else_label, False)
         self.stmnt_block.write_code(code_writer)
         code_writer.write(InstructionType.JMP, end_label)
         code_writer.place_label(else_label)
@@ -1611,6 +1942,10 @@ class StmntReturn(StmntControl):
             val_type = AstTypePrimitive(types.Void)
         unify_types(self.token, ret_type, val_type)
 
+    def fold_constants(self):
+        self.value = self.fold_child(self.value)
+        return self
+
     def write_code(self, code_writer: CodeWriter):
         if self.value:
             self.value.write_code(code_writer)
@@ -1632,6 +1967,10 @@ class StmntExpr(Stmnt):
     def resolve_types(self):
         return self.expr.resolve_types()
 
+    def fold_constants(self):
+        self.expr = self.fold_child(self.expr)
+        return self
+
     @property
     def reference_token(self):
         return self.expr.reference_token
@@ -1662,6 +2001,10 @@ class StmntToStdout(Stmnt):
             if not isinstance(type_, AstTypePrimitive):
                 handle_typing_error(f'You cannot print {prepare_for_printing(type_)}', value.reference_token)
 
+    def fold_constants(self):
+        self.values = [self.fold_child(value) for value in self.values]
+        return self
+
     @property
     def reference_token(self):
         return self.token
@@ -1695,14 +2038,18 @@ class StmntWhile(Stmnt):
 
         self.stmnt_block.resolve_types()
 
+    def fold_constants(self):
+        self.condition = self.fold_child(self.condition)
+        self.stmnt_block.fold_constants()
+        return self
+
     def write_code(self, code_writer: CodeWriter):
         start_label = Label()
         end_label = Label()
 
         code_writer.start_loop(start_label, end_label)
         code_writer.place_label(start_label)
-        self.condition.write_code(code_writer)
-        code_writer.write(InstructionType.JZ, end_label)
+        self.condition.write_jump_code(code_writer, end_label, False)
         self.stmnt_block.write_code(code_writer)
         code_writer.write(InstructionType.JMP, start_label)
         code_writer.place_label(end_label)
@@ -1734,8 +2081,20 @@ class StmntBlock(Node):
         for stmnt in self.statements:
             stmnt.resolve_types()
 
+    def fold_constants(self):
+        for stmnt in self.statements:
+            stmnt.fold_constants()
+        return self
+
+    def remove_unreachable_statements(self):
+        for i, stmnt in enumerate(self.statements):
+            if isinstance(stmnt, StmntControl):
+                self.statements = self.statements[:i + 1]
+                return
+
     def write_code(self, code_writer: CodeWriter):
         for stmnt in self.statements:
+            code_writer.mark_source_line(stmnt.reference_token)
             stmnt.write_code(code_writer)
 
 
@@ -1833,8 +2192,13 @@ class DeclFun(Decl):
             param.resolve_types()
         self.body.resolve_types()
 
+    def fold_constants(self):
+        self.body.fold_constants()
+        return self
+
     def write_code(self, code_writer: CodeWriter):
-        code_writer.place_label(self.label)
+        code_writer.place_function_label(self.label, f'{self.name.value} ({os.path.basename(self.name.file_name)})')
+        code_writer.mark_source_line(self.name)
         if self._locals_offset > 0:
             code_writer.write(InstructionType.ALLOCATE_IN_STACK, self._locals_offset)
         self.body.write_code(code_writer)
@@ -1882,6 +2246,10 @@ class DeclVar(Decl):
             value_type = self.value.resolve_types()
             unify_types(self.reference_token, self.type, value_type)
 
+    def fold_constants(self):
+        self.value = self.fold_child(self.value)
+        return self
+
     def write_code(self, code_writer: CodeWriter):
         if self.value:
             self.value.write_code(code_writer)
@@ -2045,6 +2413,7 @@ class Program(Node):
                 continue
 
             new_root_elements.extend(included_root.root_elements)
+        self.add_children(*new_root_elements)
         self.root_elements = new_root_elements
 
     def resolve_names(self, scope: Scope):
@@ -2066,6 +2435,44 @@ class Program(Node):
         for el in self.root_elements:
             el.resolve_types()
 
+    def fold_constants(self):
+        # values of global constants are folded first, so functions declared before them can use the values
+        for el in self.root_elements:
+            if isinstance(el, DeclVar):
+                el.fold_constants()
+        for el in self.root_elements:
+            if not isinstance(el, DeclVar):
+                el.fold_constants()
+        return self
+
+    def eliminate_dead_code(self):
+        """
+        Drops statements after ret, break and continue, functions main never gets to call
+        and static strings which are left only in the dropped code
+        """
+        for node in self.descendants():
+            if isinstance(node, StmntBlock):
+                node.remove_unreachable_statements()
+
+        reachable = self.reachable_functions()
+        self.root_elements = [el for el in self.root_elements if not isinstance(el, DeclFun) or el in reachable]
+
+        string_storage.remove_unused({node.label for node in self.descendants() if isinstance(node, ExprLitStr)})
+        return self
+
+    def reachable_functions(self):
+        """
+        Functions called from main or from values of global variables, directly or through other functions
+        """
+        reachable = {self._main_fn}
+        pending = [self._main_fn] + [el for el in self.root_elements if isinstance(el, DeclVar)]
+        while pending:
+            for node in pending.pop().descendants():
+                if isinstance(node, ExprFnCall) and node.function_decl_node not in reachable:
+                    reachable.add(node.function_decl_node)
+                    pending.append(node.function_decl_node)
+        return reachable
+
     def check_for_entry_point(self):
         main_fns = [el for el in self.root_elements
                     if isinstance(el, DeclFun) and el.name.value == 'main']
@@ -49,6 +49,13 @@ class InstructionType(ExtendedEnum):
 
     JMP = 'JMP'
     JZ = 'JZ'
+    JNZ = 'JNZ'
+    JLT_INT = 'JLT_INT'
+    JLE_INT = 'JLE_INT'
+    JGT_INT = 'JGT_INT'
+    JGE_INT = 'JGE_INT'
+    JEQ = 'JEQ'
+    JNE = 'JNE'
 
     ALLOCATE_IN_STACK = 'ALLOCATE_IN_STACK'
     SET_GLOBAL = 'SET_GLOBAL'
@@ -82,6 +89,18 @@ class InstructionType(ExtendedEnum):
     PUT_CHAR_X_Y = 'PUT_CHAR_X_Y'
     GET_INPUT = 'GET_INPUT'
     SLEEP = 'SLEEP'
+    PRESENT = 'PRESENT'
+    READ_LINE = 'READ_LINE'
+    READ_CHARS = 'READ_CHARS'
+    MAP_FILE = 'MAP_FILE'
+    FILE_SIZE = 'FILE_SIZE'
+
+    ADD_INT_CONST = 'ADD_INT_CONST'
+    ADD_SCALED_INT = 'ADD_SCALED_INT'
+    MEMORY_GET_FIELD = 'MEMORY_GET_FIELD'
+    MEMORY_GET_INDEX = 'MEMORY_GET_INDEX'
+    JZ_LOCAL_LT_INT = 'JZ_LOCAL_LT_INT'
+    SET_LOCAL_PUSH = 'SET_LOCAL_PUSH'
 
     EXIT = 'EXIT'
     MARKER_STATIC_START = 'MARKER_STATIC_START'
@@ -89,29 +108,34 @@ class InstructionType(ExtendedEnum):
 
 class Instruction:
 
-    def __init__(self, op_code, type_: InstructionType, ops_types) -> None:
+    def __init__(self, op_code, type_: InstructionType, ops_types, address_op=None) -> None:
         self.op_code = op_code
         self.type = type_
         self.ops_types = ops_types
+        # index of the operand which holds an address in the code segment
+        self.address_op = address_op
 
-    def fetch_ops(self, code, offset):
+    def decode_ops(self, code, offset):
         ops = []
         for op_type in self.ops_types:
             value, offset = select_from_bytes_func(op_type)(code, offset)
-            if value == '\n':
-                value = '\\n'
             ops.append(value)
 
         return ops, offset
 
+    def fetch_ops(self, code, offset):
+        ops, offset = self.decode_ops(code, offset)
+        ops = ['\\n' if op == '\n' else op for op in ops]
+        return ops, offset
+
 
 instructions_by_type = {}
 instructions_by_op_code = {}
 op_code_by_type = {}
 
 
-def add_instruction(op_code, type_, ops_types):
-    inst = Instruction(op_code, type_, ops_types)
+def add_instruction(op_code, type_, ops_types, address_op=None):
+    inst = Instruction(op_code, type_, ops_types, address_op)
     instructions_by_type[type_] = inst
     instructions_by_op_code[op_code] = inst
     op_code_by_type[type_] = op_code
@@ -134,12 +158,21 @@ add_instruction(0x23, InstructionType.GET_GLOBAL, [Int, Int])
 add_instruction(0x24, InstructionType.GET_LOCAL, [Int, Int])
 
 add_instruction(0x30, InstructionType.FN_CALL_BEGIN, [])
-add_instruction(0x31, InstructionType.FN_CALL, [Int, Int])
+add_instruction(0x31, InstructionType.FN_CALL, [Int, Int], address_op=0)
 add_instruction(0x32, InstructionType.RET, [])
 #  Return N bytes
 add_instruction(0x33, InstructionType.RET_VALUE, [Int])
-add_instruction(0x34, InstructionType.JZ, [Int])
-add_instruction(0x35, InstructionType.JMP, [Int])
+add_instruction(0x34, InstructionType.JZ, [Int], address_op=0)
+add_instruction(0x35, InstructionType.JMP, [Int], address_op=0)
+add_instruction(0x36, InstructionType.JNZ, [Int], address_op=0)
+#  Pop two integers and jump to X if the comparison holds
+add_instruction(0x37, InstructionType.JLT_INT, [Int], address_op=0)
+add_instruction(0x38, InstructionType.JLE_INT, [Int], address_op=0)
+add_instruction(0x39, InstructionType.JGT_INT, [Int], address_op=0)
+add_instruction(0x3A, InstructionType.JGE_INT, [Int], address_op=0)
+#  Pop two values of N bytes and jump to X if they are (not) equal
+add_instruction(0x3B, InstructionType.JEQ, [Int, Int], address_op=1)
+add_instruction(0x3C, InstructionType.JNE, [Int, Int], address_op=1)
 
 add_instruction(0x40, InstructionType.ADD_INT, [])
 add_instruction(0x41, InstructionType.SUB_INT, [])
@@ -197,6 +230,30 @@ add_instruction(0xA0, InstructionType.CLEAR_SCREEN, [])
 add_instruction(0xA1, InstructionType.PUT_CHAR_X_Y, [])
 add_instruction(0xA2, InstructionType.GET_INPUT, [])
 add_instruction(0xA3, InstructionType.SLEEP, [])
+#  Write characters put on the screen since the last present
+add_instruction(0xA4, InstructionType.PRESENT, [])
+#  Pop N and address, read a line of at most N characters from stdin to address and push the count read
+add_instruction(0xA5, InstructionType.READ_LINE, [])
+#  Pop N and address, read at most N characters from stdin to address and push the count read
+add_instruction(0xA6, InstructionType.READ_CHARS, [])
+#  Pop string address, map the file of that name read-only and push its address
+add_instruction(0xA7, InstructionType.MAP_FILE, [])
+#  Pop string address and push size of the file of that name
+add_instruction(0xA8, InstructionType.FILE_SIZE, [])
+
+# Superinstructions, see CodeWriter for the sequences they replace
+#  Pop integer and push it increased by N
+add_instruction(0x80, InstructionType.ADD_INT_CONST, [Int])
+#  Pop index and address, push address increased by index * N
+add_instruction(0x81, InstructionType.ADD_SCALED_INT, [Int])
+#  Pop address and push K bytes from address + N
+add_instruction(0x82, InstructionType.MEMORY_GET_FIELD, [Int, Int])
+#  Pop index and address and push K bytes from address + index * N
+add_instruction(0x83, InstructionType.MEMORY_GET_INDEX, [Int, Int])
+#  Jump to X if integer local variable at slot N is not less than K
+add_instruction(0x84, InstructionType.JZ_LOCAL_LT_INT, [Int, Int, Int], address_op=2)
+#  Pop N bytes, set them to the local variable at slot X and push them back
+add_instruction(0x85, InstructionType.SET_LOCAL_PUSH, [Int, Int])
 
 add_instruction(0xE0, InstructionType.MARKER_STATIC_START, [])
 add_instruction(0xE1, InstructionType.EXIT, [])
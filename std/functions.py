@@ -48,6 +48,31 @@ def init_functions():
             InstructionType.GET_INPUT
         ),
 
+        ast.DeclFun(
+            Token(TokenType.IDENTIFIER, 0, 'std', 0, value='map_file'),
+            [
+                ast.FunParam(
+                    ast.AstTypePrimitive(types.String),
+                    Token(TokenType.IDENTIFIER, 0, 'std', 0, value='path'),
+                )
+            ],
+            ast.AstTypePointer(ast.AstTypeArray(ast.AstTypePrimitive(types.Char))),
+            ast.StmntBlock([]),
+            InstructionType.MAP_FILE
+        ),
+        ast.DeclFun(
+            Token(TokenType.IDENTIFIER, 0, 'std', 0, value='file_size'),
+            [
+                ast.FunParam(
+                    ast.AstTypePrimitive(types.String),
+                    Token(TokenType.IDENTIFIER, 0, 'std', 0, value='path'),
+                )
+            ],
+            ast.AstTypePrimitive(types.Int),
+            ast.StmntBlock([]),
+            InstructionType.FILE_SIZE
+        ),
+
         ast.DeclFun(
             Token(TokenType.IDENTIFIER, 0, 'std', 0, value='sleep'),
             [
@@ -59,5 +84,46 @@ def init_functions():
             ast.AstTypePrimitive(types.Void),
             ast.StmntBlock([]),
             InstructionType.SLEEP
+        ),
+
+        ast.DeclFun(
+            Token(TokenType.IDENTIFIER, 0, 'std', 0, value='present'),
+            [],
+            ast.AstTypePrimitive(types.Void),
+            ast.StmntBlock([]),
+            InstructionType.PRESENT
+        ),
+
+        ast.DeclFun(
+            Token(TokenType.IDENTIFIER, 0, 'std', 0, value='read_line'),
+            [
+                ast.FunParam(
+                    ast.AstTypePointer(ast.AstTypeArray(ast.AstTypePrimitive(types.Char))),
+                    Token(TokenType.IDENTIFIER, 0, 'std', 0, value='buff'),
+                ),
+                ast.FunParam(
+                    ast.AstTypePrimitive(types.Int),
+                    Token(TokenType.IDENTIFIER, 0, 'std', 0, value='max'),
+                )
+            ],
+            ast.AstTypePrimitive(types.Int),
+            ast.StmntBlock([]),
+            InstructionType.READ_LINE
+        ),
+        ast.DeclFun(
+            Token(TokenType.IDENTIFIER, 0, 'std', 0, value='read_chars'),
+            [
+                ast.FunParam(
+                    ast.AstTypePointer(ast.AstTypeArray(ast.AstTypePrimitive(types.Char))),
+                    Token(TokenType.IDENTIFIER, 0, 'std', 0, value='buff'),
+                ),
+                ast.FunParam(
+                    ast.AstTypePrimitive(types.Int),
+                    Token(TokenType.IDENTIFIER, 0, 'std', 0, value='max'),
+                )
+            ],
+            ast.AstTypePrimitive(types.Int),
+            ast.StmntBlock([]),
+            InstructionType.READ_CHARS
         )
     ]
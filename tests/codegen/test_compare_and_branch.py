@@ -0,0 +1,62 @@
+from unittest import TestCase
+
+from models.instructions import InstructionType
+from tests.vm.helpers import compile_program, run_code, instruction_types
+
+comparisons = '''
+fun test(int a, int b, char c) {
+    if a < b { --> 'a'; }
+    if a <= b { --> 'b'; }
+    if a > b { --> 'c'; }
+    if a >= b { --> 'd'; }
+    if a == b { --> 'e'; }
+    if a != b { --> 'f'; }
+    if !(a < b) || c == 'x' { --> 'g'; }
+    if c != 'x' && a == b { --> 'h'; }
+    --> '|';
+}
+
+fun main {
+    test(1, 2, 'x');
+    test(2, 2, 'y');
+    test(3, 2, 'x');
+    --> '\\n';
+}
+'''
+
+nan = '''
+fun main {
+    float inf = 10.0;
+    while inf * 10.0 != inf {
+        inf = inf * 10.0;
+    }
+    float x = inf - inf;
+    if x < 1.0 { --> 'a'; }
+    if !(x < 1.0) { --> 'b'; }
+    if x == x { --> 'c'; }
+    --> '\\n';
+}
+'''
+
+
+def run(program):
+    code = compile_program(program).code
+    return run_code(code), instruction_types(code)
+
+
+class CompareAndBranchTests(TestCase):
+
+    def test_conditions_compare_and_branch_at_once(self):
+        output, types_ = run(comparisons)
+
+        self.assertEqual('abfg|bdegh|cdfg|\n', output)
+        for instruction_type in [InstructionType.LT_INT, InstructionType.LE_INT, InstructionType.GT_INT,
+                                 InstructionType.GE_INT, InstructionType.EQ, InstructionType.NE,
+                                 InstructionType.JZ, InstructionType.JNZ]:
+            self.assertNotIn(instruction_type, types_)
+
+    def test_float_conditions_are_not_negated(self):
+        output, types_ = run(nan)
+
+        self.assertEqual('bc\n', output)
+        self.assertIn(InstructionType.LT_FLOAT, types_)
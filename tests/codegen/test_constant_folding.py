@@ -0,0 +1,59 @@
+from unittest import TestCase
+
+from models.instructions import InstructionType
+from tests.vm.helpers import compile_program, run_code, run_program, instruction_types
+
+config = '''
+const int WIDTH = 30;
+const int RIGHT_WALL = WIDTH - 1;
+const char WALL = '|';
+const char BLOCK = WALL;
+
+fun main {
+    --> RIGHT_WALL * 2, BLOCK, RIGHT_WALL > 10, '\\n';
+}
+'''
+
+semantics = '''
+const int MAX = 2147483647;
+
+fun main {
+    --> MAX + 1, ' ', -7 / 2, ' ', 7 / -2, ' ', -7 % 2, ' ', -(-MAX - 1), ' ', MAX * MAX, ' ';
+    --> 10.0 / 4.0, ' ', 7.5 % 2.0, ' ', 2 ^ 3, ' ', 2.0 ^ 0.5, ' ', 0.0 == -0.0, ' ', 'a' != 'b', ' ';
+    --> !(1 < 2) || 2.5 >= 2.5 && true, '\\n';
+}
+'''
+
+division_by_zero = '''
+fun main {
+    --> 1 / 0;
+}
+'''
+
+
+class ConstantFoldingTests(TestCase):
+
+    def test_folds_expressions_over_constants(self):
+        types_ = instruction_types(compile_program(config).code)
+
+        self.assertEqual('58|True\n', run_program(config))
+        self.assertNotIn(InstructionType.MUL_INT, types_)
+        self.assertNotIn(InstructionType.GT_INT, types_)
+        self.assertNotIn(InstructionType.GET_GLOBAL, types_)
+
+    def test_folding_keeps_vm_semantics(self):
+        folded = run_program(semantics)
+
+        self.assertEqual(run_code(compile_program(semantics, fold_constants=False).code), folded)
+        self.assertEqual('-2147483648 -3 -3 1 -2147483648 1 2.5 1.5 9 0.25 False True True\n', folded)
+
+    def test_folded_code_has_no_arithmetic(self):
+        types_ = instruction_types(compile_program(semantics).code)
+
+        for instruction_type in [InstructionType.ADD_INT, InstructionType.DIV_INT, InstructionType.MOD_INT,
+                                 InstructionType.UNARY_MINUS_INT, InstructionType.POW_FLOAT, InstructionType.EQ,
+                                 InstructionType.NOT, InstructionType.AND, InstructionType.OR]:
+            self.assertNotIn(instruction_type, types_)
+
+    def test_does_not_fold_division_by_zero(self):
+        self.assertIn(InstructionType.DIV_INT, instruction_types(compile_program(division_by_zero).code))
@@ -0,0 +1,111 @@
+import os
+import tempfile
+from unittest import TestCase
+
+from tests.vm.helpers import compile_program, run_code
+
+library = '''
+fun used(int n) => int {
+    if n > 0 {
+        ret even(n - 1);
+    }
+    ret n;
+}
+
+fun even(int n) => int {
+    ret used(n);
+}
+
+fun unused(int n) => int {
+    --> "unused library string";
+    ret n * n;
+}
+
+fun initial => int {
+    ret 7;
+}
+'''
+
+program = '''
+>include "{library}";
+
+int start = initial();
+
+fun after_return => int {
+    ret 1;
+}
+
+fun main {
+    int i = 0;
+    while i < 3 {
+        i = i + 1;
+        continue;
+        --> "after continue";
+    }
+    --> used(start), ' ', i, " reached", '\\n';
+    ret;
+    --> after_return(), "after return";
+}
+'''
+
+initializers = '''
+fun f => int {
+    ret 7;
+}
+
+fun g => int {
+    ret 9;
+}
+
+fun main {
+    int x = f();
+    int[] a = new [g(), 2];
+    --> x, ' ', a[0], "hello", '\\n';
+}
+'''
+
+
+class DeadCodeTests(TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, 'library.f12')
+        with open(path, 'w') as f:
+            f.write(library)
+        self.program = program.replace('{library}', path)
+
+    def run_program(self, eliminate_dead_code=True, program=None, fold_constants=True):
+        code_writer = compile_program(program or self.program, fold_constants=fold_constants,
+                                      eliminate_dead_code=eliminate_dead_code)
+        return run_code(code_writer.code), code_writer
+
+    def test_writes_only_reachable_functions(self):
+        output, code_writer = self.run_program()
+
+        self.assertEqual('0 3 reached\n', output)
+        self.assertEqual(['used', 'even', 'initial', 'main'],
+                         [name.split()[0] for name in code_writer.function_names.values()])
+
+    def test_drops_statements_after_control_statements(self):
+        _, code_writer = self.run_program()
+        _, full_code_writer = self.run_program(eliminate_dead_code=False)
+
+        self.assertNotIn(b'after', bytes(code_writer.code))
+        self.assertIn(b'after continue', bytes(full_code_writer.code))
+        self.assertIn('after_return', ' '.join(full_code_writer.function_names.values()))
+
+    def test_drops_strings_of_dead_code(self):
+        output, code_writer = self.run_program()
+        _, full_code_writer = self.run_program(eliminate_dead_code=False)
+
+        self.assertNotIn(b'unused library string', bytes(code_writer.code))
+        self.assertIn(b'unused library string', bytes(full_code_writer.code))
+        self.assertIn(b' reached', bytes(code_writer.code))
+        self.assertLess(len(code_writer.code), len(full_code_writer.code))
+
+    def test_finds_calls_in_initial_values_without_folding(self):
+        output, code_writer = self.run_program(program=initializers, fold_constants=False)
+
+        self.assertEqual('7 9hello\n', output)
+        self.assertEqual(['f', 'g', 'main'], [name.split()[0] for name in code_writer.function_names.values()])
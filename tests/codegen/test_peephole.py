@@ -0,0 +1,97 @@
+from unittest import TestCase
+
+from codegen.code_writer import CodeWriter, Label
+from codegen.compilation import optimization_levels
+from models.instructions import InstructionType
+from tests.vm.helpers import compile_program, run_code, instruction_types
+from vm.decoder import decode
+
+program = '''
+fun collatz(int n) => int {
+    int steps = 0;
+    while n != 1 {
+        if n % 2 == 0 {
+            n = n / 2;
+        } else {
+            n = 3 * n + 1;
+        }
+        steps = steps + 1;
+    }
+    ret steps;
+}
+
+fun main {
+    int total = 0;
+    int i = 1;
+    while i < 30 {
+        int steps = collatz(i);
+        total = total + steps * 1 + 0;
+        --> +steps, ' ';
+        i = i + 1;
+    }
+    int a = 0;
+    int b = 0;
+    b = a = total;
+    --> a - 0, ' ', b, '\\n';
+}
+'''
+
+
+class PeepholeTests(TestCase):
+
+    def test_removes_operations_without_effect(self):
+        code_writer = CodeWriter()
+        code_writer.write(InstructionType.GET_LOCAL, 0, 4)
+        code_writer.write(InstructionType.PUSH_INT, 0)
+        code_writer.write(InstructionType.ADD_INT)
+        code_writer.write(InstructionType.UNARY_PLUS_INT)
+        code_writer.write(InstructionType.PUSH_INT, 1)
+        code_writer.write(InstructionType.MUL_INT)
+        code_writer.write(InstructionType.SET_LOCAL, 4, 4)
+        code_writer.write(InstructionType.EXIT)
+
+        self.assertEqual([InstructionType.GET_LOCAL, InstructionType.SET_LOCAL, InstructionType.EXIT],
+                         instruction_types(code_writer.code))
+
+    def test_removes_jump_to_next_instruction(self):
+        code_writer = CodeWriter()
+        next_label = Label()
+        end_label = Label()
+        code_writer.write(InstructionType.PUSH_BOOL, True)
+        code_writer.write(InstructionType.JZ, end_label)
+        code_writer.write(InstructionType.JMP, next_label)
+        code_writer.place_label(next_label)
+        code_writer.write(InstructionType.PUSH_INT, 1)
+        code_writer.write(InstructionType.POP, 4)
+        code_writer.place_label(end_label)
+        code_writer.write(InstructionType.EXIT)
+
+        decoded = decode(code_writer.code)
+
+        self.assertEqual([InstructionType.PUSH_BOOL, InstructionType.JZ, InstructionType.PUSH_INT,
+                          InstructionType.POP, InstructionType.EXIT], instruction_types(code_writer.code))
+        self.assertEqual([4], decoded.entries[1][2])
+
+    def test_keeps_stored_value_on_stack(self):
+        code_writer = CodeWriter()
+        code_writer.write(InstructionType.SET_LOCAL, 0, 4)
+        code_writer.write(InstructionType.GET_LOCAL, 0, 4)
+        code_writer.write(InstructionType.SET_LOCAL, 4, 4)
+        code_writer.write(InstructionType.GET_LOCAL, 0, 4)
+        code_writer.write(InstructionType.EXIT)
+
+        self.assertEqual([InstructionType.SET_LOCAL_PUSH, InstructionType.SET_LOCAL, InstructionType.GET_LOCAL,
+                          InstructionType.EXIT], instruction_types(code_writer.code))
+
+    def test_optimization_levels_keep_output(self):
+        outputs = []
+        for options in optimization_levels.values():
+            code_writer = compile_program(program, **options)
+            outputs.append(run_code(code_writer.code))
+
+            offsets = set(decode(code_writer.code).offsets)
+            self.assertLessEqual(set(code_writer.function_names), offsets)
+            self.assertLessEqual(set(code_writer.source_lines), offsets)
+
+        self.assertEqual(1, len(set(outputs)))
+        self.assertTrue(outputs[0].endswith(' 111 18 18 423 423\n'))
@@ -0,0 +1,77 @@
+from unittest import TestCase
+
+from codegen.code_writer import CodeWriter, Label
+from models.instructions import InstructionType
+from tests.vm.helpers import compile_program, run_code, run_program, instruction_types
+from vm.decoder import decode
+
+program = '''
+fun check(int n, bool value) => bool {
+    --> n;
+    ret value;
+}
+
+fun main {
+    if check(1, false) && check(2, true) {
+        --> 'x';
+    }
+    if check(3, true) || check(4, true) {
+        --> 'y';
+    }
+    if !(check(5, true) && check(6, false)) || check(7, true) {
+        --> 'z';
+    }
+    bool value = check(8, false) || check(9, true) && check(10, false);
+    --> value;
+    int i = 0;
+    while i < 3 && check(i, true) {
+        i = i + 1;
+    }
+    --> '\\n';
+}
+'''
+
+guard = '''
+fun main {
+    int[] board = new int[4];
+    int x = 4;
+    if x < 4 && board[x * 100000000] == 0 {
+        --> "inside";
+    }
+    --> x, '\\n';
+}
+'''
+
+
+class ShortCircuitTests(TestCase):
+
+    def test_right_operand_runs_only_when_needed(self):
+        code_writer = compile_program(program)
+
+        self.assertEqual('13y56z8910False012\n', run_code(code_writer.code))
+        types_ = instruction_types(code_writer.code)
+        self.assertNotIn(InstructionType.AND, types_)
+        self.assertNotIn(InstructionType.OR, types_)
+        self.assertNotIn(InstructionType.NOT, types_)
+
+    def test_guard_skips_out_of_bounds_read(self):
+        self.assertEqual('4\n', run_program(guard))
+
+    def test_threads_jumps_to_jumps(self):
+        code_writer = CodeWriter()
+        first = Label()
+        second = Label()
+        end = Label()
+        code_writer.write(InstructionType.PUSH_BOOL, False)
+        code_writer.write(InstructionType.JZ, first)
+        code_writer.place_label(first)
+        code_writer.write(InstructionType.JMP, second)
+        code_writer.place_label(second)
+        code_writer.write(InstructionType.JMP, end)
+        code_writer.write(InstructionType.PUSH_INT, 1)
+        code_writer.place_label(end)
+        code_writer.write(InstructionType.EXIT)
+
+        entries = decode(code_writer.code).entries
+
+        self.assertEqual([5, 5, 5], [entries[i][2][0] for i in (1, 2, 3)])
@@ -0,0 +1,75 @@
+from unittest import TestCase
+
+from codegen.code_writer import CodeWriter, Label
+from models.instructions import InstructionType
+from tests.vm.helpers import compile_program, run_code, instruction_types
+from vm.decoder import decode
+
+program = '''
+unit Point {
+    int x;
+    int y;
+}
+
+fun main {
+    int[] arr = new int[10];
+    Point p = new Point | x: 3, y: 4 |;
+    int i = 0;
+    int total = 0;
+    while i < 10 {
+        arr[i] = i;
+        total = total + arr[i] * p.y + p.x;
+        i = i + 1;
+    }
+    --> total, '\\n';
+}
+'''
+
+
+class SuperinstructionsTests(TestCase):
+
+    def test_fuses_array_and_field_access(self):
+        code_writer = CodeWriter()
+        code_writer.write(InstructionType.GET_LOCAL, 0, 4)
+        code_writer.write(InstructionType.GET_LOCAL, 4, 4)
+        code_writer.write(InstructionType.PUSH_INT, 4)
+        code_writer.write(InstructionType.MUL_INT)
+        code_writer.write(InstructionType.ADD_INT)
+        code_writer.write(InstructionType.MEMORY_GET, 4)
+        code_writer.write(InstructionType.PUSH_INT, 8)
+        code_writer.write(InstructionType.ADD_INT)
+        code_writer.write(InstructionType.MEMORY_GET, 1)
+
+        self.assertEqual([InstructionType.GET_LOCAL, InstructionType.GET_LOCAL, InstructionType.MEMORY_GET_INDEX,
+                          InstructionType.MEMORY_GET_FIELD], instruction_types(code_writer.code)[:4])
+        self.assertEqual([8, 1], decode(code_writer.code).entries[3][2])
+
+    def test_fuses_loop_condition(self):
+        code_writer = CodeWriter()
+        end_label = Label()
+        code_writer.write(InstructionType.GET_LOCAL, 0, 4)
+        code_writer.write(InstructionType.PUSH_INT, 10)
+        code_writer.write(InstructionType.JGE_INT, end_label)
+        code_writer.place_label(end_label)
+        code_writer.write(InstructionType.EXIT)
+
+        decoded = decode(code_writer.code)
+
+        self.assertEqual([InstructionType.JZ_LOCAL_LT_INT, InstructionType.EXIT], instruction_types(code_writer.code))
+        self.assertEqual([0, 10, 1], decoded.entries[0][2])
+
+    def test_does_not_fuse_across_labels(self):
+        code_writer = CodeWriter()
+        label = Label()
+        code_writer.write(InstructionType.PUSH_INT, 4)
+        code_writer.place_label(label)
+        code_writer.write(InstructionType.ADD_INT)
+        code_writer.write(InstructionType.JMP, label)
+
+        self.assertEqual([InstructionType.PUSH_INT, InstructionType.ADD_INT], instruction_types(code_writer.code)[:2])
+
+    def test_fused_program_matches_plain_program(self):
+        outputs = [run_code(compile_program(program, superinstructions=superinstructions).code)
+                   for superinstructions in [False, True]]
+
+        self.assertEqual(['210\n'], list(set(outputs)))
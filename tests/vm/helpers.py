@@ -0,0 +1,30 @@
+import io
+from contextlib import redirect_stdout
+
+from codegen.compilation import compile_source
+from vm.decoder import decode
+from vm.vm import VM
+
+
+def compile_program(source, **compile_options):
+    with redirect_stdout(io.StringIO()):
+        code_writer = compile_source(source, 'test.f12', **compile_options)
+
+    if code_writer is None:
+        raise ValueError('Program did not compile')
+    return code_writer
+
+
+def run_code(code, **vm_options):
+    output = io.StringIO()
+    with redirect_stdout(output):
+        VM(code, **vm_options).exec()
+    return output.getvalue()
+
+
+def run_program(source, **vm_options):
+    return run_code(compile_program(source).code, **vm_options)
+
+
+def instruction_types(code):
+    return [instr.type for _, instr, _ in decode(code).entries if instr is not None]
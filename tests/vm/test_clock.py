@@ -0,0 +1,63 @@
+from unittest import TestCase
+
+from tests.vm.helpers import compile_program
+from vm.clock import RealClock
+from vm.terminal import HeadlessTerminal
+from vm.vm import VM
+
+program = '''
+fun main {
+    int frame = 0;
+    while frame < 10 {
+        sleep(250);
+        frame = frame + 1;
+    }
+    sleep(-5);
+}
+'''
+
+
+class FakeTime:
+
+    def __init__(self) -> None:
+        self.now = 100.0
+        self.waits = []
+
+    def timer(self):
+        return self.now
+
+    def wait(self, seconds):
+        self.waits.append(seconds * 1000)
+        self.now += seconds
+
+
+class RealClockTests(TestCase):
+
+    def setUp(self):
+        self.time = FakeTime()
+        self.clock = RealClock(self.time.timer, self.time.wait)
+
+    def test_subtracts_time_spent_in_frame(self):
+        self.clock.sleep(16)
+        self.time.now += 0.005
+        self.clock.sleep(16)
+        self.time.now += 0.015
+        self.clock.sleep(16)
+
+        self.assertEqual([16, 11, 1], [round(ms) for ms in self.time.waits])
+
+    def test_starts_again_when_behind_by_more_than_a_frame(self):
+        self.clock.sleep(10)
+        self.time.now += 0.5
+        self.clock.sleep(10)
+
+        self.assertEqual([10, 10], [round(ms) for ms in self.time.waits])
+
+
+class VirtualClockTests(TestCase):
+
+    def test_sleep_advances_simulated_time(self):
+        vm = VM(compile_program(program).code, terminal=HeadlessTerminal(), clock='virtual')
+        vm.exec()
+
+        self.assertEqual(2500, vm.clock.now_ms)
@@ -0,0 +1,53 @@
+from unittest import TestCase
+
+from codegen.code_writer import CodeWriter, Label
+from models import types
+from models.instructions import InstructionType, op_code_by_type
+from vm.decoder import decode
+
+
+class DecoderTests(TestCase):
+
+    def test_decodes_operands(self):
+        code_writer = CodeWriter()
+        code_writer.write(InstructionType.PUSH_INT, 42)
+        code_writer.write(InstructionType.PUSH_CHAR, '\n')
+        code_writer.write(InstructionType.GET_LOCAL, 4, 8)
+
+        decoded = decode(code_writer.code)
+
+        self.assertEqual((op_code_by_type[InstructionType.PUSH_INT], [42]), self.op_and_ops(decoded.entries[0]))
+        self.assertEqual((op_code_by_type[InstructionType.PUSH_CHAR], ['\n']), self.op_and_ops(decoded.entries[1]))
+        self.assertEqual((op_code_by_type[InstructionType.GET_LOCAL], [4, 8]), self.op_and_ops(decoded.entries[2]))
+
+    def test_rewrites_jump_targets_to_indices(self):
+        code_writer = CodeWriter()
+        start_label = Label()
+        end_label = Label()
+        code_writer.place_label(start_label)
+        code_writer.write(InstructionType.PUSH_BOOL, True)
+        code_writer.write(InstructionType.JZ, end_label)
+        code_writer.write(InstructionType.JMP, start_label)
+        code_writer.place_label(end_label)
+        code_writer.write(InstructionType.EXIT)
+
+        decoded = decode(code_writer.code)
+
+        self.assertEqual([3], decoded.entries[1][2])
+        self.assertEqual([0], decoded.entries[2][2])
+        self.assertEqual([0, 3, 9, 15], decoded.offsets[:4])
+
+    def test_stops_at_static_strings(self):
+        code_writer = CodeWriter()
+        code_writer.write(InstructionType.EXIT)
+        code_writer.write(InstructionType.MARKER_STATIC_START)
+        code_writer.write_raw('abc', types.String)
+
+        decoded = decode(code_writer.code)
+
+        self.assertEqual(2, len(decoded))
+
+    @staticmethod
+    def op_and_ops(entry):
+        op_code, _, ops = entry
+        return op_code, ops
@@ -0,0 +1,31 @@
+from unittest import TestCase
+
+from models.instructions import InstructionType, instructions_by_op_code, op_code_by_type
+from tests.vm.helpers import run_program
+from vm.vm import VM
+
+program = '''
+fun main {
+    bool t = true;
+    bool f = false;
+    float x = 1.5;
+    --> t || f, ' ', f || f, ' ', t && f, ' ', t && t, ' ', +x, '\\n';
+}
+'''
+
+
+class DispatchTests(TestCase):
+
+    def test_every_instruction_has_a_handler(self):
+        missing = [instr.type for op_code, instr in instructions_by_op_code.items()
+                   if VM.op_code_handlers[op_code] is VM.behaviour_not_defined]
+
+        self.assertEqual([InstructionType.MARKER_STATIC_START], missing)
+
+    def test_unknown_op_codes_are_mapped_to_error_handler(self):
+        unknown_op_code = max(op_code_by_type.values()) + 1
+
+        self.assertIs(VM.op_code_not_defined, VM.op_code_handlers[unknown_op_code])
+
+    def test_logic_operators_leave_only_their_result(self):
+        self.assertEqual('True False False True 1.5\n', run_program(program))
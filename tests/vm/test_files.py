@@ -0,0 +1,109 @@
+import os
+import tempfile
+from unittest import TestCase
+
+from tests.vm.helpers import run_program
+from vm.files import MappedFiles, mapped_files_start
+
+scan_program = '''
+fun main {
+    int size = file_size("{path}");
+    char[] data = map_file("{path}");
+    int lines = 0;
+    int i = 0;
+    while i < size {
+        if data[i] == '\\n' {
+            lines = lines + 1;
+        }
+        i = i + 1;
+    }
+    --> size, ' ', lines, ' ', data[0], data[size - 1] == '\\n', '\\n';
+    free data;
+}
+'''
+
+write_program = '''
+fun main {
+    char[] data = map_file("{path}");
+    data[1] = 'x';
+    --> "not reached";
+}
+'''
+
+freed_program = '''
+fun main {
+    char[] data = map_file("{path}");
+    --> data[0];
+    free data;
+    --> data[0];
+}
+'''
+
+non_ascii_program = '''
+fun main {
+    char[] data = map_file("{path}");
+    char first = data[1];
+    --> data[0], data[1], data[3], first == data[1], data[1] == data[2], '\\n';
+}
+'''
+
+missing_program = '''
+fun main {
+    char[] data = map_file("{path}/missing");
+}
+'''
+
+
+class MappedFileTests(TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.path = os.path.join(self.directory, 'data.txt')
+        with open(self.path, 'w') as f:
+            f.write('first\nsecond\nthird\n')
+
+    def run_with_path(self, program, path=None):
+        return run_program(program.replace('{path}', path or self.path))
+
+    def test_program_reads_mapped_file(self):
+        self.assertEqual('19 3 fTrue\n', self.run_with_path(scan_program))
+
+    def test_mapped_file_is_read_only(self):
+        output = self.run_with_path(write_program)
+
+        self.assertRegex(output, r'^VM error: Memory at address \d+ is a read-only mapped file\n$')
+
+    def test_free_unmaps_file(self):
+        output = self.run_with_path(freed_program)
+
+        self.assertRegex(output, r'^fVM error: Trying to read memory at address \d+ outside of mapped files\n$')
+
+    def test_reads_bytes_above_ascii(self):
+        path = os.path.join(self.directory, 'utf8.txt')
+        with open(path, 'wb') as f:
+            f.write('hé!\n'.encode('utf-8'))
+
+        self.assertEqual('h\xc3!TrueFalse\n', self.run_with_path(non_ascii_program, path))
+
+    def test_missing_file_is_reported(self):
+        output = self.run_with_path(missing_program, self.directory)
+
+        self.assertEqual(f'VM error: Can not map file {self.directory}/missing: No such file or directory\n', output)
+
+    def test_files_get_separate_address_ranges(self):
+        empty = os.path.join(self.directory, 'empty.txt')
+        open(empty, 'w').close()
+        files = MappedFiles()
+
+        first = files.map(self.path)
+        second = files.map(empty)
+        third = files.map(self.path)
+
+        self.assertEqual(mapped_files_start, first)
+        self.assertLess(first + 19, second)
+        self.assertLess(second, third)
+        self.assertEqual(b'first', files.read(first, 5))
+        self.assertIsNone(files.read(first + 15, 5))
+        self.assertEqual(b'third\n', files.read(third + 13, 6))
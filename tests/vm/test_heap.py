@@ -0,0 +1,146 @@
+import io
+import json
+import random
+from contextlib import redirect_stdout
+from unittest import TestCase
+
+from tests.vm.helpers import compile_program, run_program
+from utils import sizes
+from vm.heap import SegregatedHeap, block_metadata_size, tag_size
+from vm.vm import VM
+
+program = '''
+unit Node {
+    int value;
+    int weight;
+}
+
+fun make(int i) => Node {
+    ret new Node | value: i, weight: i % 7 |;
+}
+
+fun main {
+    Node a = make(0);
+    Node b = make(1);
+    int[] kept = new int[1];
+    int sum = 0;
+    int i = 2;
+    while i < 300 {
+        Node c = make(i);
+        int[] tmp = new int[i % 37 + 1];
+        tmp[i % 37] = i;
+        sum = sum + a.value * b.weight + tmp[i % 37];
+        free a;
+        a = b;
+        b = c;
+        if i % 5 == 0 {
+            free kept;
+            kept = tmp;
+        } else {
+            free tmp;
+        }
+        i = i + 1;
+    }
+    int[] big = new int[1000];
+    big[999] = 3;
+    --> sum, ' ', a.value, ' ', b.weight, ' ', big[999], '\\n';
+}
+'''
+
+
+def overhead(heap, stats):
+    """
+    Bytes of heap used by block metadata
+    """
+    blocks = stats['allocations'] - stats['frees'] + stats['free_blocks']
+    if isinstance(heap, SegregatedHeap):
+        return blocks * tag_size + (heap.size - (heap.epilogue - heap.start))
+    return blocks * block_metadata_size
+
+
+class HeapTests(TestCase):
+
+    def test_allocators_produce_identical_output(self):
+        first_fit_output = run_program(program, allocator='first_fit')
+        segregated_output = run_program(program, allocator='segregated')
+
+        self.assertEqual('177316 298 5 3\n', first_fit_output)
+        self.assertEqual(first_fit_output, segregated_output)
+
+
+class SegregatedHeapTests(TestCase):
+
+    def setUp(self):
+        self.vm = VM(compile_program('fun main {}').code, allocator='segregated')
+        self.heap: SegregatedHeap = self.vm.heap
+
+    def test_blocks_do_not_overlap_and_coalesce_when_freed(self):
+        rng = random.Random(12)
+        live = {}
+        for _ in range(3000):
+            if live and rng.random() < 0.45:
+                address = rng.choice(list(live))
+                self.assertEqual(bytes([address % 251]) * live[address],
+                                 bytes(self.vm.memory[address:address + live.pop(address)]))
+                self.heap.free(address)
+            else:
+                size = rng.choice([1, 4, 8, 12, 40, 100, 700, 5000])
+                address = self.heap.allocate(size)
+                self.vm.memory[address:address + size] = bytes([address % 251]) * size
+                live[address] = size
+
+        ranges = sorted((address, address + size) for address, size in live.items())
+        for (_, end), (start, _) in zip(ranges, ranges[1:]):
+            self.assertLessEqual(end, start)
+
+        for address in live:
+            self.heap.free(address)
+        free_blocks = [head for head in self.heap.heads if head != -1]
+        self.assertEqual([self.heap.start], free_blocks)
+        self.assertEqual(self.heap.epilogue - self.heap.start, self.heap.get_size(self.heap.start))
+
+    def test_reports_out_of_memory(self):
+        vm = VM(compile_program('fun main {}').code, allocator='segregated', max_heap_size=self.heap.size)
+
+        self.assertIsNone(vm.heap.allocate(vm.heap.epilogue - vm.heap.start))
+        self.assertFalse(vm.running)
+
+    def test_grown_heap_coalesces_with_last_free_block(self):
+        size = self.heap.size
+        address = self.heap.allocate(size)
+
+        self.assertEqual(self.heap.start + sizes.int, address)
+        self.assertEqual(1, self.heap.growths)
+        self.heap.free(address)
+        self.assertEqual([self.heap.epilogue - self.heap.start], [self.heap.get_size(self.heap.start)])
+        self.assertEqual(1, self.heap.stats()['free_blocks'])
+
+
+class HeapStatsTests(TestCase):
+
+    def test_counts_allocations_of_program(self):
+        for allocator in ['first_fit', 'segregated']:
+            vm = VM(compile_program(program).code, allocator=allocator)
+            with redirect_stdout(io.StringIO()):
+                vm.exec()
+            stats = vm.heap.stats()
+
+            self.assertEqual(600, stats['allocations'])
+            self.assertEqual(596, stats['frees'])
+            self.assertEqual(stats['heap_size'], stats['live_bytes'] + stats['free_bytes']
+                             + overhead(vm.heap, stats))
+            self.assertGreaterEqual(stats['peak_bytes'], stats['live_bytes'])
+            self.assertEqual(stats['free_blocks'], sum(stats['free_block_histogram'].values()))
+            json.dumps(stats)
+
+    def test_fragmentation_of_interleaved_blocks(self):
+        vm = VM(compile_program('fun main {}').code, allocator='first_fit')
+        addresses = [vm.heap.allocate(100) for _ in range(10)]
+        for address in addresses[::2]:
+            vm.heap.free(address)
+        stats = vm.heap.stats()
+
+        self.assertEqual(6, stats['free_blocks'])
+        self.assertEqual({'64-127': 5, '2097152-4194303': 1}, stats['free_block_histogram'])
+        self.assertAlmostEqual(500 / stats['free_bytes'], stats['external_fragmentation'])
+        self.assertEqual(500, stats['live_bytes'])
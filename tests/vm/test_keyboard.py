@@ -0,0 +1,48 @@
+from contextlib import contextmanager
+from unittest import TestCase
+
+from vm.keyboard import Keyboard
+
+
+class ScriptedTerminal:
+    """
+    Returns keys of the script one by one and counts switches to cbreak mode
+    """
+
+    def __init__(self, keys) -> None:
+        self.keys = list(keys)
+        self.mode_switches = 0
+        self.in_cbreak = False
+
+    @contextmanager
+    def cbreak(self):
+        self.mode_switches += 1
+        self.in_cbreak = True
+        try:
+            yield
+        finally:
+            self.in_cbreak = False
+
+    def inkey(self, timeout=None):
+        return self.keys.pop(0) if self.keys else ''
+
+
+class KeyboardTests(TestCase):
+
+    def test_drains_pressed_keys_and_skips_sequences(self):
+        terminal = ScriptedTerminal(['a', 'KEY_UP', 'd', 'é', 's'])
+        keyboard = Keyboard(terminal)
+
+        self.assertEqual('ads', keyboard.read_keys())
+        self.assertEqual('', keyboard.read_keys())
+
+    def test_switches_terminal_mode_once(self):
+        terminal = ScriptedTerminal(['w'])
+        keyboard = Keyboard(terminal)
+        for _ in range(5):
+            keyboard.read_keys()
+
+        self.assertEqual(1, terminal.mode_switches)
+        self.assertTrue(terminal.in_cbreak)
+        keyboard.close()
+        self.assertFalse(terminal.in_cbreak)
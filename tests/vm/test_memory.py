@@ -0,0 +1,120 @@
+import io
+from contextlib import redirect_stdout
+from unittest import TestCase
+
+from tests.vm.helpers import compile_program, run_program
+from vm.heap import allocators
+from vm.vm import VM
+
+recursive_program = '''
+fun depth(int n) => int {
+    if n == 0 {
+        ret 0;
+    }
+    ret depth(n - 1) + 1;
+}
+
+fun main {
+    --> depth(2000), '\\n';
+}
+'''
+
+big_array_program = '''
+fun main {
+    int[] big = new int[2000000];
+    big[1999999] = 5;
+    --> big[1999999], '\\n';
+}
+'''
+
+out_of_bounds_program = '''
+fun main {
+    int[] ints = new int[4];
+    char[] chars = new char[4];
+    --> "x";
+    --> {array}[100000000];
+    --> "not reached";
+}
+'''
+
+
+class MemorySizeTests(TestCase):
+
+    def test_heap_starts_after_stack(self):
+        vm = VM(compile_program('fun main {}').code, stack_size=4096, heap_size=8192)
+
+        self.assertEqual(4096 + 8192, vm.memory_size)
+        self.assertEqual(4096, vm.heap.start)
+
+    def test_deep_recursion_overflows_small_stack(self):
+        self.assertEqual('2000\n', run_program(recursive_program))
+        self.assertEqual('VM error: Stack overflow\n', run_program(recursive_program, stack_size=16 * 1024))
+
+    def test_read_out_of_bounds_is_reported(self):
+        for array in ['ints', 'chars']:
+            with self.subTest(array=array):
+                output = run_program(out_of_bounds_program.replace('{array}', array))
+
+                self.assertRegex(output,
+                                 r'^xVM error: Trying to read memory at address \d+ was out of bounds \(\d+\)\n$')
+
+    def test_big_heap_can_be_requested(self):
+        vm = VM(compile_program('fun main {}').code, heap_size=64 * 1024 * 1024)
+
+        self.assertEqual(64 * 1024 * 1024, vm.heap.size)
+
+
+growing_program = '''
+fun main {
+    int[] first = new int[10];
+    first[9] = 7;
+    int i = 0;
+    int sum = 0;
+    while i < 300 {
+        int[] block = new int[1000];
+        block[999] = i;
+        sum = sum + block[999];
+        if i % 3 == 0 {
+            free block;
+        }
+        i = i + 1;
+    }
+    --> first[9], ' ', sum, '\\n';
+}
+'''
+
+
+class HeapGrowthTests(TestCase):
+
+    def test_heap_grows_and_keeps_pointers(self):
+        for allocator in allocators:
+            with self.subTest(allocator=allocator):
+                vm = VM(compile_program(growing_program).code, allocator=allocator, heap_size=64 * 1024)
+                output = io.StringIO()
+                with redirect_stdout(output):
+                    vm.exec()
+
+                self.assertEqual('7 44850\n', output.getvalue())
+                self.assertGreater(vm.heap.stats()['growths'], 0)
+                self.assertEqual(vm.memory_size, vm.heap.start + vm.heap.size)
+
+    def test_growth_keeps_the_reserved_mapping(self):
+        vm = VM(compile_program(growing_program).code, heap_size=16 * 1024)
+        memory = vm.memory
+        output = io.StringIO()
+        with redirect_stdout(output):
+            vm.exec()
+
+        self.assertEqual('7 44850\n', output.getvalue())
+        self.assertGreaterEqual(vm.heap.stats()['growths'], 3)
+        self.assertIs(memory, vm.memory)
+
+    def test_big_array_grows_heap(self):
+        self.assertEqual('5\n', run_program(big_array_program))
+
+    def test_growth_stops_at_max_heap_size(self):
+        for allocator in allocators:
+            with self.subTest(allocator=allocator):
+                output = run_program(big_array_program, allocator=allocator, max_heap_size=4 * 1024 * 1024)
+
+                self.assertEqual('VM error: Out of heap memory\n', output)
@@ -0,0 +1,47 @@
+import io
+from contextlib import redirect_stdout
+from unittest import TestCase
+
+from tests.vm.helpers import run_program
+from vm.output import OutputBuffer
+
+program = '''
+fun main {
+    --> "before", ' ';
+    int[] big = new int[2000000];
+    --> "after";
+}
+'''
+
+
+class OutputBufferTests(TestCase):
+
+    def test_line_buffered_writes_complete_lines(self):
+        output = io.StringIO()
+        buffer = OutputBuffer(line_buffered=True)
+        with redirect_stdout(output):
+            buffer.write('Fib number of ')
+            buffer.write('10')
+            self.assertEqual('', output.getvalue())
+
+            buffer.write('\n')
+            self.assertEqual('Fib number of 10\n', output.getvalue())
+
+    def test_block_buffered_writes_when_full(self):
+        output = io.StringIO()
+        buffer = OutputBuffer(line_buffered=False, buffer_size=8)
+        with redirect_stdout(output):
+            buffer.write('abc\n')
+            self.assertEqual('', output.getvalue())
+
+            buffer.write('defgh')
+            self.assertEqual('abc\ndefgh', output.getvalue())
+
+            buffer.write('i')
+            buffer.flush()
+            self.assertEqual('abc\ndefghi', output.getvalue())
+
+    def test_output_is_written_before_vm_error(self):
+        output = run_program(program, max_heap_size=1024 * 1024)
+
+        self.assertEqual('before VM error: Out of heap memory\n', output)
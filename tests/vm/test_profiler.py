@@ -0,0 +1,114 @@
+import io
+from contextlib import redirect_stdout
+from unittest import TestCase
+
+from models.instructions import InstructionType
+from tests.vm.helpers import compile_program
+from vm.profiler import OpProfiler, FunctionProfiler, SamplingProfiler
+from vm.vm import VM
+
+program = '''
+fun main {
+    int i = 0;
+    while i < 5 {
+        i = i + 1;
+    }
+    --> i, '\\n';
+}
+'''
+
+recursive_program = '''
+fun fib(int n) => int {
+    if n < 2 {
+        ret n;
+    }
+    ret fib(n - 2) + fib(n - 1);
+}
+
+fun main {
+    --> fib(6), '\\n';
+}
+'''
+
+
+class OutputLines:
+
+    def __init__(self) -> None:
+        self.lines = []
+
+    def out(self, *args):
+        self.lines.extend(args)
+
+
+class OpProfilerTests(TestCase):
+
+    def setUp(self):
+        self.vm = VM(compile_program(program).code)
+        self.profiler = OpProfiler()
+        with redirect_stdout(io.StringIO()) as self.output:
+            self.vm.exec(self.profiler)
+
+    def test_program_runs_the_same(self):
+        self.assertEqual('5\n', self.output.getvalue())
+
+    def test_counts_instructions_by_type(self):
+        counts, times = self.profiler.by_type(self.vm)
+
+        self.assertEqual(5, counts[InstructionType.ADD_INT_CONST])
+        self.assertEqual(1, counts[InstructionType.EXIT])
+        self.assertEqual(set(counts), set(times))
+
+    def test_report_maps_addresses_to_instructions(self):
+        output = OutputLines()
+        self.profiler.report(self.vm, output)
+
+        self.assertTrue(any('ADD_INT_CONST    1' in line for line in output.lines))
+
+
+class FunctionProfilerTests(TestCase):
+
+    def setUp(self):
+        code_writer = compile_program(recursive_program)
+        self.profiler = FunctionProfiler(code_writer.function_names)
+        with redirect_stdout(io.StringIO()) as self.output:
+            VM(code_writer.code).exec(self.profiler)
+
+    def test_counts_calls_of_functions(self):
+        self.assertEqual('8\n', self.output.getvalue())
+        self.assertEqual({'main (test.f12)': 1, 'fib (test.f12)': 25}, dict(self.profiler.calls))
+
+    def test_recursion_is_not_counted_twice_in_inclusive_time(self):
+        main_name = 'main (test.f12)'
+        fib_name = 'fib (test.f12)'
+
+        self.assertLessEqual(self.profiler.inclusive[fib_name], self.profiler.inclusive[main_name])
+        self.assertEqual(self.profiler.inclusive[main_name], sum(self.profiler.exclusive.values()))
+
+    def test_writes_collapsed_stacks(self):
+        output = OutputLines()
+        self.profiler.write_collapsed_stacks(output)
+
+        stacks = [line.rsplit(' ', 1)[0] for line in output.lines]
+        self.assertIn('main (test.f12);fib (test.f12);fib (test.f12)', stacks)
+        self.assertEqual(7, len(stacks))
+
+
+class SamplingProfilerTests(TestCase):
+
+    def test_walks_frames_of_recursive_calls(self):
+        code_writer = compile_program(recursive_program)
+        vm = VM(code_writer.code)
+        profiler = SamplingProfiler(code_writer.function_names, code_writer.source_lines)
+        profiler.attach(vm)
+
+        calls = 0
+        while calls < 3:
+            handler, _ = vm.instructions[vm.ip]
+            if handler == vm.fn_call:
+                calls += 1
+            vm.exec_one()
+        profiler.sample()
+
+        self.assertEqual({'<top level>;main (test.f12);fib (test.f12);fib (test.f12)': 1},
+                         dict(profiler.stacks))
+        self.assertEqual({('test.f12', 2): 1}, dict(profiler.line_samples))
@@ -0,0 +1,95 @@
+import io
+import os
+import tempfile
+from contextlib import redirect_stdout
+from unittest import TestCase
+
+from tests.vm.helpers import compile_program
+from vm.replay import InputRecorder, InputReplayer, read_events, write_events
+from vm.terminal import HeadlessTerminal
+from vm.vm import VM
+
+program = '''
+char[] keys = new char[16];
+
+fun main {
+    int x = 0;
+    int frame = 0;
+    while frame < 4 {
+        int n = get_input(keys);
+        int i = 0;
+        while i < n {
+            put_char_x_y(keys[i], x, 0);
+            x = x + 1;
+            i = i + 1;
+        }
+        frame = frame + 1;
+        sleep(100);
+    }
+    char c = <--;
+    --> x, c, '\\n';
+}
+'''
+
+
+class LinesOutput:
+
+    def __init__(self) -> None:
+        self.lines = []
+
+    def out(self, *args):
+        self.lines.append(''.join(args))
+
+
+def run(code, runner, terminal):
+    output = io.StringIO()
+    with redirect_stdout(output):
+        VM(code, terminal=terminal, clock='virtual').exec(runner)
+    return output.getvalue()
+
+
+class ReplayTests(TestCase):
+
+    def setUp(self):
+        self.code = compile_program(program).code
+        self.recorder = InputRecorder()
+        terminal = HeadlessTerminal(['ab', '', 'c', 'de'])
+        terminal.read_char = lambda: '!'
+        self.output = run(self.code, self.recorder, terminal)
+        self.screen = terminal.lines()
+
+    def test_records_reads_with_instruction_counts(self):
+        self.assertEqual('5!\n', self.output)
+        self.assertEqual(['keys'] * 4 + ['char'], [source for _, source, _ in self.recorder.events])
+        counts = [instruction for instruction, _, _ in self.recorder.events]
+        self.assertEqual(sorted(counts), counts)
+        self.assertEqual(len(set(counts)), len(counts))
+
+    def test_replay_is_identical(self):
+        replayer = InputReplayer(self.recorder.events)
+        terminal = HeadlessTerminal()
+
+        self.assertEqual(self.output, run(self.code, replayer, terminal))
+        self.assertEqual(self.screen, terminal.lines())
+        self.assertEqual(self.recorder.executed, replayer.executed)
+        self.assertEqual([], replayer.diverged)
+
+    def test_events_round_trip_through_file(self):
+        output = LinesOutput()
+        write_events(self.recorder.events, output)
+
+        with tempfile.TemporaryDirectory() as directory:
+            file = os.path.join(directory, 'input.jsonl')
+            with open(file, 'w') as f:
+                f.write('\n'.join(output.lines))
+
+            self.assertEqual(self.recorder.events, read_events(file))
+
+    def test_reports_divergence(self):
+        replayer = InputReplayer(self.recorder.events[1:])
+        output = run(self.code, replayer, HeadlessTerminal())
+
+        self.assertEqual('VM error: Replay diverged from the recorded input at read 3\n', output)
+        self.assertEqual(4, len(replayer.diverged))
+        read, event, (instruction, source) = replayer.diverged[-1]
+        self.assertEqual((3, 'char', 'keys'), (read, event[1], source))
@@ -0,0 +1,62 @@
+import io
+from contextlib import redirect_stdout
+from unittest import TestCase
+
+from blessed import Terminal
+
+from tests.vm.helpers import run_program
+from vm.output import OutputBuffer
+from vm.screen import Screen
+
+program = '''
+fun main {
+    put_char_x_y('a', 0, 0);
+    put_char_x_y('b', 1, 0);
+    present();
+    put_char_x_y('a', 0, 0);
+    put_char_x_y('c', 1, 0);
+    --> '|';
+    put_char_x_y('d', 2, 0);
+}
+'''
+
+
+class ScreenTests(TestCase):
+
+    def setUp(self):
+        self.terminal = Terminal(force_styling=True)
+        self.screen = Screen(self.terminal, OutputBuffer())
+
+    def present(self):
+        output = io.StringIO()
+        with redirect_stdout(output):
+            self.screen.present()
+        return output.getvalue()
+
+    def test_writes_only_changed_cells(self):
+        t = self.terminal
+        for x, char in enumerate('abc'):
+            self.screen.put(x, 1, char)
+        self.screen.put(5, 1, 'd')
+        self.assertEqual(t.save + t.move_xy(0, 1) + 'abc' + t.move_xy(5, 1) + 'd' + t.restore, self.present())
+
+        self.screen.put(1, 1, 'b')
+        self.screen.put(2, 1, 'x')
+        self.assertEqual(t.save + t.move_xy(2, 1) + 'x' + t.restore, self.present())
+
+        self.screen.put(5, 1, 'd')
+        self.assertEqual('', self.present())
+
+    def test_clear_redraws_everything(self):
+        t = self.terminal
+        self.screen.put(0, 0, 'a')
+        self.present()
+
+        self.screen.put(4, 4, 'b')
+        self.screen.clear()
+        self.screen.put(0, 0, 'a')
+        self.assertEqual(t.clear + '\n' + t.save + t.move_xy(0, 0) + 'a' + t.restore, self.present())
+
+    def test_program_output_keeps_order(self):
+        # without a terminal cursor moves are empty, only the written characters are left
+        self.assertEqual('abc|d', run_program(program))
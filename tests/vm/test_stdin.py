@@ -0,0 +1,54 @@
+import io
+from unittest import TestCase
+from unittest.mock import patch
+
+from tests.vm.helpers import run_program
+from vm.terminal import HeadlessTerminal
+
+lines_program = '''
+char[] line = new char[8];
+
+fun main {
+    int n = read_line(line, 8);
+    while n > 0 {
+        --> n, ':';
+        int i = 0;
+        while i < n {
+            --> line[i];
+            i = i + 1;
+        }
+        --> '|';
+        n = read_line(line, 8);
+    }
+}
+'''
+
+chars_program = '''
+char[] buff = new char[4];
+
+fun main {
+    int total = 0;
+    int n = read_chars(buff, 4);
+    while n > 0 {
+        --> n, buff[0], ' ';
+        total = total + n;
+        n = read_chars(buff, 4);
+    }
+    --> total, '\\n';
+}
+'''
+
+
+class BulkStdinTests(TestCase):
+
+    def run_with_stdin(self, program, stdin):
+        with patch('sys.stdin', io.StringIO(stdin)):
+            return run_program(program, terminal=HeadlessTerminal())
+
+    def test_read_line_keeps_line_break_and_splits_long_lines(self):
+        output = self.run_with_stdin(lines_program, 'ab\nlong line\n\nend')
+
+        self.assertEqual('3:ab\n|8:long lin|2:e\n|1:\n|3:end|', output)
+
+    def test_read_chars_returns_count_read(self):
+        self.assertEqual('4a 4e 2i 10\n', self.run_with_stdin(chars_program, 'abcdefghij'))
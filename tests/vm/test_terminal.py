@@ -0,0 +1,55 @@
+import io
+from contextlib import redirect_stdout
+from unittest import TestCase
+
+from tests.vm.helpers import compile_program
+from vm.terminal import HeadlessTerminal
+from vm.vm import VM
+
+program = '''
+char[] keys = new char[16];
+
+fun main {
+    int x = 0;
+    int frame = 0;
+    while frame < 3 {
+        int n = get_input(keys);
+        int i = 0;
+        while i < n {
+            put_char_x_y(keys[i], x, frame);
+            x = x + 1;
+            i = i + 1;
+        }
+        frame = frame + 1;
+    }
+    put_char_x_y('#', 0, 4);
+}
+'''
+
+
+def run_headless(source, input_script):
+    terminal = HeadlessTerminal(input_script)
+    output = io.StringIO()
+    with redirect_stdout(output):
+        VM(compile_program(source).code, terminal=terminal, clock='virtual').exec()
+    return terminal, output.getvalue()
+
+
+class HeadlessTerminalTests(TestCase):
+
+    def test_screen_and_scripted_input(self):
+        terminal, output = run_headless(program, ['ab', '', 'cd'])
+
+        self.assertEqual('', output)
+        self.assertEqual(['ab', '', '  cd', '', '#'], terminal.lines())
+        self.assertEqual(3, terminal.reads)
+        self.assertEqual(2, terminal.frames)
+
+    def test_tetris_runs_headless(self):
+        with open('example_source/tetris/main.f12') as f:
+            source = f.read()
+        terminal, output = run_headless(source, ['a', 'w', 'dd'])
+
+        self.assertIn('You lost', output)
+        self.assertGreater(terminal.reads, 3)
+        self.assertEqual([], terminal.lines())
@@ -0,0 +1,41 @@
+from unittest import TestCase
+
+from tests.vm.helpers import run_program
+
+program = '''
+unit Pair {
+    int a;
+    float b;
+    char c;
+    bool d;
+}
+
+fun combine(int x, float y) => float {
+    float result = y * 2.0 - 0.5;
+    ret result;
+}
+
+fun main {
+    Pair p = new Pair | a: 7, b: 2.5, c: 'z', d: true |;
+    int x = p.a * p.a - 100;
+    int big = 2147483647;
+    --> x, ' ', big + 1, ' ', -7 / 2, ' ', 17 % 5, '\\n';
+    --> combine(x, p.b), ' ', p.c, ' ', p.d, ' ', p.a == 7, ' ', p.b != 2.5, ' ', p.c == 'z', '\\n';
+    --> 1.5 < 2.5, ' ', 3 >= 4, ' ', !p.d, '\\n';
+    free p;
+}
+'''
+
+
+class TypedStackTests(TestCase):
+
+    def test_typed_stack_matches_byte_stack(self):
+        typed_output = run_program(program, typed_stack=True)
+        bytes_output = run_program(program, typed_stack=False)
+
+        self.assertEqual(bytes_output, typed_output)
+
+    def test_int_arithmetic_wraps_around_four_bytes(self):
+        output = run_program(program, typed_stack=True)
+
+        self.assertEqual('-51 -2147483648 -3 2\n4.5 z True True False True\nTrue False False\n', output)
@@ -40,6 +40,77 @@ def select_to_bytes_func(type_):
     raise TypeError(f'There is no to bytes function for: {type_}')
 
 
+def select_pack_into_func(type_):
+    if type_ is Int or type_ is String:
+        return int_pack_into
+    if type_ is Bool:
+        return bool_pack_into
+    if type_ is Float:
+        return float_pack_into
+    if type_ is Char:
+        return char_pack_into
+    raise TypeError(f'There is no pack into function for: {type_}')
+
+
+def select_unpack_from_func(type_):
+    if type_ is Int or type_ is String:
+        return int_unpack_from
+    if type_ is Bool:
+        return bool_unpack_from
+    if type_ is Float:
+        return float_unpack_from
+    if type_ is Char:
+        return char_unpack_from
+    raise TypeError(f'There is no unpack from function for: {type_}')
+
+
+int_struct = struct.Struct(('>' if sizes.int_order == 'big' else '<') + 'i')
+float_struct = struct.Struct(f'<{sizes.float_type}')
+byte_struct = struct.Struct('b')
+# chars are single bytes, unsigned so bytes of mapped files above 0x7F are chars too
+char_struct = struct.Struct('B')
+
+
+def int_pack_into(buffer, offset, value: int):
+    int_struct.pack_into(buffer, offset, value)
+
+
+def int_unpack_from(buffer, offset):
+    return int_struct.unpack_from(buffer, offset)[0]
+
+
+def float_pack_into(buffer, offset, value: float):
+    float_struct.pack_into(buffer, offset, value)
+
+
+def float_unpack_from(buffer, offset):
+    return float_struct.unpack_from(buffer, offset)[0]
+
+
+def bool_pack_into(buffer, offset, value: bool):
+    byte_struct.pack_into(buffer, offset, 1 if value else 0)
+
+
+def bool_unpack_from(buffer, offset):
+    return byte_struct.unpack_from(buffer, offset)[0] == 1
+
+
+def char_pack_into(buffer, offset, char):
+    char_struct.pack_into(buffer, offset, ord(char))
+
+
+def char_unpack_from(buffer, offset):
+    return chr(char_struct.unpack_from(buffer, offset)[0])
+
+
+def wrap_int(value: int, size=sizes.int):
+    """
+    Wraps the value around to a signed integer of the given size in bytes
+    """
+    half_range = 1 << (size * 8 - 1)
+    return ((value + half_range) & ((half_range << 1) - 1)) - half_range
+
+
 def int_to_bytes(value: int, size=sizes.int, order=sizes.int_order):
     return list(value.to_bytes(size, order, signed=True))
 
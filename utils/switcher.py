@@ -92,6 +92,12 @@ class FasterSwitcher:
         return self
 
     def exec(self, ctx, value):
+        action = self.find(value)
+        if action is not None:
+            return action(ctx)
+        return None
+
+    def find(self, value) -> Union[Action, None]:
         if isinstance(value, int):
             str_int = str(value)
             if len(str_int) == 1:
@@ -99,7 +105,7 @@ class FasterSwitcher:
             else:
                 action = self.__others_cases.get(value, None)
             if action is not None:
-                return action(ctx)
+                return action
 
         if isinstance(value, str) and len(value) == 1:
             action = self.__ascii_actions[ord(value)]
@@ -107,12 +113,9 @@ class FasterSwitcher:
             action = self.__others_cases.get(value, None)
 
         if action is not None:
-            return action(ctx)
+            return action
 
-        if self.__default is not None:
-            return self.__default(ctx)
-            
-        return None
+        return self.__default
 
     @staticmethod
     def from_dict(cases: Dict[Iterable, Action], default: Action = None):
@@ -0,0 +1,43 @@
+import time
+
+
+class RealClock:
+    """
+    Paces frames of the program. Every sleep waits until ms after the end of the previous sleep, so the time
+    the program spent in between is subtracted and frames have a steady length. A program which falls behind
+    by more than a frame starts pacing again from the current time instead of catching up
+    """
+
+    def __init__(self, timer=time.perf_counter, wait=time.sleep) -> None:
+        self.timer = timer
+        self.wait = wait
+        # time in seconds when the current frame ends
+        self.deadline = None
+
+    def sleep(self, ms):
+        now = self.timer()
+        duration = max(ms, 0) / 1000
+        if self.deadline is None or now - self.deadline > duration:
+            self.deadline = now
+        self.deadline += duration
+
+        if self.deadline > now:
+            self.wait(self.deadline - now)
+
+
+class VirtualClock:
+    """
+    Simulated time which sleeps advance instantly, runs are fast and do not depend on the machine
+    """
+
+    def __init__(self) -> None:
+        self.now_ms = 0
+
+    def sleep(self, ms):
+        self.now_ms += max(ms, 0)
+
+
+clocks = {
+    'real': RealClock,
+    'virtual': VirtualClock,
+}
@@ -0,0 +1,59 @@
+import utils.bytes_utils as codec
+from models.instructions import InstructionType, instructions_by_op_code
+
+
+class DecodedCode:
+    """
+    Code segment decoded once at load time. Every entry is a tuple of (op_code, instruction, operands),
+    code addresses inside operands are rewritten to entry indices
+    """
+
+    def __init__(self, entries, offsets) -> None:
+        self.entries = entries
+        # byte offset in the code segment of every entry
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.entries)
+
+
+def decode(code):
+    entries = []
+    offsets = []
+    index_by_offset = {}
+
+    offset = 0
+    while offset < len(code):
+        index_by_offset[offset] = len(entries)
+        offsets.append(offset)
+
+        op_code, offset = codec.op_code_from_bytes(code, offset)
+        instr = instructions_by_op_code.get(op_code)
+        if instr is None:
+            # length of the unknown instruction is not known, so nothing after it can be decoded
+            entries.append((op_code, None, []))
+            break
+
+        if instr.type == InstructionType.MARKER_STATIC_START:
+            entries.append((op_code, instr, []))
+            break
+
+        ops, offset = instr.decode_ops(code, offset)
+        entries.append((op_code, instr, ops))
+    else:
+        # running past the last instruction hits zeroed memory
+        index_by_offset[offset] = len(entries)
+        offsets.append(offset)
+        entries.append((0, None, []))
+
+    for _, instr, ops in entries:
+        if instr is None or instr.address_op is None:
+            continue
+
+        address = ops[instr.address_op]
+        index = index_by_offset.get(address)
+        if index is None:
+            raise ValueError(f'Address {address} of {instr.type} does not point to an instruction')
+        ops[instr.address_op] = index
+
+    return DecodedCode(entries, offsets)
@@ -0,0 +1,72 @@
+import mmap
+import os
+from bisect import bisect_right
+
+from vm.heap import max_address
+
+# files are mapped to addresses from here up, memory of the VM never grows this far
+mapped_files_start = 1 << 30
+# gap after every file, so reading past the end of one file does not read the next one
+file_gap = 8
+
+
+class MappedFiles:
+    """
+    Read-only files mapped into the address space of the VM above its memory. Every file gets its own range
+    of addresses, programs read it as a char[] and the file is not copied into the heap
+    """
+
+    def __init__(self, start=mapped_files_start) -> None:
+        self.start = start
+        self.next_address = start
+        # sorted start addresses of files and their mappings
+        self.starts = []
+        self.mappings = []
+
+    def map(self, path):
+        """
+        Returns address of the mapped file, raises OSError when the file can not be mapped
+        """
+        with open(path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if self.next_address + size > max_address:
+                raise OSError(f'There are no free addresses for {size} bytes')
+            # empty files can not be mapped, there is nothing to read from them anyway
+            mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+
+        address = self.next_address
+        self.next_address += -(-(size + file_gap) // file_gap) * file_gap
+        self.starts.append(address)
+        self.mappings.append(mapping)
+        return address
+
+    def find(self, address):
+        i = bisect_right(self.starts, address) - 1
+        if i < 0 or self.mappings[i] is None:
+            return None, None
+        return self.starts[i], self.mappings[i]
+
+    def read(self, address, size):
+        """
+        Bytes of a file at address, None when they are not all inside one mapped file
+        """
+        start, mapping = self.find(address)
+        if mapping is None:
+            return None
+
+        bytes_ = mapping[address - start:address - start + size]
+        return bytes_ if len(bytes_) == size else None
+
+    def unmap(self, address):
+        """
+        Unmaps the file starting at address, returns False if no file starts there
+        """
+        i = bisect_right(self.starts, address) - 1
+        if i < 0 or self.starts[i] != address or self.mappings[i] is None:
+            return False
+
+        if isinstance(self.mappings[i], mmap.mmap):
+            self.mappings[i].close()
+        # addresses are not reused, a dangling char[] of an unmapped file can not read another file
+        self.mappings[i] = None
+        return True
@@ -0,0 +1,475 @@
+from models import types
+from utils import sizes
+import utils.bytes_utils as codec
+
+block_metadata_size = 2 * sizes.int
+# addresses are stored as Int, memory never grows past the largest one
+max_address = (1 << 8 * sizes.int - 1) - 1
+# heap grows in multiples of it, so segregated blocks stay aligned
+growth_alignment = 8
+
+
+class Heap:
+    """
+    Counters shared by allocators, free blocks are read from the block metadata when stats are requested
+    """
+
+    def __init__(self, vm, start, size, max_size=None) -> None:
+        self.vm = vm
+        self.start = start
+        self.size = size
+        self.max_size = min(max_size or max_address, max_address - start)
+        self.growths = 0
+        self.allocations = 0
+        self.frees = 0
+        # data bytes of allocated blocks
+        self.live_bytes = 0
+        self.peak_bytes = 0
+        # free blocks inspected to find a fitting one, summed over all allocations
+        self.walked_blocks = 0
+
+    def free_block_sizes(self):
+        """
+        Data sizes of all free blocks
+        """
+        raise NotImplementedError(f'Free blocks are not implemented for {self.__class__}')
+
+    def grow(self, required_size):
+        """
+        Maps more memory right after the heap, at least doubling it. Addresses are offsets into the VM memory,
+        so pointers held by the program stay valid. Returns start and size of the added region or None
+        """
+        required_size = -(-required_size // growth_alignment) * growth_alignment
+        size = min(max(required_size, self.size), self.max_size - self.size) // growth_alignment * growth_alignment
+        if size < required_size:
+            return None
+
+        region_start = self.start + self.size
+        self.vm.grow_memory(size)
+        self.size += size
+        self.growths += 1
+        return region_start, size
+
+    def count_allocation(self, data_size, walked_blocks):
+        self.allocations += 1
+        self.walked_blocks += walked_blocks
+        self.live_bytes += data_size
+        self.peak_bytes = max(self.peak_bytes, self.live_bytes)
+
+    def count_free(self, data_size):
+        self.frees += 1
+        self.live_bytes -= data_size
+
+    def stats(self):
+        free_sizes = list(self.free_block_sizes())
+        free_bytes = sum(free_sizes)
+        largest_free_block = max(free_sizes, default=0)
+
+        # free blocks by the power of two range of their size
+        histogram = {}
+        for size in sorted(free_sizes):
+            bits = size.bit_length()
+            bucket = f'{1 << bits >> 1}-{(1 << bits) - 1}' if bits else '0'
+            histogram[bucket] = histogram.get(bucket, 0) + 1
+
+        return {
+            'allocator': self.__class__.__name__,
+            'heap_size': self.size,
+            'growths': self.growths,
+            'live_bytes': self.live_bytes,
+            'peak_bytes': self.peak_bytes,
+            'allocations': self.allocations,
+            'frees': self.frees,
+            'free_bytes': free_bytes,
+            'free_blocks': len(free_sizes),
+            'free_block_histogram': histogram,
+            'largest_free_block': largest_free_block,
+            # share of free memory which cannot serve an allocation as big as the largest free block
+            'external_fragmentation': 1 - largest_free_block / free_bytes if free_bytes else 0,
+            'average_walk_length': self.walked_blocks / self.allocations if self.allocations else 0,
+        }
+
+
+class FirstFitHeap(Heap):
+    """
+    Single free list sorted by address. Every block starts with its data size and the address of the next
+    free block, the list ends with the largest address, which stays the same when the heap grows
+    """
+
+    def __init__(self, vm, start, size, max_size=None) -> None:
+        super().__init__(vm, start, size, max_size)
+        # leftmost free block
+        self.hp = start
+        self.heap_end_address = max_address
+
+    def init_heap(self):
+        self.set_block_data_size(self.hp, self.size - block_metadata_size)
+        self.set_block_next_address(self.hp, self.heap_end_address)
+
+    def allocate(self, required_data_size):
+        address = self.memory_allocate(self.hp, required_data_size)
+        if address is None and self.grow_heap(required_data_size):
+            address = self.memory_allocate(self.hp, required_data_size)
+        if address is None:
+            self.vm.error('Out of heap memory')
+        return address
+
+    def grow_heap(self, required_data_size):
+        region = self.grow(required_data_size + block_metadata_size)
+        if region is None:
+            return False
+
+        # added region is freed as a single block, so it is merged with the last free block of the heap
+        block, size = region
+        self.set_block_data_size(block, size - block_metadata_size)
+        self.set_block_next_address(block, self.heap_end_address)
+        self.memory_free(block)
+        return True
+
+    def free(self, data_address):
+        block_address = data_address - block_metadata_size
+        self.count_free(self.get_block_data_size(block_address))
+        self.memory_free(block_address)
+
+    def free_block_sizes(self):
+        block = self.hp
+        while block != self.heap_end_address:
+            yield self.get_block_data_size(block)
+            block = self.get_block_next_address(block)
+
+    def memory_allocate(self, leftmost_free_block, required_data_size):
+        heap_end_address = self.heap_end_address
+
+        # If leftmost free block address is at the end of the heap - Out of memory
+        if leftmost_free_block == heap_end_address:
+            return None
+
+        # find block with enough space
+        big_enough_block = leftmost_free_block
+        available_memory = self.get_block_data_size(big_enough_block)
+        previous_blocks = [big_enough_block]
+        while available_memory < required_data_size:
+            big_enough_block = self.get_block_next_address(big_enough_block)
+            if big_enough_block == heap_end_address:
+                return None
+            available_memory = self.get_block_data_size(big_enough_block)
+            previous_blocks.append(big_enough_block)
+
+        previous_free_block = previous_blocks[-2] if len(previous_blocks) >= 2 else None
+
+        memory_to_allocate = available_memory
+        leftover_block = heap_end_address
+        leftover_block_data_size = 0
+        leftover_block_next_block = self.get_block_next_address(big_enough_block)
+
+        # check if another block can be created from leftover memory
+        leftover_memory = available_memory - required_data_size
+        if leftover_memory > block_metadata_size:
+            leftover_block = big_enough_block + block_metadata_size + required_data_size
+            leftover_block_data_size = leftover_memory - block_metadata_size
+            memory_to_allocate = required_data_size
+
+        # create block from leftover memory
+        if leftover_block != heap_end_address:
+            self.set_block_data_size(leftover_block, leftover_block_data_size)
+            self.set_block_next_address(leftover_block, leftover_block_next_block)
+
+        # find next free block
+        next_free_block = leftover_block
+        if next_free_block == heap_end_address:
+            next_free_block = leftover_block_next_block
+
+        # if there is no previous block, it means we used the first free block
+        if previous_free_block:
+            self.set_block_next_address(previous_free_block, next_free_block)
+
+        # if leftmost block is consumed, move heap pointer
+        if self.hp == big_enough_block:
+            self.hp = next_free_block
+
+        # set the allocated size of the current block
+        self.set_block_data_size(big_enough_block, memory_to_allocate)
+        self.set_block_next_address(big_enough_block, heap_end_address)
+
+        self.count_allocation(memory_to_allocate, len(previous_blocks))
+
+        # address of allocated block data section
+        return big_enough_block + block_metadata_size
+
+    def memory_free(self, block_address):
+        heap_end_address = self.heap_end_address
+        leftmost_free_block_address = self.hp
+
+        # check if freed block is the leftmost
+        if block_address < leftmost_free_block_address:
+            # check if the last leftmost available block is adjacent from the right to the freed one
+            if self.get_used_block_adjacent_address(block_address) == leftmost_free_block_address:  # [1]
+                self.merge_from_right(block_address, leftmost_free_block_address)
+            else:  # [2]
+                self.set_block_next_address(block_address, leftmost_free_block_address)
+            self.hp = block_address
+        else:
+            # find nearest free block from the left
+            free_block_from_left = leftmost_free_block_address
+            while True:
+                address = self.get_block_next_address(free_block_from_left)
+                if address < block_address:
+                    free_block_from_left = address
+                else:
+                    break
+            free_block_from_right = self.get_block_next_address(free_block_from_left)
+
+            if free_block_from_left != heap_end_address \
+                    and self.get_used_block_adjacent_address(free_block_from_left) == block_address:
+                self.merge_from_right(free_block_from_left, block_address)
+                block_address = free_block_from_left
+            elif free_block_from_left != heap_end_address:
+                self.set_block_next_address(free_block_from_left, block_address)
+
+            if free_block_from_right != heap_end_address \
+                    and self.get_used_block_adjacent_address(block_address) == free_block_from_right:
+                self.merge_from_right(block_address, free_block_from_right)
+            elif free_block_from_right != heap_end_address:
+                self.set_block_next_address(block_address, free_block_from_right)
+
+    def merge_from_right(self, block, right_block):
+        right_block_size = self.get_free_block_size(right_block)
+        combined_data_size = self.get_block_data_size(block) + right_block_size
+
+        block_next_address = self.get_block_next_address(block)
+        right_block_next_address = self.get_block_next_address(right_block)
+
+        [lower_address, higher_address] = sorted([block_next_address, right_block_next_address])
+        adjacent_block = block + block_metadata_size + combined_data_size
+
+        if adjacent_block <= lower_address:
+            next_address = lower_address
+        else:
+            next_address = higher_address
+
+        self.set_block_data_size(block, combined_data_size)
+        self.set_block_next_address(block, next_address)
+
+    def get_free_block_size(self, block_address):
+        return self.get_block_data_size(block_address) + block_metadata_size
+
+    def get_block_data_size(self, block_address):
+        return self.vm.get_value(block_address, types.Int)
+
+    def set_block_data_size(self, block_address, data_size):
+        self.vm.set_value(block_address, data_size)
+
+    def get_used_block_adjacent_address(self, block_address):
+        return block_address + block_metadata_size + self.get_block_data_size(block_address)
+
+    def get_free_block_adjacent_address(self, block_address):
+        return block_address + block_metadata_size + self.get_block_data_size(block_address)
+
+    def get_block_next_address(self, block_address):
+        return self.vm.get_value(block_address + sizes.int, types.Int)
+
+    def set_block_next_address(self, block_address, next_block_address):
+        self.vm.set_value(block_address + sizes.int, next_block_address)
+
+
+tag_size = sizes.int
+alignment = 8
+min_block_size = 4 * tag_size
+# classes of exact block sizes up to this size, classes of power of two ranges above it
+max_exact_size = 512
+exact_classes = max_exact_size // alignment + 1
+no_block = -1
+
+allocated_bit = 1
+previous_allocated_bit = 2
+
+
+class SegregatedHeap(Heap):
+    """
+    Free blocks are kept in separate lists by size class, so a fitting block is found without walking
+    the heap. Every block starts with a header tag holding the block size and two flags, whether the block
+    and the block right before it are allocated. Free blocks also hold next and previous free block of
+    their list and end with a footer tag holding the size, so neighbours are coalesced in constant time.
+
+    | header | data ...                         |   allocated block
+    | header | next | previous | ...  | footer |   free block
+    """
+
+    def __init__(self, vm, start, size, max_size=None) -> None:
+        super().__init__(vm, start, size, max_size)
+        # last tag of the heap is a zero sized allocated block, it stops coalescing to the right
+        self.epilogue = start + size - tag_size
+        # first free block of every size class
+        self.heads = []
+        # bit of every size class which has free blocks
+        self.nonempty_classes = 0
+
+    def init_heap(self):
+        size = (self.epilogue - self.start) // alignment * alignment
+        self.epilogue = self.start + size
+        self.set_tag(self.epilogue, 0 | allocated_bit)
+
+        self.heads = [no_block] * (exact_classes + 32)
+        self.nonempty_classes = 0
+        self.add_free_block(self.start, size, previous_allocated_bit)
+
+    def allocate(self, required_data_size):
+        block_size = max(min_block_size, -(-(required_data_size + tag_size) // alignment) * alignment)
+        block, walked_blocks = self.find_free_block(block_size)
+        if block == no_block and self.grow_heap(block_size):
+            block, walked_blocks = self.find_free_block(block_size)
+        if block == no_block:
+            self.vm.error('Out of heap memory')
+            return None
+
+        self.remove_free_block(block)
+        available_size = self.get_size(block)
+        previous_flag = self.get_tag(block) & previous_allocated_bit
+
+        leftover_size = available_size - block_size
+        if leftover_size >= min_block_size:
+            self.set_tag(block, block_size | previous_flag | allocated_bit)
+            self.add_free_block(block + block_size, leftover_size, previous_allocated_bit)
+        else:
+            self.set_tag(block, available_size | previous_flag | allocated_bit)
+            next_block = block + available_size
+            self.set_tag(next_block, self.get_tag(next_block) | previous_allocated_bit)
+
+        self.count_allocation(self.get_size(block) - tag_size, walked_blocks)
+
+        # links of the free list are not left in the data, untouched memory reads as zeros as with first fit
+        self.set_next(block, 0)
+        self.set_previous(block, 0)
+        return block + tag_size
+
+    def free(self, data_address):
+        block = data_address - tag_size
+        tag = self.get_tag(block)
+        if not tag & allocated_bit:
+            self.vm.error(f'Memory at address {data_address} is not allocated')
+            return
+
+        size = tag & ~(alignment - 1)
+        previous_flag = tag & previous_allocated_bit
+        self.count_free(size - tag_size)
+
+        next_block = block + size
+        next_tag = self.get_tag(next_block)
+        if not next_tag & allocated_bit:
+            self.remove_free_block(next_block)
+            size += next_tag & ~(alignment - 1)
+
+        if not previous_flag:
+            previous_block = block - self.get_tag(block - tag_size)
+            self.remove_free_block(previous_block)
+            size += block - previous_block
+            block = previous_block
+            previous_flag = self.get_tag(block) & previous_allocated_bit
+
+        self.add_free_block(block, size, previous_flag)
+
+    def grow_heap(self, block_size):
+        # epilogue tag becomes the header of the added block, a new epilogue closes the grown heap
+        if self.grow(block_size + alignment + tag_size) is None:
+            return False
+
+        block = self.epilogue
+        size = (self.start + self.size - tag_size - block) // alignment * alignment
+        self.epilogue = block + size
+        self.set_tag(self.epilogue, 0 | allocated_bit)
+
+        previous_flag = self.get_tag(block) & previous_allocated_bit
+        if not previous_flag:
+            previous_block = block - self.get_tag(block - tag_size)
+            self.remove_free_block(previous_block)
+            size += block - previous_block
+            block = previous_block
+            previous_flag = self.get_tag(block) & previous_allocated_bit
+
+        self.add_free_block(block, size, previous_flag)
+        return True
+
+    def free_block_sizes(self):
+        for head in self.heads:
+            block = head
+            while block != no_block:
+                yield self.get_size(block) - tag_size
+                block = self.get_next(block)
+
+    def find_free_block(self, block_size):
+        size_class = self.size_class(block_size)
+        # blocks of a range class might be smaller than needed, any block of a bigger class fits
+        first_class = size_class if size_class < exact_classes else size_class + 1
+
+        candidates = self.nonempty_classes >> first_class
+        if candidates:
+            return self.heads[first_class + (candidates & -candidates).bit_length() - 1], 1
+
+        block = self.heads[size_class]
+        walked_blocks = 0
+        while block != no_block and self.get_size(block) < block_size:
+            block = self.get_next(block)
+            walked_blocks += 1
+        return block, walked_blocks + 1
+
+    @staticmethod
+    def size_class(block_size):
+        if block_size <= max_exact_size:
+            return block_size // alignment
+        return exact_classes + block_size.bit_length() - max_exact_size.bit_length()
+
+    def add_free_block(self, block, size, previous_flag):
+        self.set_tag(block, size | previous_flag)
+        self.set_tag(block + size - tag_size, size)
+        next_block = block + size
+        self.set_tag(next_block, self.get_tag(next_block) & ~previous_allocated_bit)
+
+        size_class = self.size_class(size)
+        head = self.heads[size_class]
+        self.set_next(block, head)
+        self.set_previous(block, no_block)
+        if head != no_block:
+            self.set_previous(head, block)
+        self.heads[size_class] = block
+        self.nonempty_classes |= 1 << size_class
+
+    def remove_free_block(self, block):
+        next_block = self.get_next(block)
+        previous_block = self.get_previous(block)
+        if previous_block != no_block:
+            self.set_next(previous_block, next_block)
+        else:
+            size_class = self.size_class(self.get_size(block))
+            self.heads[size_class] = next_block
+            if next_block == no_block:
+                self.nonempty_classes &= ~(1 << size_class)
+
+        if next_block != no_block:
+            self.set_previous(next_block, previous_block)
+
+    def get_size(self, block):
+        return self.get_tag(block) & ~(alignment - 1)
+
+    def get_tag(self, address):
+        return codec.int_unpack_from(self.vm.memory, address)
+
+    def set_tag(self, address, value):
+        codec.int_pack_into(self.vm.memory, address, value)
+
+    def get_next(self, block):
+        return codec.int_unpack_from(self.vm.memory, block + tag_size)
+
+    def set_next(self, block, next_block):
+        codec.int_pack_into(self.vm.memory, block + tag_size, next_block)
+
+    def get_previous(self, block):
+        return codec.int_unpack_from(self.vm.memory, block + 2 * tag_size)
+
+    def set_previous(self, block, previous_block):
+        codec.int_pack_into(self.vm.memory, block + 2 * tag_size, previous_block)
+
+
+allocators = {
+    'first_fit': FirstFitHeap,
+    'segregated': SegregatedHeap,
+}
@@ -0,0 +1,35 @@
+from contextlib import ExitStack
+
+
+class Keyboard:
+    """
+    Reads keys pressed while the program runs. The terminal is switched to cbreak mode on the first read and
+    stays in it until the keyboard is closed, so reading keys every frame does not change terminal modes.
+    Keys pressed in between wait in the input queue of the terminal and are drained at once
+    """
+
+    def __init__(self, terminal) -> None:
+        self.terminal = terminal
+        self.modes = ExitStack()
+        self.active = False
+
+    def read_keys(self):
+        """
+        Characters of all keys pressed since the last read, keys without an ASCII character like arrows are skipped
+        """
+        if not self.active:
+            self.modes.enter_context(self.terminal.cbreak())
+            self.active = True
+
+        chars = []
+        inkey = self.terminal.inkey
+        key = inkey(timeout=0)
+        while key:
+            if len(key) == 1 and key < '\x80':
+                chars.append(str(key))
+            key = inkey(timeout=0)
+        return ''.join(chars)
+
+    def close(self):
+        self.modes.close()
+        self.active = False
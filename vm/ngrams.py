@@ -0,0 +1,76 @@
+import io
+from argparse import ArgumentParser
+from collections import Counter
+from contextlib import redirect_stdout
+
+from codegen.compilation import compile_source
+from vm.decoder import decode
+from vm.terminal import HeadlessTerminal, read_input_script
+from vm.vm import VM
+
+
+def instruction_types(decoded):
+    return [str(instr.type) if instr is not None else f'0x{op_code:x}' for op_code, instr, _ in decoded.entries]
+
+
+def static_ngrams(code, n):
+    """
+    Counts sequences of N instructions as they are laid out in the code segment
+    """
+    types_ = instruction_types(decode(code))
+    return Counter(tuple(types_[i:i + n]) for i in range(len(types_) - n + 1))
+
+
+def dynamic_ngrams(code, n, max_steps, input_script=()):
+    """
+    Counts sequences of N instructions as they are executed, stops after max_steps instructions.
+    The program reads keys from input_script and sleeps on the virtual clock, so counts are reproducible
+    """
+    counts = Counter()
+    vm = VM(code, terminal=HeadlessTerminal(input_script), clock='virtual')
+    types_ = instruction_types(decode(code))
+
+    window = ()
+    steps = 0
+    with redirect_stdout(io.StringIO()):
+        while vm.running and steps < max_steps:
+            window = (window + (types_[vm.ip],))[-n:]
+            vm.exec_one()
+            steps += 1
+            if len(window) == n:
+                counts[window] += 1
+    return counts, steps
+
+
+def print_ngrams(title, counts, top):
+    total = sum(counts.values())
+    print(f'{title} ({total} total)')
+    for ngram, count in counts.most_common(top):
+        print('{:8d} {:6.2f}%  {:s}'.format(count, 100 * count / total, ' / '.join(ngram)))
+    print()
+
+
+if __name__ == '__main__':
+    arg_parser = ArgumentParser(description='Op code n-gram frequencies of F12 programs')
+    arg_parser.add_argument('files', nargs='+')
+    arg_parser.add_argument('-n', type=int, nargs='+', default=[2, 3, 4], help='n-gram lengths')
+    arg_parser.add_argument('--top', type=int, default=15)
+    arg_parser.add_argument('--steps', type=int, default=1_000_000, help='executed instructions per program')
+    arg_parser.add_argument('--input-script', metavar='FILE',
+                            help='keys returned by every get_input call, one line per call')
+    arg_parser.add_argument('--superinstructions', action='store_true', help='count with superinstructions emitted')
+    args = arg_parser.parse_args()
+    input_script = read_input_script(args.input_script) if args.input_script else ()
+
+    for file in args.files:
+        with open(file) as f:
+            with redirect_stdout(io.StringIO()):
+                code_writer = compile_source(f.read(), file, superinstructions=args.superinstructions)
+        if code_writer is None:
+            print(f'{file}: compilation failed')
+            continue
+
+        for n in args.n:
+            print_ngrams(f'{file}: static {n}-grams', static_ngrams(code_writer.code, n), args.top)
+            counts, steps = dynamic_ngrams(code_writer.code, n, args.steps, input_script)
+            print_ngrams(f'{file}: executed {n}-grams in {steps} steps', counts, args.top)
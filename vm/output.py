@@ -0,0 +1,30 @@
+import sys
+
+default_buffer_size = 64 * 1024
+
+
+class OutputBuffer:
+    """
+    Collects text written by the program and writes it to stdout in chunks. On a terminal every
+    complete line is written right away, otherwise text is written once buffer_size characters are collected.
+    Stdout is looked up when writing, so the buffer follows redirections made after the VM is created
+    """
+
+    def __init__(self, line_buffered=None, buffer_size=default_buffer_size) -> None:
+        self.line_buffered = sys.stdout.isatty() if line_buffered is None else line_buffered
+        self.buffer_size = buffer_size
+        self.parts = []
+        self.size = 0
+
+    def write(self, text):
+        self.parts.append(text)
+        self.size += len(text)
+        if self.size >= self.buffer_size or self.line_buffered and '\n' in text:
+            self.flush()
+
+    def flush(self):
+        if self.parts:
+            sys.stdout.write(''.join(self.parts))
+            self.parts = []
+            self.size = 0
+        sys.stdout.flush()
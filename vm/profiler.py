@@ -0,0 +1,273 @@
+import signal
+import threading
+from bisect import bisect_right
+from collections import defaultdict
+from time import perf_counter_ns, sleep
+
+import utils.bytes_utils as codec
+from codegen.code_writer import format_instruction, instruction_header
+from models.instructions import InstructionType as IType, instructions_by_op_code
+from vm.vm import pointer_size
+
+
+class OpProfiler:
+    """
+    Counts executed instructions and their wall time per instruction address.
+    Runs its own dispatch loop, so VM.exec does not pay anything when profiling is off
+    """
+
+    def __init__(self, top=30) -> None:
+        self.top = top
+        # indexed by the entry of decoded instructions
+        self.counts = []
+        self.times = []
+
+    def exec(self, vm):
+        instructions = vm.instructions
+        counts = self.counts = [0] * len(instructions)
+        times = self.times = [0] * len(instructions)
+        clock = perf_counter_ns
+
+        with vm.terminal_session():
+            while vm.running:
+                ip = vm.ip
+                handler, ops = instructions[ip]
+                vm.ip = ip + 1
+                start = clock()
+                handler(*ops)
+                times[ip] += clock() - start
+                counts[ip] += 1
+
+    def executed(self):
+        return [i for i, count in enumerate(self.counts) if count]
+
+    def by_type(self, vm):
+        counts = defaultdict(int)
+        times = defaultdict(int)
+        for i in self.executed():
+            op_code, _ = codec.op_code_from_bytes(vm.memory, vm.code_offsets[i])
+            instr_type = instructions_by_op_code[op_code].type
+            counts[instr_type] += self.counts[i]
+            times[instr_type] += self.times[i]
+        return counts, times
+
+    def report(self, vm, output):
+        total_time = sum(self.times) or 1
+        row = '{:>10d} {:>12.3f} {:>7.2f}%  {:s}'
+        header = '{:>10s} {:>12s} {:>8s}  {:s}'
+
+        counts, times = self.by_type(vm)
+        output.out(f'Executed {sum(self.counts)} instructions in {total_time / 1e6:.3f} ms\n')
+        output.out(header.format('Count', 'Time ms', 'Time', 'Instruction'))
+        for instr_type in sorted(times, key=times.get, reverse=True):
+            time = times[instr_type]
+            output.out(row.format(counts[instr_type], time / 1e6, 100 * time / total_time, str(instr_type)))
+
+        output.out(f'\nTop {self.top} instructions by time\n')
+        output.out(header.format('Count', 'Time ms', 'Time', instruction_header))
+        for i in sorted(self.executed(), key=self.times.__getitem__, reverse=True)[:self.top]:
+            line, _ = format_instruction(vm.memory, vm.code_offsets[i])
+            output.out(row.format(self.counts[i], self.times[i] / 1e6, 100 * self.times[i] / total_time, line))
+
+
+class FunctionProfiler:
+    """
+    Measures calls, inclusive and exclusive time of F12 functions. FN_CALL, RET and RET_VALUE entries
+    are wrapped for the run, every other instruction is dispatched as usual
+    """
+
+    def __init__(self, function_names) -> None:
+        # code offset of function start -> function name
+        self.function_names = function_names
+        self.calls = defaultdict(int)
+        self.inclusive = defaultdict(int)
+        self.exclusive = defaultdict(int)
+        # time spent in every call stack, ';' separated function names -> ns
+        self.stacks = defaultdict(int)
+        # frames of active calls: [name, start time, time spent in callees]
+        self.frames = []
+        # number of active calls of every function, so recursion is not counted twice in inclusive time
+        self.active = defaultdict(int)
+
+    def exec(self, vm):
+        index_by_offset = {offset: i for i, offset in enumerate(vm.code_offsets)}
+        names_by_index = {index_by_offset[offset]: name for offset, name in self.function_names.items()}
+        call_types = {IType.FN_CALL: self.wrap_call, IType.RET: self.wrap_ret, IType.RET_VALUE: self.wrap_ret}
+
+        instructions = []
+        for i, (handler, ops) in enumerate(vm.instructions):
+            op_code, _ = codec.op_code_from_bytes(vm.memory, vm.code_offsets[i])
+            instr = instructions_by_op_code.get(op_code)
+            wrap = call_types.get(instr.type) if instr is not None else None
+            instructions.append((wrap(handler, names_by_index) if wrap else handler, ops))
+
+        try:
+            with vm.terminal_session():
+                while vm.running:
+                    handler, ops = instructions[vm.ip]
+                    vm.ip += 1
+                    handler(*ops)
+        finally:
+            while self.frames:
+                self.leave()
+
+    def wrap_call(self, handler, names_by_index):
+        def call(target, args_offset):
+            handler(target, args_offset)
+            self.enter(names_by_index.get(target, f'<instruction {target}>'))
+        return call
+
+    def wrap_ret(self, handler, names_by_index):
+        def ret(*ops):
+            handler(*ops)
+            self.leave()
+        return ret
+
+    def enter(self, name):
+        self.calls[name] += 1
+        self.active[name] += 1
+        self.frames.append([name, perf_counter_ns(), 0])
+
+    def leave(self):
+        end = perf_counter_ns()
+        name, start, callees_time = self.frames.pop()
+        elapsed = end - start
+
+        self.active[name] -= 1
+        if self.active[name] == 0:
+            self.inclusive[name] += elapsed
+        self.exclusive[name] += elapsed - callees_time
+        self.stacks[';'.join([frame[0] for frame in self.frames] + [name])] += elapsed - callees_time
+
+        if self.frames:
+            self.frames[-1][2] += elapsed
+
+    def report(self, output):
+        total_time = sum(self.exclusive.values()) or 1
+        output.out('{:>10s} {:>14s} {:>14s} {:>8s}  {:s}'.format(
+            'Calls', 'Inclusive ms', 'Exclusive ms', 'Excl', 'Function'))
+        for name in sorted(self.exclusive, key=self.exclusive.get, reverse=True):
+            output.out('{:>10d} {:>14.3f} {:>14.3f} {:>7.2f}%  {:s}'.format(
+                self.calls[name], self.inclusive[name] / 1e6, self.exclusive[name] / 1e6,
+                100 * self.exclusive[name] / total_time, name))
+
+    def write_collapsed_stacks(self, output):
+        """
+        Exclusive time of every call stack in microseconds, in the format flamegraph tools read
+        """
+        for stack, time in sorted(self.stacks.items()):
+            output.out(f'{stack} {time // 1000}')
+
+
+class SamplingProfiler:
+    """
+    Samples the executed instruction and the chain of frames at a fixed interval of CPU time.
+    The VM runs its usual dispatch loop, only the samples cost time
+    """
+
+    max_depth = 1000
+
+    def __init__(self, function_names, source_lines, interval=0.001) -> None:
+        self.function_names = function_names
+        self.source_lines = source_lines
+        self.interval = interval
+        self.samples = 0
+        # samples where function was executing and where it was anywhere in the call stack
+        self.self_samples = defaultdict(int)
+        self.total_samples = defaultdict(int)
+        self.line_samples = defaultdict(int)
+        self.stacks = defaultdict(int)
+        self.vm = None
+        # (sorted instruction indices, values) of function and line starts
+        self.function_starts = ([], [])
+        self.line_starts = ([], [])
+
+    def attach(self, vm):
+        self.vm = vm
+        self.function_starts = self.starts_by_index(vm, self.function_names)
+        self.line_starts = self.starts_by_index(vm, self.source_lines)
+
+    def exec(self, vm):
+        self.attach(vm)
+        if hasattr(signal, 'setitimer'):
+            previous_handler = signal.signal(signal.SIGPROF, self.sample)
+            signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+            try:
+                vm.exec()
+            finally:
+                signal.setitimer(signal.ITIMER_PROF, 0)
+                signal.signal(signal.SIGPROF, previous_handler)
+        else:
+            sampler = threading.Thread(target=self.sample_periodically, daemon=True)
+            sampler.start()
+            try:
+                vm.exec()
+            finally:
+                vm.running = False
+                sampler.join()
+
+    @staticmethod
+    def starts_by_index(vm, values_by_offset):
+        index_by_offset = {offset: i for i, offset in enumerate(vm.code_offsets)}
+        indices, values = [], []
+        for offset, value in sorted(values_by_offset.items()):
+            # offsets of lines can end up inside a superinstruction, those are covered by the previous line
+            if offset in index_by_offset:
+                indices.append(index_by_offset[offset])
+                values.append(value)
+        return indices, values
+
+    def sample_periodically(self):
+        while self.vm.running:
+            sleep(self.interval)
+            self.sample()
+
+    def sample(self, signum=None, frame=None):
+        vm = self.vm
+        # instruction which runs next, unlike the previous one it is always in the function of the current frame
+        ip = vm.ip
+        stack = [self.find(self.function_starts, ip, '<top level>')]
+        self.line_samples[self.find(self.line_starts, ip, None)] += 1
+
+        # frames might be half written when the sample comes in the middle of a call, so the walk is bounded
+        fp = vm.fp
+        while fp != vm.gp and vm.gp < fp <= vm.memory_size and len(stack) < self.max_depth:
+            return_ip = codec.int_unpack_from(vm.memory, fp - 3 * pointer_size)
+            fp = codec.int_unpack_from(vm.memory, fp - 2 * pointer_size)
+            stack.append(self.find(self.function_starts, return_ip - 1, '<top level>'))
+
+        self.samples += 1
+        self.self_samples[stack[0]] += 1
+        for name in set(stack):
+            self.total_samples[name] += 1
+        self.stacks[';'.join(reversed(stack))] += 1
+
+    @staticmethod
+    def find(starts, index, default):
+        indices, values = starts
+        i = bisect_right(indices, index)
+        return values[i - 1] if i > 0 else default
+
+    def report(self, output, top=30):
+        samples = self.samples or 1
+        output.out(f'{self.samples} samples every {self.interval * 1000:g} ms of CPU time\n')
+        output.out('{:>10s} {:>8s} {:>10s} {:>8s}  {:s}'.format('Self', 'Self', 'Total', 'Total', 'Function'))
+        for name in sorted(self.total_samples, key=lambda n: (self.self_samples[n], self.total_samples[n]),
+                           reverse=True):
+            output.out('{:>10d} {:>7.2f}% {:>10d} {:>7.2f}%  {:s}'.format(
+                self.self_samples[name], 100 * self.self_samples[name] / samples,
+                self.total_samples[name], 100 * self.total_samples[name] / samples, name))
+
+        output.out(f'\nTop {top} source lines\n')
+        output.out('{:>10s} {:>8s}  {:s}'.format('Samples', '', 'Line'))
+        for line in sorted(self.line_samples, key=self.line_samples.get, reverse=True)[:top]:
+            location = f'{line[0]}:{line[1]}' if line else '<no line>'
+            count = self.line_samples[line]
+            output.out('{:>10d} {:>7.2f}%  {:s}'.format(count, 100 * count / samples, location))
+
+    def write_collapsed_stacks(self, output):
+        """
+        Sample counts of every call stack, in the format flamegraph tools read
+        """
+        for stack, count in sorted(self.stacks.items()):
+            output.out(f'{stack} {count}')
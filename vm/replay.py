@@ -0,0 +1,131 @@
+import json
+from contextlib import contextmanager
+
+from vm.terminal import TerminalBackend
+
+# events are (instruction count, source, value), sources are the ways a program reads input
+KEYS = 'keys'
+CHAR = 'char'
+LINE = 'line'
+CHARS = 'chars'
+
+
+class InputTap(TerminalBackend):
+    """
+    Passes everything to the terminal of the VM, reads of input go through the input log
+    """
+
+    def __init__(self, terminal, log) -> None:
+        self.terminal = terminal
+        self.log = log
+
+    @contextmanager
+    def session(self):
+        with self.terminal.session():
+            yield
+
+    def clear(self):
+        self.terminal.clear()
+
+    def put(self, x, y, char):
+        self.terminal.put(x, y, char)
+
+    def present(self):
+        self.terminal.present()
+
+    def read_keys(self):
+        return self.log.read(KEYS, self.terminal.read_keys)
+
+    def read_char(self):
+        return self.log.read(CHAR, self.terminal.read_char)
+
+    def read_line(self, limit):
+        return self.log.read(LINE, lambda: self.terminal.read_line(limit))
+
+    def read_chars(self, count):
+        return self.log.read(CHARS, lambda: self.terminal.read_chars(count))
+
+
+class InputLog:
+    """
+    Runs the program counting executed instructions, so every read of input is known by the number of
+    instructions executed up to it. Runs its own dispatch loop like the profilers, VM.exec does not count
+    """
+
+    def __init__(self) -> None:
+        self.executed = 0
+        self.vm = None
+
+    def exec(self, vm):
+        self.vm = vm
+        terminal = vm.terminal
+        vm.terminal = InputTap(terminal, self)
+        instructions = vm.instructions
+        try:
+            with vm.terminal_session():
+                while vm.running:
+                    handler, ops = instructions[vm.ip]
+                    vm.ip += 1
+                    self.executed += 1
+                    handler(*ops)
+        finally:
+            vm.terminal = terminal
+
+    def read(self, source, read):
+        raise NotImplementedError(f'Reading input is not implemented for {self.__class__}')
+
+
+class InputRecorder(InputLog):
+    """
+    Reads input from the terminal and logs every read
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.events = []
+
+    def read(self, source, read):
+        value = read()
+        self.events.append((self.executed, source, value))
+        return value
+
+
+class InputReplayer(InputLog):
+    """
+    Returns logged values instead of reading the terminal. Reads which come at a different instruction count
+    than logged are collected in diverged, the interpreter does not execute the same instructions as in
+    the recorded run, but the program still gets the same input. The replay stops with an error when
+    the program reads from another source than logged, or reads a character past the end of the log.
+    Reads of keys past the end get no keys
+    """
+
+    def __init__(self, events) -> None:
+        super().__init__()
+        self.events = list(events)
+        self.reads = 0
+        # (read number, logged event, instruction count and source of the read)
+        self.diverged = []
+
+    def read(self, source, read):
+        event = self.events[self.reads] if self.reads < len(self.events) else None
+        if event is None or event[0] != self.executed or event[1] != source:
+            self.diverged.append((self.reads, event, (self.executed, source)))
+        self.reads += 1
+
+        if event is None and source == KEYS:
+            return ''
+        if event is None or event[1] != source:
+            self.vm.error(f'Replay diverged from the recorded input at read {self.reads - 1}')
+            return '\0' if source == CHAR else ''
+        return event[2]
+
+
+def write_events(events, output):
+    for instruction, source, value in events:
+        output.out(json.dumps({'instruction': instruction, 'source': source, 'value': value}))
+
+
+def read_events(file):
+    with open(file) as f:
+        return [(event['instruction'], event['source'], event['value'])
+                for event in map(json.loads, filter(str.strip, f))]
@@ -0,0 +1,51 @@
+class Screen:
+    """
+    Characters put on the terminal are collected and written at once when the screen is presented.
+    Only cells which differ from what the terminal already shows are written, runs of adjacent cells
+    in a row share one cursor move
+    """
+
+    def __init__(self, terminal, output) -> None:
+        self.terminal = terminal
+        self.output = output
+        # (x, y) -> character the terminal shows
+        self.shown = {}
+        # (x, y) -> character put since the last present
+        self.pending = {}
+        self.clear_pending = False
+
+    def put(self, x, y, char):
+        self.pending[(x, y)] = char
+
+    def clear(self):
+        self.shown = {}
+        self.pending = {}
+        self.clear_pending = True
+
+    def present(self):
+        if not self.pending and not self.clear_pending:
+            return
+
+        terminal = self.terminal
+        parts = []
+        if self.clear_pending:
+            parts.append(terminal.clear + '\n')
+            self.clear_pending = False
+
+        shown = self.shown
+        changed = sorted((y, x, char) for (x, y), char in self.pending.items() if shown.get((x, y)) != char)
+        self.pending = {}
+
+        if changed:
+            parts.append(terminal.save)
+            next_cell = None
+            for y, x, char in changed:
+                if (x, y) != next_cell:
+                    parts.append(terminal.move_xy(x, y))
+                parts.append(char)
+                shown[(x, y)] = char
+                next_cell = (x + 1, y)
+            parts.append(terminal.restore)
+
+        self.output.write(''.join(parts))
+        self.output.flush()
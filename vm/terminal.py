@@ -0,0 +1,140 @@
+import sys
+from collections import deque
+from contextlib import contextmanager
+
+from vm.keyboard import Keyboard
+from vm.screen import Screen
+
+
+class TerminalBackend:
+    """
+    Screen and keyboard of the program. Characters put on the screen are shown when the screen is presented
+    """
+
+    @contextmanager
+    def session(self):
+        """
+        Terminal state while the program runs
+        """
+        yield
+
+    def clear(self):
+        raise NotImplementedError(f'Clear is not implemented for {self.__class__}')
+
+    def put(self, x, y, char):
+        raise NotImplementedError(f'Put is not implemented for {self.__class__}')
+
+    def present(self):
+        raise NotImplementedError(f'Present is not implemented for {self.__class__}')
+
+    def read_keys(self):
+        """
+        Characters of keys pressed since the last read
+        """
+        raise NotImplementedError(f'Reading keys is not implemented for {self.__class__}')
+
+    def read_char(self):
+        """
+        Next character of stdin, the program waits for it
+        """
+        return sys.stdin.read(1)
+
+    def read_line(self, limit):
+        """
+        Next line of stdin with its line break, at most limit characters
+        """
+        return sys.stdin.readline(limit) if limit > 0 else ''
+
+    def read_chars(self, count):
+        """
+        Next count characters of stdin, fewer when stdin ends
+        """
+        return sys.stdin.read(count) if count > 0 else ''
+
+
+class BlessedTerminal(TerminalBackend):
+    """
+    Terminal the VM runs in, the cursor is hidden while the program runs
+    """
+
+    def __init__(self, output) -> None:
+        # importing and setting up blessed takes a while, headless runs do not pay for it
+        from blessed import Terminal
+
+        self.terminal = Terminal()
+        self.screen = Screen(self.terminal, output)
+        self.keyboard = Keyboard(self.terminal)
+
+    @contextmanager
+    def session(self):
+        with self.terminal.hidden_cursor():
+            try:
+                yield
+            finally:
+                self.keyboard.close()
+
+    def clear(self):
+        self.screen.clear()
+
+    def put(self, x, y, char):
+        self.screen.put(x, y, char)
+
+    def present(self):
+        self.screen.present()
+
+    def read_keys(self):
+        return self.keyboard.read_keys()
+
+
+class HeadlessTerminal(TerminalBackend):
+    """
+    Keeps the screen in memory and returns keys from a script, every read takes the next item of the script.
+    Reads after the script ends return no keys
+    """
+
+    def __init__(self, input_script=()) -> None:
+        # (x, y) -> character
+        self.cells = {}
+        self.input_script = deque(input_script)
+        self.reads = 0
+        # presents which had something to show
+        self.frames = 0
+        self.changed = False
+
+    def clear(self):
+        self.cells = {}
+        self.changed = True
+
+    def put(self, x, y, char):
+        self.cells[(x, y)] = char
+        self.changed = True
+
+    def present(self):
+        if self.changed:
+            self.frames += 1
+            self.changed = False
+
+    def read_keys(self):
+        self.reads += 1
+        return self.input_script.popleft() if self.input_script else ''
+
+    def lines(self):
+        """
+        Rows of the screen from the top, cells which were not put are spaces
+        """
+        if not self.cells:
+            return []
+
+        width = max(x for x, _ in self.cells) + 1
+        rows = [[' '] * width for _ in range(max(y for _, y in self.cells) + 1)]
+        for (x, y), char in self.cells.items():
+            rows[y][x] = char
+        return [''.join(row).rstrip() for row in rows]
+
+
+def read_input_script(file):
+    """
+    Keys returned by every get_input call, one line per call
+    """
+    with open(file) as f:
+        return [line.rstrip('\n') for line in f]
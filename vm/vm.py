@@ -1,41 +1,78 @@
-import sys
-from time import sleep
+import mmap
+import os
+from contextlib import contextmanager
 from typing import Type
-from blessed import Terminal
 
 import utils.bytes_utils as codec
 from models import types
 
-from utils import FasterSwitcher as Switcher, throw, sizes
+from utils import throw, sizes
 from models.instructions import op_code_by_type as op_codes, InstructionType as IType, instructions_by_op_code
-from utils.list_utils import resize
-
-total_memory = 1024 * 1024 * 5
+from vm.clock import clocks
+from vm.decoder import decode
+from vm.files import MappedFiles, mapped_files_start
+from vm.heap import allocators
+from vm.output import OutputBuffer
+from vm.terminal import BlessedTerminal
 
 pointer_size = sizes.int
 
-heap_size = int(total_memory * 0.5)
-stack_size = total_memory - heap_size
+default_stack_size = 1024 * 1024 * 5 // 2
+default_heap_size = 1024 * 1024 * 5 // 2
 
-block_metadata_size = 2 * sizes.int
-heap_end_address = total_memory
+
+def handles(*instr_types):
+    """
+    Marks VM method as a handler of the given instructions
+    """
+    def decorator(fn):
+        fn.handled_instructions = instr_types
+        return fn
+    return decorator
 
 
 class VM:
 
-    def __init__(self, opcodes) -> None:
+    def __init__(self, opcodes, typed_stack=True, allocator='first_fit', stack_size=default_stack_size,
+                 heap_size=default_heap_size, max_heap_size=None, terminal=None,
+                 clock='real') -> None:
         self.running = True
-        self.terminal = Terminal()
+        # code, globals and stack frames are in the first stack_size bytes of memory, heap follows them
+        # and grows up to max_heap_size, or as far as Int addresses reach
+        self.stack_size = stack_size
+        self.heap_size = heap_size
+        self.output = OutputBuffer()
+        # screen and keyboard, a blessed terminal unless another backend is given
+        self.terminal = terminal if terminal is not None else BlessedTerminal(self.output)
+        self.clock = clocks[clock]()
+        self.instructions = []
+        # values pushed above the stack pointer which are not yet written to memory
+        self.values = []
+
+        if not typed_stack:
+            self.push_type = self.push_type_to_memory
+            self.push_bytes = self.push_bytes_to_memory
+            self.push_from_memory = self.push_bytes_from_memory
 
         if len(opcodes) > stack_size:
             VM.print_vm_error('Stack is too small for code to be loaded')
             self.running = False
             return
 
-        self.memory = opcodes.copy()
-        resize(self.memory, total_memory, 0)
+        self.load_code(opcodes)
+
+        # mapped files are above all memory, so the heap stops growing where they start
+        max_heap_size = min(max_heap_size or mapped_files_start, mapped_files_start - stack_size)
+        # pages of anonymous mapping are zeroed and materialized by the OS when they are touched first,
+        # so the whole heap the program may grow to is reserved up front and growing only moves memory_size
+        self.memory = mmap.mmap(-1, stack_size + max(heap_size, max_heap_size),
+                                flags=mmap.MAP_PRIVATE | getattr(mmap, 'MAP_ANONYMOUS', 0)
+                                | getattr(mmap, 'MAP_NORESERVE', 0))
+        # bytes of memory in use by the stack and the heap, addresses from it up are out of bounds
+        self.memory_size = stack_size + heap_size
+        self.memory[:len(opcodes)] = bytes(opcodes)
 
-        # instruction pointer
+        # instruction pointer, index of the next entry in decoded instructions
         self.ip = 0
         # stack frame pointer
         self.fp = len(opcodes)
@@ -43,153 +80,361 @@ class VM:
         self.sp = len(opcodes)
         # global variables pointer
         self.gp = len(opcodes)
-        # heap pointer
-        self.hp = total_memory - heap_size
-        self.init_heap()
+        # mapped files are above all memory, so the heap stops growing where they start
+        self.files = MappedFiles()
+        self.heap = allocators[allocator](self, stack_size, heap_size, max_heap_size)
+        self.heap.init_heap()
+
+    def load_code(self, opcodes):
+        """
+        Decodes instructions once, so the dispatch loop does not touch the bytes of the code segment
+        """
+        decoded = decode(opcodes)
+        self.code_offsets = decoded.offsets
+
+        handlers = {}
+        self.instructions = []
+        for op_code, instr, ops in decoded.entries:
+            handler = handlers.get(op_code)
+            if handler is None:
+                handler = handlers[op_code] = self.op_code_handlers[op_code].__get__(self)
+            self.instructions.append((handler, tuple(ops) if instr is not None else (op_code,)))
+
+    def exec(self, profiler=None):
+        if profiler is not None:
+            profiler.exec(self)
+            return
 
-    def exec(self):
-        with self.terminal.hidden_cursor():
+        instructions = self.instructions
+        with self.terminal_session():
             while self.running:
-                self.exec_one()
-
-    op_codes_actions = Switcher.from_dict({
-        op_codes.get(IType.POP): lambda ctx: ctx.pop_bytes(ctx.read_int()),
-        op_codes.get(IType.POP_PUSH_N): lambda ctx: ctx.pop_push_n(ctx.read_int(), ctx.read_int()),
-        op_codes.get(IType.PUSH_INT): lambda ctx: ctx.push_type(ctx.read_int(), types.Int),
-        op_codes.get(IType.PUSH_FLOAT): lambda ctx: ctx.push_type(ctx.read_float(), types.Float),
-        op_codes.get(IType.PUSH_CHAR): lambda ctx: ctx.push_type(ctx.read_char(), types.Char),
-        op_codes.get(IType.PUSH_BOOL): lambda ctx: ctx.push_type(ctx.read_bool(), types.Bool),
-
-        op_codes.get(IType.ALLOCATE_IN_STACK): lambda ctx: ctx.allocate_in_stack(ctx.read_int()),
-        op_codes.get(IType.SET_GLOBAL):
-            lambda ctx: ctx.set_bytes(ctx.gp + ctx.read_int(), ctx.pop_bytes(ctx.read_int())),
-        op_codes.get(IType.SET_LOCAL):
-            lambda ctx: ctx.set_bytes(ctx.fp + ctx.read_int(), ctx.pop_bytes(ctx.read_int())),
-        op_codes.get(IType.GET_GLOBAL):
-            lambda ctx: ctx.push_bytes(ctx.get_bytes(ctx.gp + ctx.read_int(), ctx.read_int())),
-        op_codes.get(IType.GET_LOCAL):
-            lambda ctx: ctx.push_bytes(ctx.get_bytes(ctx.fp + ctx.read_int(), ctx.read_int())),
-
-        op_codes.get(IType.FN_CALL_BEGIN): lambda ctx: ctx.fn_call_begin(),
-        op_codes.get(IType.FN_CALL): lambda ctx: ctx.fn_call(ctx.read_int(), ctx.read_int()),
-        op_codes.get(IType.RET): lambda ctx: ctx.ret(),
-        op_codes.get(IType.RET_VALUE): lambda ctx: ctx.ret_value(ctx.read_int()),
-        op_codes.get(IType.JZ): lambda ctx: ctx.jump(ctx.read_int(), ctx.pop_type(types.Bool)),
-        op_codes.get(IType.JMP): lambda ctx: ctx.jump(ctx.read_int()),
-
-        op_codes.get(IType.ADD_INT):
-            lambda ctx: ctx.push_type(VM.reverse_binary(
-                lambda x, y: x + y, ctx.pop_type(types.Int), ctx.pop_type(types.Int))),
-        op_codes.get(IType.SUB_INT):
-            lambda ctx: ctx.push_type(VM.reverse_binary(
-                lambda x, y: x - y, ctx.pop_type(types.Int), ctx.pop_type(types.Int))),
-        op_codes.get(IType.MUL_INT):
-            lambda ctx: ctx.push_type(VM.reverse_binary(
-                lambda x, y: x * y, ctx.pop_type(types.Int), ctx.pop_type(types.Int))),
-        op_codes.get(IType.DIV_INT):
-            lambda ctx: ctx.push_type(VM.reverse_binary(
-                lambda x, y: int(x / y), ctx.pop_type(types.Int), ctx.pop_type(types.Int))),
-        op_codes.get(IType.MOD_INT):
-            lambda ctx: ctx.push_type(VM.reverse_binary(
-                lambda x, y: x % y, ctx.pop_type(types.Int), ctx.pop_type(types.Int))),
-        op_codes.get(IType.POW_INT):
-            lambda ctx: ctx.push_type(VM.reverse_binary(
-                lambda x, y: x ** y, ctx.pop_type(types.Int), ctx.pop_type(types.Int))),
-
-        op_codes.get(IType.ADD_FLOAT):
-            lambda ctx: ctx.push_type(VM.reverse_binary(
-                lambda x, y: x + y, ctx.pop_type(types.Float), ctx.pop_type(types.Float))),
-        op_codes.get(IType.SUB_FLOAT):
-            lambda ctx: ctx.push_type(VM.reverse_binary(
-                lambda x, y: x - y, ctx.pop_type(types.Float), ctx.pop_type(types.Float))),
-        op_codes.get(IType.MUL_FLOAT):
-            lambda ctx: ctx.push_type(VM.reverse_binary(
-                lambda x, y: x * y, ctx.pop_type(types.Float), ctx.pop_type(types.Float))),
-        op_codes.get(IType.DIV_FLOAT):
-            lambda ctx: ctx.push_type(VM.reverse_binary(
-                lambda x, y: x / y, ctx.pop_type(types.Float), ctx.pop_type(types.Float))),
-        op_codes.get(IType.MOD_FLOAT):
-            lambda ctx: ctx.push_type(VM.reverse_binary(
-                lambda x, y: x % y, ctx.pop_type(types.Float), ctx.pop_type(types.Float))),
-        op_codes.get(IType.POW_FLOAT):
-            lambda ctx: ctx.push_type(VM.reverse_binary(
-                lambda x, y: x ** y, ctx.pop_type(types.Float), ctx.pop_type(types.Float))),
-
-        op_codes.get(IType.UNARY_PLUS_INT): lambda ctx: (),
-        op_codes.get(IType.UNARY_MINUS_FLOAT): lambda ctx: (),
-        op_codes.get(IType.UNARY_MINUS_INT): lambda ctx: ctx.push_type(-ctx.pop_type(types.Int)),
-        op_codes.get(IType.UNARY_MINUS_FLOAT): lambda ctx: ctx.push_type(-ctx.pop_type(types.Float)),
-
-        op_codes.get(IType.NOT): lambda ctx: ctx.push_type(not ctx.pop_type(types.Bool)),
-        op_codes.get(IType.OR): lambda ctx: ctx.push_type(ctx.pop_type(types.Bool) or ctx.pop_type(types.Bool)),
-        op_codes.get(IType.AND): lambda ctx: ctx.push_type(ctx.pop_type(types.Bool) and ctx.pop_type(types.Bool)),
-        op_codes.get(IType.EQ): lambda ctx: ctx.eq(ctx.read_int()),
-        op_codes.get(IType.NE): lambda ctx: ctx.neq(ctx.read_int()),
-        
-        op_codes.get(IType.GT_INT):
-            lambda ctx: ctx.push_type(VM.reverse_binary(
-                lambda x, y: x > y, ctx.pop_type(types.Int), ctx.pop_type(types.Int))),
-        op_codes.get(IType.GE_INT):
-            lambda ctx: ctx.push_type(VM.reverse_binary(
-                lambda x, y: x >= y, ctx.pop_type(types.Int), ctx.pop_type(types.Int))),
-        op_codes.get(IType.LT_INT):
-            lambda ctx: ctx.push_type(VM.reverse_binary(
-                lambda x, y: x < y, ctx.pop_type(types.Int), ctx.pop_type(types.Int))),
-        op_codes.get(IType.LE_INT):
-            lambda ctx: ctx.push_type(VM.reverse_binary(
-                lambda x, y: x <= y, ctx.pop_type(types.Int), ctx.pop_type(types.Int))),
-
-        op_codes.get(IType.GT_FLOAT):
-            lambda ctx: ctx.push_type(VM.reverse_binary(
-                lambda x, y: x > y, ctx.pop_type(types.Float), ctx.pop_type(types.Float))),
-        op_codes.get(IType.GE_FLOAT):
-            lambda ctx: ctx.push_type(VM.reverse_binary(
-                lambda x, y: x >= y, ctx.pop_type(types.Float), ctx.pop_type(types.Float))),
-        op_codes.get(IType.LT_FLOAT):
-            lambda ctx: ctx.push_type(VM.reverse_binary(
-                lambda x, y: x < y, ctx.pop_type(types.Float), ctx.pop_type(types.Float))),
-        op_codes.get(IType.LE_FLOAT):
-            lambda ctx: ctx.push_type(VM.reverse_binary(
-                lambda x, y: x <= y, ctx.pop_type(types.Float), ctx.pop_type(types.Float))),
-
-        op_codes.get(IType.MEMORY_ALLOCATE): lambda ctx: ctx.memory_allocate(ctx.hp, ctx.pop_type(types.Int)),
-        op_codes.get(IType.MEMORY_FREE):
-            lambda ctx: ctx.memory_free(ctx.pop_type(types.Int) - block_metadata_size),
-        op_codes.get(IType.MEMORY_GET):
-            lambda ctx: ctx.push_bytes(ctx.get_bytes(ctx.pop_type(types.Int), ctx.read_int())),
-        op_codes.get(IType.MEMORY_SET):
-            lambda ctx: ctx.set_bytes(ctx.pop_type(types.Int), ctx.pop_bytes(ctx.read_int())),
-        op_codes.get(IType.MEMORY_SET_PUSH):
-            lambda ctx: ctx.memory_set_push(ctx.pop_type(types.Int), ctx.pop_bytes(ctx.read_int()), ctx.read_int()),
-
-        op_codes.get(IType.FROM_STDIN): lambda ctx: ctx.from_stdin(),
-        op_codes.get(IType.TO_STDOUT_INT): lambda ctx: ctx.to_stdout(types.Int),
-        op_codes.get(IType.TO_STDOUT_FLOAT): lambda ctx: ctx.to_stdout(types.Float),
-        op_codes.get(IType.TO_STDOUT_CHAR): lambda ctx: ctx.to_stdout(types.Char),
-        op_codes.get(IType.TO_STDOUT_BOOL): lambda ctx: ctx.to_stdout(types.Bool),
-        op_codes.get(IType.TO_STDOUT_STRING): lambda ctx: ctx.to_stdout(types.String),
-
-        op_codes.get(IType.CLEAR_SCREEN): lambda ctx: ctx.clear_screen(),
-        op_codes.get(IType.GET_INPUT): lambda ctx: ctx.get_input(ctx.pop_type(types.Int)),
-        op_codes.get(IType.PUT_CHAR_X_Y):
-            lambda ctx: ctx.put_char_x_y(ctx.pop_type(types.Int), ctx.pop_type(types.Int), ctx.pop_type(types.Char)),
-        op_codes.get(IType.SLEEP): lambda ctx: ctx.sleep(ctx.pop_type(types.Int)),
-
-        op_codes.get(IType.EXIT): lambda ctx: ctx.exit()
-    }).default(lambda ctx: ctx.behaviour_not_defined())
+                handler, ops = instructions[self.ip]
+                self.ip += 1
+                handler(*ops)
+
+    @contextmanager
+    def terminal_session(self):
+        """
+        Terminal state while the program runs, characters put on the screen are shown and the keyboard mode
+        is restored even if the VM stops with an error
+        """
+        with self.terminal.session():
+            try:
+                yield
+            finally:
+                self.flush_output()
+
+    def flush_output(self):
+        self.terminal.present()
+        self.output.flush()
 
     def exec_one(self):
-        op_code = self.read_op_code()
-        if instructions_by_op_code.get(op_code) is None:
-            self.op_code_not_defined(op_code)
-        self.op_codes_actions.exec(self, op_code)
+        handler, ops = self.instructions[self.ip]
+        self.ip += 1
+        handler(*ops)
 
+    """
+    Instruction handlers
+    """
+    @handles(IType.POP)
+    def pop(self, size):
+        self.pop_entry(size)
+
+    @handles(IType.PUSH_INT)
+    def push_int(self, value):
+        self.push_type(value, types.Int)
+
+    @handles(IType.PUSH_FLOAT)
+    def push_float(self, value):
+        self.push_type(value, types.Float)
+
+    @handles(IType.PUSH_CHAR)
+    def push_char(self, value):
+        self.push_type(value, types.Char)
+
+    @handles(IType.PUSH_BOOL)
+    def push_bool(self, value):
+        self.push_type(value, types.Bool)
+
+    @handles(IType.SET_GLOBAL)
+    def set_global(self, slot, size):
+        self.pop_to_memory(self.gp + slot, size)
+
+    @handles(IType.SET_LOCAL)
+    def set_local(self, slot, size):
+        self.pop_to_memory(self.fp + slot, size)
+
+    @handles(IType.GET_GLOBAL)
+    def get_global(self, slot, size):
+        self.push_from_memory(self.gp + slot, size)
+
+    @handles(IType.GET_LOCAL)
+    def get_local(self, slot, size):
+        self.push_from_memory(self.fp + slot, size)
+
+    @handles(IType.JZ)
+    def jump_zero(self, target):
+        if not self.pop_type(types.Bool):
+            self.ip = target
+
+    @handles(IType.JNZ)
+    def jump_not_zero(self, target):
+        if self.pop_type(types.Bool):
+            self.ip = target
+
+    @handles(IType.JMP)
+    def jump(self, target):
+        self.ip = target
+
+    @handles(IType.JLT_INT)
+    def jump_less_int(self, target):
+        y = self.pop_type(types.Int)
+        if self.pop_type(types.Int) < y:
+            self.ip = target
+
+    @handles(IType.JLE_INT)
+    def jump_less_equal_int(self, target):
+        y = self.pop_type(types.Int)
+        if self.pop_type(types.Int) <= y:
+            self.ip = target
+
+    @handles(IType.JGT_INT)
+    def jump_greater_int(self, target):
+        y = self.pop_type(types.Int)
+        if self.pop_type(types.Int) > y:
+            self.ip = target
+
+    @handles(IType.JGE_INT)
+    def jump_greater_equal_int(self, target):
+        y = self.pop_type(types.Int)
+        if self.pop_type(types.Int) >= y:
+            self.ip = target
+
+    @handles(IType.JEQ)
+    def jump_equal(self, bytes_len, target):
+        if self.entries_equal(self.pop_entry(bytes_len), self.pop_entry(bytes_len)):
+            self.ip = target
+
+    @handles(IType.JNE)
+    def jump_not_equal(self, bytes_len, target):
+        if not self.entries_equal(self.pop_entry(bytes_len), self.pop_entry(bytes_len)):
+            self.ip = target
+
+    @handles(IType.ADD_INT)
+    def add_int(self):
+        y = self.pop_type(types.Int)
+        self.push_type(codec.wrap_int(self.pop_type(types.Int) + y), types.Int)
+
+    @handles(IType.SUB_INT)
+    def sub_int(self):
+        y = self.pop_type(types.Int)
+        self.push_type(codec.wrap_int(self.pop_type(types.Int) - y), types.Int)
+
+    @handles(IType.MUL_INT)
+    def mul_int(self):
+        y = self.pop_type(types.Int)
+        self.push_type(codec.wrap_int(self.pop_type(types.Int) * y), types.Int)
+
+    @handles(IType.DIV_INT)
+    def div_int(self):
+        y = self.pop_type(types.Int)
+        self.push_type(codec.wrap_int(int(self.pop_type(types.Int) / y)), types.Int)
+
+    @handles(IType.MOD_INT)
+    def mod_int(self):
+        y = self.pop_type(types.Int)
+        self.push_type(codec.wrap_int(self.pop_type(types.Int) % y), types.Int)
+
+    @handles(IType.POW_INT)
+    def pow_int(self):
+        y = self.pop_type(types.Int)
+        self.push_type(codec.wrap_int(int(self.pop_type(types.Int) ** y)), types.Int)
+
+    @handles(IType.ADD_FLOAT)
+    def add_float(self):
+        y = self.pop_type(types.Float)
+        self.push_type(self.pop_type(types.Float) + y, types.Float)
+
+    @handles(IType.SUB_FLOAT)
+    def sub_float(self):
+        y = self.pop_type(types.Float)
+        self.push_type(self.pop_type(types.Float) - y, types.Float)
+
+    @handles(IType.MUL_FLOAT)
+    def mul_float(self):
+        y = self.pop_type(types.Float)
+        self.push_type(self.pop_type(types.Float) * y, types.Float)
+
+    @handles(IType.DIV_FLOAT)
+    def div_float(self):
+        y = self.pop_type(types.Float)
+        self.push_type(self.pop_type(types.Float) / y, types.Float)
+
+    @handles(IType.MOD_FLOAT)
+    def mod_float(self):
+        y = self.pop_type(types.Float)
+        self.push_type(self.pop_type(types.Float) % y, types.Float)
+
+    @handles(IType.POW_FLOAT)
+    def pow_float(self):
+        y = self.pop_type(types.Float)
+        self.push_type(self.pop_type(types.Float) ** y, types.Float)
+
+    @handles(IType.UNARY_PLUS_INT, IType.UNARY_PLUS_FLOAT)
+    def unary_plus(self):
+        pass
+
+    @handles(IType.UNARY_MINUS_INT)
+    def unary_minus_int(self):
+        self.push_type(codec.wrap_int(-self.pop_type(types.Int)), types.Int)
+
+    @handles(IType.UNARY_MINUS_FLOAT)
+    def unary_minus_float(self):
+        self.push_type(-self.pop_type(types.Float), types.Float)
+
+    @handles(IType.NOT)
+    def not_(self):
+        self.push_type(not self.pop_type(types.Bool), types.Bool)
+
+    @handles(IType.OR)
+    def or_(self):
+        y = self.pop_type(types.Bool)
+        self.push_type(self.pop_type(types.Bool) or y, types.Bool)
+
+    @handles(IType.AND)
+    def and_(self):
+        y = self.pop_type(types.Bool)
+        self.push_type(self.pop_type(types.Bool) and y, types.Bool)
+
+    @handles(IType.GT_INT)
+    def gt_int(self):
+        y = self.pop_type(types.Int)
+        self.push_type(self.pop_type(types.Int) > y, types.Bool)
+
+    @handles(IType.GE_INT)
+    def ge_int(self):
+        y = self.pop_type(types.Int)
+        self.push_type(self.pop_type(types.Int) >= y, types.Bool)
+
+    @handles(IType.LT_INT)
+    def lt_int(self):
+        y = self.pop_type(types.Int)
+        self.push_type(self.pop_type(types.Int) < y, types.Bool)
+
+    @handles(IType.LE_INT)
+    def le_int(self):
+        y = self.pop_type(types.Int)
+        self.push_type(self.pop_type(types.Int) <= y, types.Bool)
+
+    @handles(IType.GT_FLOAT)
+    def gt_float(self):
+        y = self.pop_type(types.Float)
+        self.push_type(self.pop_type(types.Float) > y, types.Bool)
+
+    @handles(IType.GE_FLOAT)
+    def ge_float(self):
+        y = self.pop_type(types.Float)
+        self.push_type(self.pop_type(types.Float) >= y, types.Bool)
+
+    @handles(IType.LT_FLOAT)
+    def lt_float(self):
+        y = self.pop_type(types.Float)
+        self.push_type(self.pop_type(types.Float) < y, types.Bool)
+
+    @handles(IType.LE_FLOAT)
+    def le_float(self):
+        y = self.pop_type(types.Float)
+        self.push_type(self.pop_type(types.Float) <= y, types.Bool)
+
+    @handles(IType.MEMORY_ALLOCATE)
+    def allocate(self):
+        address = self.heap.allocate(self.pop_type(types.Int))
+        if address is not None:
+            self.push_type(address, types.Int)
+
+    @handles(IType.MEMORY_FREE)
+    def free(self):
+        address = self.pop_type(types.Int)
+        if address < self.files.start:
+            self.heap.free(address)
+        elif not self.files.unmap(address):
+            self.error(f'Memory at address {address} is not a mapped file')
+
+    @handles(IType.MEMORY_GET)
+    def memory_get(self, size):
+        self.push_from_memory(self.pop_type(types.Int), size)
+
+    @handles(IType.MEMORY_SET)
+    def memory_set(self, size):
+        self.pop_to_memory(self.pop_type(types.Int), size)
+
+    @handles(IType.MEMORY_SET_PUSH)
+    def memory_set_push(self, size, push_times):
+        address = self.pop_type(types.Int)
+        self.pop_to_memory(address, size)
+        for i in range(push_times):
+            self.push_type(address, types.Int)
+
+    @handles(IType.ADD_INT_CONST)
+    def add_int_const(self, value):
+        self.push_type(codec.wrap_int(self.pop_type(types.Int) + value), types.Int)
+
+    @handles(IType.ADD_SCALED_INT)
+    def add_scaled_int(self, scale):
+        index = self.pop_type(types.Int)
+        self.push_type(codec.wrap_int(self.pop_type(types.Int) + codec.wrap_int(index * scale)), types.Int)
+
+    @handles(IType.MEMORY_GET_FIELD)
+    def memory_get_field(self, field_slot, size):
+        self.push_from_memory(codec.wrap_int(self.pop_type(types.Int) + field_slot), size)
+
+    @handles(IType.MEMORY_GET_INDEX)
+    def memory_get_index(self, el_size, size):
+        index = self.pop_type(types.Int)
+        address = codec.wrap_int(self.pop_type(types.Int) + codec.wrap_int(index * el_size))
+        self.push_from_memory(address, size)
+
+    @handles(IType.JZ_LOCAL_LT_INT)
+    def jump_local_not_less_int(self, slot, value, target):
+        if not codec.int_unpack_from(self.memory, self.fp + slot) < value:
+            self.ip = target
+
+    @handles(IType.SET_LOCAL_PUSH)
+    def set_local_push(self, slot, size):
+        entry = self.pop_entry(size)
+        self.entry_to_memory(self.fp + slot, entry)
+        self.push_entry(entry)
+
+    @handles(IType.TO_STDOUT_INT)
+    def to_stdout_int(self):
+        self.to_stdout(types.Int)
+
+    @handles(IType.TO_STDOUT_FLOAT)
+    def to_stdout_float(self):
+        self.to_stdout(types.Float)
+
+    @handles(IType.TO_STDOUT_CHAR)
+    def to_stdout_char(self):
+        self.to_stdout(types.Char)
+
+    @handles(IType.TO_STDOUT_BOOL)
+    def to_stdout_bool(self):
+        self.to_stdout(types.Bool)
+
+    @handles(IType.TO_STDOUT_STRING)
+    def to_stdout_string(self):
+        self.to_stdout(types.String)
+
+    @handles(IType.FN_CALL_BEGIN)
     def fn_call_begin(self):
         self.push_type(0)
         self.push_type(0)
         self.push_type(0)
 
+    @handles(IType.FN_CALL)
     def fn_call(self, target, args_offset):
+        self.flush_values()
+
         new_ip = target
         new_fp = self.sp - args_offset
         new_sp = new_fp
@@ -202,7 +447,10 @@ class VM:
         self.fp = new_fp
         self.sp = new_sp
 
+    @handles(IType.RET)
     def ret(self):
+        self.values.clear()
+
         old_ip = self.get_value(self.fp - 3 * pointer_size, types.Int)
         old_fp = self.get_value(self.fp - 2 * pointer_size, types.Int)
         old_sp = self.get_value(self.fp - 1 * pointer_size, types.Int)
@@ -211,300 +459,336 @@ class VM:
         self.fp = old_fp
         self.sp = old_sp
 
+    @handles(IType.RET_VALUE)
     def ret_value(self, bytes_count):
-        bytes_to_return = self.pop_bytes(bytes_count)
+        entry = self.pop_entry(bytes_count)
         self.ret()
-        self.push_bytes(bytes_to_return)
+        self.push_entry(entry)
 
+    @handles(IType.ALLOCATE_IN_STACK)
     def allocate_in_stack(self, bytes_len):
-        self.sp += bytes_len
-
-    def jump(self, address, conditional_value=False):
-        # Jump zero and simple jump
-        if not conditional_value:
-            self.ip = address
+        self.flush_values()
+        if self.stack_overflow_guard(bytes_len):
+            self.sp += bytes_len
 
+    @handles(IType.POP_PUSH_N)
     def pop_push_n(self, bytes_len, times):
-        bytes_ = self.pop_bytes(bytes_len)
+        entry = self.pop_entry(bytes_len)
         for i in range(times):
-            self.push_bytes(bytes_)
+            self.push_entry(entry)
 
+    @handles(IType.EQ)
     def eq(self, bytes_len):
-        bytes1 = self.pop_bytes(bytes_len)
-        bytes2 = self.pop_bytes(bytes_len)
-        self.push_type(bytes1 == bytes2)
+        self.push_type(self.entries_equal(self.pop_entry(bytes_len), self.pop_entry(bytes_len)), types.Bool)
 
+    @handles(IType.NE)
     def neq(self, bytes_len):
-        bytes1 = self.pop_bytes(bytes_len)
-        bytes2 = self.pop_bytes(bytes_len)
-        self.push_type(bytes1 != bytes2)
+        self.push_type(not self.entries_equal(self.pop_entry(bytes_len), self.pop_entry(bytes_len)), types.Bool)
 
+    def entries_equal(self, entry1, entry2):
+        value1, type1, _ = entry1
+        value2, type2, _ = entry2
+        # floats are compared by their bytes, the same way as the values from memory
+        if type1 is type2 and type1 in (types.Int, types.Char, types.Bool):
+            return value1 == value2
+        return self.entry_bytes(entry1) == self.entry_bytes(entry2)
+
+    @handles(IType.FROM_STDIN)
     def from_stdin(self):
-        self.push_type(sys.stdin.read(1), types.Char)
+        self.flush_output()
+        self.push_type(self.terminal.read_char(), types.Char)
 
     def to_stdout(self, type_: Type[types.Type]):
         if type_ is types.String:
-            address = self.pop_type(types.Int) - sizes.int
-            value_to_print, _ = codec.string_from_bytes(self.memory, address)
+            value_to_print = self.get_string(self.pop_type(types.Int))
         else:
             value_to_print = self.pop_type(type_)
-        print(value_to_print, end='')
-
-    def memory_set_push(self, offset, bytes_, push_times):
-        self.set_bytes(offset, bytes_)
-        for i in range(push_times):
-            self.push_type(offset)
+        self.terminal.present()
+        self.output.write(str(value_to_print))
 
     def op_code_not_defined(self, op_code):
         throw(ValueError('Op code 0x{:x} is not defined'.format(op_code)))
 
-    def behaviour_not_defined(self):
-        self.ip -= sizes.op_code
-        op_code = self.read_op_code()
+    def behaviour_not_defined(self, *ops):
+        op_code, _ = codec.op_code_from_bytes(self.memory, self.code_offsets[self.ip - 1])
         instr = instructions_by_op_code.get(op_code)
         throw(ValueError(f'Behaviour for {instr.type} is not defined'))
 
+    @handles(IType.CLEAR_SCREEN)
     def clear_screen(self):
-        print(self.terminal.clear())
-
-    def get_input(self, buff_addr):
-        chars_read = 0
-
-        char = self.get_symbol()
-        while char:
-            if len(char) != 1:
-                char = self.get_symbol()
-                continue
-
-            self.set_value(buff_addr + chars_read * sizes.char, char, types.Char)
-            char = self.get_symbol()
-            chars_read += 1
-
-        self.push_type(chars_read)
-
-    def put_char_x_y(self, y, x, char):
-        with self.terminal.location(x, y):
-            print(char)
-
-    def sleep(self, ms):
-        sleep(int(ms / 1000))
-
+        self.terminal.clear()
+
+    @handles(IType.GET_INPUT)
+    def get_input(self):
+        self.flush_output()
+        buff_addr = self.pop_type(types.Int)
+        chars = self.terminal.read_keys()
+        self.set_bytes(buff_addr, chars.encode('ascii'))
+        self.push_type(len(chars))
+
+    @handles(IType.READ_LINE)
+    def read_line(self):
+        self.read_to_buffer(self.terminal.read_line)
+
+    @handles(IType.READ_CHARS)
+    def read_chars(self):
+        self.read_to_buffer(self.terminal.read_chars)
+
+    def read_to_buffer(self, read):
+        limit = self.pop_type(types.Int)
+        buff_addr = self.pop_type(types.Int)
+        self.flush_output()
+        text = read(limit)
+        self.set_bytes(buff_addr, text.encode('ascii', errors='replace'))
+        self.push_type(len(text))
+
+    @handles(IType.MAP_FILE)
+    def map_file(self):
+        path = self.get_string(self.pop_type(types.Int))
+        try:
+            self.push_type(self.files.map(path), types.Int)
+        except OSError as e:
+            self.error(f'Can not map file {path}: {e.strerror or e}')
+            self.push_type(0, types.Int)
+
+    @handles(IType.FILE_SIZE)
+    def file_size(self):
+        path = self.get_string(self.pop_type(types.Int))
+        try:
+            self.push_type(os.path.getsize(path), types.Int)
+        except OSError as e:
+            self.error(f'Can not read size of file {path}: {e.strerror or e}')
+            self.push_type(0, types.Int)
+
+    @handles(IType.PUT_CHAR_X_Y)
+    def put_char_x_y(self):
+        y = self.pop_type(types.Int)
+        x = self.pop_type(types.Int)
+        char = self.pop_type(types.Char)
+        self.terminal.put(x, y, char)
+
+    @handles(IType.PRESENT)
+    def present(self):
+        self.terminal.present()
+
+    @handles(IType.SLEEP)
+    def sleep(self):
+        ms = self.pop_type(types.Int)
+        self.flush_output()
+        self.clock.sleep(ms)
+
+    @handles(IType.EXIT)
     def exit(self):
+        self.flush_output()
         self.running = False
 
     """
-    Heap management
+    Operand stack
+
+    Values are kept on the stack as native Python values (value, type, size) entries and are turned into
+    bytes only when they are stored to memory or popped as raw bytes. Entries pushed from memory are kept as
+    raw bytes (bytes, None, size) until they are popped as a typed value. Calls and stack allocations flush
+    all pending entries, so frames and locals always live in memory.
     """
-    def init_heap(self):
-        self.set_block_data_size(self.hp, heap_size - block_metadata_size)
-        self.set_block_next_address(self.hp, heap_end_address)
-
-    def memory_allocate(self, leftmost_free_block, required_data_size):
-        # If leftmost free block address is at the end of the heap - Out of memory
-        if leftmost_free_block == heap_end_address:
-            self.error('Out of heap memory')
-            return
+    def push_type(self, value, type_=None):
+        if type_ is None:
+            type_ = types.find_type(type(value))
+        self.values.append((value, type_, type_.size_in_bytes()))
 
-        # find block with enough space
-        big_enough_block = leftmost_free_block
-        available_memory = self.get_block_data_size(big_enough_block)
-        previous_blocks = [big_enough_block]
-        while available_memory < required_data_size:
-            big_enough_block = self.get_block_next_address(big_enough_block)
-            if big_enough_block == heap_end_address:
-                self.error('Out of heap memory')
-                return
-            available_memory = self.get_block_data_size(big_enough_block)
-            previous_blocks.append(big_enough_block)
-
-        previous_free_block = previous_blocks[-2] if len(previous_blocks) >= 2 else None
-
-        memory_to_allocate = available_memory
-        leftover_block = heap_end_address
-        leftover_block_data_size = 0
-        leftover_block_next_block = self.get_block_next_address(big_enough_block)
-
-        # check if another block can be created from leftover memory
-        leftover_memory = available_memory - required_data_size
-        if leftover_memory > block_metadata_size:
-            leftover_block = big_enough_block + block_metadata_size + required_data_size
-            leftover_block_data_size = leftover_memory - block_metadata_size
-            memory_to_allocate = required_data_size
-
-        # create block from leftover memory
-        if leftover_block != heap_end_address:
-            self.set_block_data_size(leftover_block, leftover_block_data_size)
-            self.set_block_next_address(leftover_block, leftover_block_next_block)
-
-        # find next free block
-        next_free_block = leftover_block
-        if next_free_block == heap_end_address:
-            next_free_block = leftover_block_next_block
-
-        # if there is no previous block, it means we used the first free block
-        if previous_free_block:
-            self.set_block_next_address(previous_free_block, next_free_block)
-
-        # if leftmost block is consumed, move heap pointer
-        if self.hp == big_enough_block:
-            self.hp = next_free_block
-
-        # set the allocated size of the current block
-        self.set_block_data_size(big_enough_block, memory_to_allocate)
-        self.set_block_next_address(big_enough_block, heap_end_address)
-
-        # push address of allocated block data section to the stack
-        self.push_type(big_enough_block + block_metadata_size)
-
-    def memory_free(self, block_address):
-        leftmost_free_block_address = self.hp
-
-        # check if freed block is the leftmost
-        if block_address < leftmost_free_block_address:
-            # check if the last leftmost available block is adjacent from the right to the freed one
-            if self.get_used_block_adjacent_address(block_address) == leftmost_free_block_address:  # [1]
-                self.merge_from_right(block_address, leftmost_free_block_address)
-            else:  # [2]
-                self.set_block_next_address(block_address, leftmost_free_block_address)
-            self.hp = block_address
+    def push_bytes(self, bytes_):
+        self.values.append((bytes_, None, len(bytes_)))
+
+    def push_from_memory(self, address, size):
+        if address >= self.files.start:
+            self.push_from_file(address, size)
+        elif not self.memory_read_guard(address, size):
+            self.push_bytes(bytes(size))
+        # values of int and float sizes can only be of those types, so they are decoded right away
+        elif size == sizes.int:
+            self.values.append((codec.int_unpack_from(self.memory, address), types.Int, size))
+        elif size == sizes.float:
+            self.values.append((codec.float_unpack_from(self.memory, address), types.Float, size))
         else:
-            # find nearest free block from the left
-            free_block_from_left = leftmost_free_block_address
-            while True:
-                address = self.get_block_next_address(free_block_from_left)
-                if address < block_address:
-                    free_block_from_left = address
-                else:
-                    break
-            free_block_from_right = self.get_block_next_address(free_block_from_left)
-
-            if free_block_from_left != heap_end_address \
-                    and self.get_used_block_adjacent_address(free_block_from_left) == block_address:
-                self.merge_from_right(free_block_from_left, block_address)
-                block_address = free_block_from_left
-            elif free_block_from_left != heap_end_address:
-                self.set_block_next_address(free_block_from_left, block_address)
-
-            if free_block_from_right != heap_end_address \
-                    and self.get_used_block_adjacent_address(block_address) == free_block_from_right:
-                self.merge_from_right(block_address, free_block_from_right)
-            elif free_block_from_right != heap_end_address:
-                self.set_block_next_address(block_address, free_block_from_right)
-
-    def merge_from_right(self, block, right_block):
-        right_block_size = self.get_free_block_size(right_block)
-        combined_data_size = self.get_block_data_size(block) + right_block_size
-
-        block_next_address = self.get_block_next_address(block)
-        right_block_next_address = self.get_block_next_address(right_block)
-
-        [lower_address, higher_address] = sorted([block_next_address, right_block_next_address])
-        adjacent_block = block + block_metadata_size + combined_data_size
-
-        if adjacent_block <= lower_address:
-            next_address = lower_address
+            self.values.append((self.get_bytes(address, size), None, size))
+
+    def push_from_file(self, address, size):
+        self.values.append((self.get_file_bytes(address, size), None, size))
+
+    def push_entry(self, entry):
+        value, type_, _ = entry
+        if type_ is None:
+            self.push_bytes(value)
         else:
-            next_address = higher_address
+            self.push_type(value, type_)
 
-        self.set_block_data_size(block, combined_data_size)
-        self.set_block_next_address(block, next_address)
+    def pop_type(self, type_: Type[types.Type]):
+        values = self.values
+        if not values:
+            return self.pop_type_from_memory(type_)
 
-    def get_free_block_size(self, block_address):
-        return self.get_block_data_size(block_address) + block_metadata_size
+        value, value_type, _ = values[-1]
+        if value_type is type_:
+            values.pop()
+            return value
+        return codec.select_unpack_from_func(type_)(self.pop_bytes(type_.size_in_bytes()), 0)
 
-    def get_block_data_size(self, block_address):
-        return self.get_value(block_address, types.Int)
+    def pop_bytes(self, count):
+        values = self.values
+        if not values:
+            return self.pop_bytes_from_memory(count)
+
+        chunks = []
+        while count > 0 and values:
+            entry = values.pop()
+            chunks.append(self.entry_bytes(entry))
+            count -= entry[2]
+
+        if count < 0:
+            # the lowest entry was popped only partly, its remaining bytes stay in the stack
+            lowest = chunks[-1]
+            values.append((lowest[:-count], None, -count))
+            chunks[-1] = lowest[-count:]
+        elif count > 0:
+            chunks.append(self.pop_bytes_from_memory(count))
+
+        if len(chunks) == 1:
+            return chunks[0]
+        return b''.join(reversed(chunks))
+
+    def pop_entry(self, size):
+        values = self.values
+        if values and values[-1][2] == size:
+            return values.pop()
+        return self.pop_bytes(size), None, size
+
+    def pop_to_memory(self, address, size):
+        self.entry_to_memory(address, self.pop_entry(size))
+
+    def entry_to_memory(self, address, entry):
+        value, type_, _ = entry
+        if type_ is None:
+            self.set_bytes(address, value)
+        else:
+            self.set_value(address, value, type_)
 
-    def set_block_data_size(self, block_address, data_size):
-        self.set_value(block_address, data_size)
+    def flush_values(self):
+        if not self.stack_overflow_guard(sum(size for _, _, size in self.values)):
+            return
 
-    def get_used_block_adjacent_address(self, block_address):
-        return block_address + block_metadata_size + self.get_block_data_size(block_address)
+        for value, type_, size in self.values:
+            if type_ is None:
+                self.set_bytes(self.sp, value)
+            else:
+                self.set_value(self.sp, value, type_)
+            self.sp += size
+        self.values.clear()
 
-    def get_free_block_adjacent_address(self, block_address):
-        return block_address + block_metadata_size + self.get_block_data_size(block_address)
+    @staticmethod
+    def entry_bytes(entry):
+        value, type_, size = entry
+        if type_ is None:
+            return value
 
-    def get_block_next_address(self, block_address):
-        return self.get_value(block_address + sizes.int, types.Int)
+        bytes_ = bytearray(size)
+        codec.select_pack_into_func(type_)(bytes_, 0, value)
+        return bytes_
 
-    def set_block_next_address(self, block_address, next_block_address):
-        self.set_value(block_address + sizes.int, next_block_address)
+    def push_type_to_memory(self, value, type_=None):
+        if type_ is None:
+            type_ = types.find_type(type(value))
+        if self.stack_overflow_guard(type_.size_in_bytes()):
+            self.sp += self.set_value(self.sp, value, type_)
 
-    """
-    Helpers
-    """
-    def push_type(self, value, type_=None):
-        bytes_pushed = self.set_value(self.sp, value, type_)
-        self.sp += bytes_pushed
+    def push_bytes_to_memory(self, bytes_):
+        if self.stack_overflow_guard(len(bytes_)):
+            self.set_bytes(self.sp, bytes_)
+            self.sp += len(bytes_)
 
-    def push_bytes(self, bytes_):
-        self.set_bytes(self.sp, bytes_)
-        self.sp += len(bytes_)
+    def push_bytes_from_memory(self, address, size):
+        if address >= self.files.start:
+            self.push_bytes_to_memory(self.get_file_bytes(address, size))
+        else:
+            self.push_bytes_to_memory(self.get_bytes(address, size))
 
-    def pop_bytes(self, count):
+    def pop_bytes_from_memory(self, count):
         self.sp -= count
         return self.get_bytes(self.sp, count)
 
-    def pop_type(self, type_: Type[types.Type]):
+    def pop_type_from_memory(self, type_: Type[types.Type]):
         self.sp -= type_.size_in_bytes()
         return self.get_value(self.sp, type_)
 
-    def read_op_code(self):
-        op_code, self.ip = codec.op_code_from_bytes(self.memory, self.ip)
-        return op_code
-
-    def read_int(self):
-        int_, self.ip = codec.int_from_bytes(self.memory, self.ip)
-        return int_
-
-    def read_float(self):
-        float_, self.ip = codec.float_from_bytes(self.memory, self.ip)
-        return float_
-
-    def read_char(self):
-        char_, self.ip = codec.char_from_bytes(self.memory, self.ip)
-        return char_
-
-    def read_bool(self):
-        bool_, self.ip = codec.bool_from_bytes(self.memory, self.ip)
-        return bool_
+    """
+    Helpers
+    """
 
     def get_value(self, start, type_):
-        val, _ = codec.select_from_bytes_func(type_)(self.memory, start)
-        return val
+        if not self.memory_read_guard(start, type_.size_in_bytes()):
+            return codec.select_unpack_from_func(type_)(bytes(type_.size_in_bytes()), 0)
+        return codec.select_unpack_from_func(type_)(self.memory, start)
+
+    def get_string(self, address):
+        # strings are referenced by the address of their characters, their length is right before them
+        value, _ = codec.string_from_bytes(self.memory, address - sizes.int)
+        return value
+
+    def get_file_bytes(self, address, size):
+        bytes_ = self.files.read(address, size)
+        if bytes_ is None:
+            self.error(f'Trying to read memory at address {address} outside of mapped files')
+            return bytes(size)
+        return bytes_
 
     def get_bytes(self, offset, bytes_len):
+        if not self.memory_read_guard(offset, bytes_len):
+            return bytes(bytes_len)
         return self.memory[offset:offset + bytes_len]
 
     def set_value(self, start, value, type_=None):
         if type_ is None:
             type_ = types.find_type(type(value))
 
-        if self.stack_overflow_guard(type_.size_in_bytes()):
-            bytes_ = codec.select_to_bytes_func(type_)(value)
-            self.set_bytes(start, bytes_)
-            return len(bytes_)
+        size = type_.size_in_bytes()
+        if self.memory_bounds_guard(start, size):
+            codec.select_pack_into_func(type_)(self.memory, start, value)
+            return size
         return 0
 
     def set_bytes(self, offset, bytes_):
-        if offset + len(bytes_) > len(self.memory):
-            self.error(f'Trying to set memory at address {offset} was out of bounds ({len(self.memory) - 1})')
-            return
-
-        for i in range(len(bytes_)):
-            self.memory[offset + i] = bytes_[i]
+        end = offset + len(bytes_)
+        if self.memory_bounds_guard(offset, len(bytes_)):
+            self.memory[offset:end] = bytes_
 
     def error(self, message):
         if self.running:
+            self.flush_output()
             VM.print_vm_error(message)
             self.running = False
 
-    def get_symbol(self):
-        with self.terminal.raw():
-            return self.terminal.inkey(timeout=0)
+    def grow_memory(self, size):
+        """
+        Adds size bytes at the end of memory. The mapping is reserved up to the maximal heap size,
+        so nothing is copied and pages of the added bytes are materialized once they are touched
+        """
+        self.memory_size += size
+
+    def memory_bounds_guard(self, offset, size):
+        if offset + size > self.memory_size:
+            if offset >= self.files.start:
+                self.error(f'Memory at address {offset} is a read-only mapped file')
+                return False
+            self.error(f'Trying to set memory at address {offset} was out of bounds ({self.memory_size - 1})')
+            return False
+        return True
 
-    def stack_overflow_guard(self, offset):
-        if self.ip + offset > stack_size:
+    def memory_read_guard(self, offset, size):
+        if offset + size > self.memory_size:
+            self.error(f'Trying to read memory at address {offset} was out of bounds ({self.memory_size - 1})')
+            return False
+        return True
+
+    def stack_overflow_guard(self, size):
+        if self.sp + size > self.stack_size:
             self.error('Stack overflow')
             return False
         return True
@@ -513,6 +797,19 @@ class VM:
     def print_vm_error(message):
         print(f'VM error: {message}')
 
-    @staticmethod
-    def reverse_binary(op, val1, val2):
-        return op(val2, val1)
+
+def build_op_code_handlers(vm_class):
+    """
+    Dense table indexed by op code. Unknown op codes are mapped to the error handler
+    """
+    handlers = [vm_class.op_code_not_defined] * (1 << (8 * sizes.op_code))
+    for op_code in instructions_by_op_code:
+        handlers[op_code] = vm_class.behaviour_not_defined
+
+    for member in vars(vm_class).values():
+        for instr_type in getattr(member, 'handled_instructions', ()):
+            handlers[op_codes[instr_type]] = member
+    return handlers
+
+
+VM.op_code_handlers = build_op_code_handlers(VM)